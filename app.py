@@ -1,14 +1,52 @@
 import sys
-from PyQt5.QtWidgets import QApplication
+import argparse
 
-from main_window import MainWindow
+from startup_profiler import startup_profiler
 
 def main():
     """ウィンドウの作成"""
-    app = QApplication(sys.argv)
-    window = MainWindow()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--party-view", choices=["docks", "surface"], default="docks",
+                        help="パーティの表示方法 (docks: 左右のドック, surface: 1枚のWidgetに描画)")
+    parser.add_argument("--headless", action="store_true",
+                        help="Qtを使わずに認識結果をJSON Linesで出力する (オプションは headless.py を参照)")
+    parser.add_argument("--source", default="0", help="キャプチャーデバイス番号、または録画した動画ファイル")
+    parser.add_argument("--overlay-port", type=int, default=None,
+                        help="配信オーバーレイ用サーバーを指定ポートで起動する (http://127.0.0.1:<port>/)")
+    parser.add_argument("--startup-report", default=startup_profiler.REPORT_PATH,
+                        help="起動時間の計測結果(JSON)の書き出し先")
+    parser.add_argument("--exit-after-first-frame", action="store_true",
+                        help="最初のフレームを表示したら終了する (起動時間の計測用)")
+    args, other_args = parser.parse_known_args()
+    startup_profiler.report_path = args.startup_report
+
+    # ヘッドレス実行ではQt・OpenGLを読み込まない
+    if args.headless:
+        with startup_profiler.phase("imports"):
+            import headless
+        forwarded = ["--source", args.source]
+        if args.overlay_port is not None:
+            forwarded += ["--overlay-port", str(args.overlay_port)]
+        if args.exit_after_first_frame:
+            forwarded += ["--max-frames", "1"]
+        headless.main(other_args + forwarded)
+        return
+
+    with startup_profiler.phase("imports"):
+        from PyQt5.QtWidgets import QApplication
+        from main_window import MainWindow
+
+    with startup_profiler.phase("qt_init"):
+        app = QApplication(sys.argv[:1] + other_args)
+    if args.exit_after_first_frame:
+        startup_profiler.on_first_frame = app.quit
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    with startup_profiler.phase("main_window"):
+        window = MainWindow(party_view_mode=args.party_view, overlay_port=args.overlay_port, video_source=source)
     window.show()
+    startup_profiler.mark("window_shown")
     sys.exit(app.exec_())
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
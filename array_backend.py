@@ -0,0 +1,59 @@
+import threading
+import importlib.util
+
+import numpy as np
+
+# CuPyは任意(無ければCPUのみで動かす)
+# 読み込みに時間がかかるため起動時には読み込まず、get_cupy() か preload_cupy() のスレッドで読み込む
+CUPY_AVAILABLE = importlib.util.find_spec("cupy") is not None
+cp = None   # 読み込み済みのcupyモジュール(未読み込み・使えなければNone)
+_cupy_lock = threading.Lock()
+
+
+def get_cupy():
+    """
+    CuPyを読み込んで返す(読み込み済みならそれを返す、使えなければNone)
+    """
+    global cp, CUPY_AVAILABLE
+    if cp is None and CUPY_AVAILABLE:
+        with _cupy_lock:
+            if cp is None and CUPY_AVAILABLE:
+                try:
+                    import cupy
+                    cp = cupy
+                except ImportError:
+                    CUPY_AVAILABLE = False
+    return cp
+
+
+def preload_cupy():
+    """
+    CuPyの読み込みを別スレッドで始める(読み込みが終わるまで cp はNone)
+    """
+    if CUPY_AVAILABLE and cp is None:
+        threading.Thread(target=get_cupy, daemon=True).start()
+
+
+def is_gpu_array(array):
+    """
+    CuPy配列かどうか
+    """
+    return cp is not None and isinstance(array, cp.ndarray)
+
+
+def to_numpy(array):
+    """
+    CuPy配列ならCPUへ転送し、それ以外はそのまま返す
+    """
+    if is_gpu_array(array):
+        return cp.asnumpy(array)
+    return array
+
+
+def to_device(array):
+    """
+    CuPyが使えればGPUへ転送する
+    """
+    if get_cupy() is not None:
+        return cp.asarray(array)
+    return np.asarray(array)
@@ -0,0 +1,178 @@
+from collections import namedtuple
+
+import numpy as np
+
+
+"""読み出し結果の情報"""
+ReadInfo = namedtuple("ReadInfo", [
+    "sequence",         # 最後に書き込まれたブロックの通し番号
+    "start_frame",      # 読み出した先頭フレームの通し番号
+    "end_frame",        # 読み出した末尾フレームの次の通し番号
+    "end_time",         # 末尾フレームの時刻(書き込み時のタイムスタンプ基準)
+    "overrun",          # 読み出し中に上書きされたか
+])
+
+
+"""音声データのリングバッファ(書き込み1スレッド用)"""
+class AudioRingBuffer:
+
+    def __init__(self, capacity_frames, channels, sample_rate, max_blocks=1024):
+        """
+        バッファは全て事前に確保し、書き込み時にメモリ確保をしない
+
+        Args:
+        - capacity_frames (int): 保持するフレーム数
+        - channels (int): チャンネル数
+        - sample_rate (int): サンプリングレート
+        - max_blocks (int): 保持するブロック情報の数
+        """
+        self.capacity = int(capacity_frames)
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.data = np.zeros((self.capacity, channels), dtype=np.float32)
+
+        # ブロックごとの情報(通し番号・先頭フレーム・フレーム数・時刻)
+        self.max_blocks = max_blocks
+        self.block_start = np.zeros(max_blocks, dtype=np.int64)
+        self.block_frames = np.zeros(max_blocks, dtype=np.int64)
+        self.block_time = np.zeros(max_blocks, dtype=np.float64)
+
+        # 書き込み位置(これまでに書き込んだ総フレーム数)と総ブロック数
+        # 書き込み側のみが更新する
+        self.write_frame = 0
+        self.sequence = 0
+
+        # 統計
+        self.overrun_count = 0      # 読み出そうとしたデータが既に上書きされていた回数
+        self.dropped_frames = 0     # 容量を超えるブロックで捨てたフレーム数
+
+    def write(self, block, timestamp):
+        """
+        コールバックから呼ぶ。ブロックをバッファにコピーする
+
+        Args:
+        - block (numpy): (frames, channels) の音声データ
+        - timestamp (float): ブロック先頭フレームの時刻
+        """
+        frames = len(block)
+        if frames > self.capacity:
+            self.dropped_frames += frames - self.capacity
+            block = block[frames - self.capacity:]
+            timestamp += (frames - self.capacity) / self.sample_rate
+            frames = self.capacity
+
+        start = self.write_frame % self.capacity
+        first = min(frames, self.capacity - start)
+        np.copyto(self.data[start:start + first], block[:first])
+        if first < frames:
+            np.copyto(self.data[:frames - first], block[first:])
+
+        index = self.sequence % self.max_blocks
+        self.block_start[index] = self.write_frame
+        self.block_frames[index] = frames
+        self.block_time[index] = timestamp
+
+        # データとブロック情報を書いてから位置を進める(読み出し側はこの値を見る)
+        self.write_frame += frames
+        self.sequence += 1
+
+    def available_frames(self):
+        """
+        読み出せるフレーム数
+        """
+        return min(self.write_frame, self.capacity)
+
+    def occupancy(self):
+        """
+        バッファの使用率(0.0-1.0)
+        """
+        return self.available_frames() / self.capacity
+
+    def read_latest(self, seconds=None, frames=None, out=None):
+        """
+        直近のデータを読み出す
+
+        Args:
+        - seconds (float): 読み出す秒数
+        - frames (int): 読み出すフレーム数(secondsより優先)
+        - out (numpy): 書き込み先 (frames, channels) を渡すとメモリ確保しない
+
+        Return:
+        - data (numpy): (frames, channels) 古い順
+        - info (ReadInfo): 読み出し位置・時刻・上書きの有無
+        """
+        end_frame = self.write_frame
+        sequence = self.sequence
+        return self.read_range(end_frame - self._frames(seconds, frames), end_frame, out=out, sequence=sequence)
+
+    def read_range(self, start_frame, end_frame, out=None, sequence=None):
+        """
+        フレームの通し番号 [start_frame, end_frame) を読み出す
+
+        Return:
+        - data (numpy): (frames, channels)
+        - info (ReadInfo)
+        """
+        sequence = self.sequence if sequence is None else sequence
+        start_frame = max(0, start_frame, end_frame - self.capacity)
+        count = max(0, end_frame - start_frame)
+        if out is None:
+            out = np.empty((count, self.channels), dtype=np.float32)
+        else:
+            out = out[:count]
+
+        start = start_frame % self.capacity
+        first = min(count, self.capacity - start)
+        np.copyto(out[:first], self.data[start:start + first])
+        if first < count:
+            np.copyto(out[first:], self.data[:count - first])
+
+        # コピー中に書き込みが追い越していれば先頭側が壊れている
+        overrun = self.write_frame - start_frame > self.capacity
+        if overrun:
+            self.overrun_count += 1
+
+        info = ReadInfo(sequence, start_frame, end_frame, self.frame_time(end_frame), overrun)
+        return out, info
+
+    def frame_time(self, frame):
+        """
+        フレームの通し番号から時刻を求める(保持しているブロック情報から)
+
+        Return:
+        - time (float): 時刻(範囲外の場合は最も近いブロックから外挿、データが無ければNone)
+        """
+        count = min(self.sequence, self.max_blocks)
+        if count == 0:
+            return None
+        last = (self.sequence - 1) % self.max_blocks
+        # 最新ブロックから遡って含むブロックを探す
+        for offset in range(count):
+            index = (last - offset) % self.max_blocks
+            if self.block_start[index] <= frame:
+                return float(self.block_time[index] + (frame - self.block_start[index]) / self.sample_rate)
+        oldest = (last - count + 1) % self.max_blocks
+        return float(self.block_time[oldest] + (frame - self.block_start[oldest]) / self.sample_rate)
+
+    def frame_at(self, timestamp):
+        """
+        時刻からフレームの通し番号を求める(frame_timeの逆)
+
+        Return:
+        - frame (int): 通し番号(データが無ければNone)
+        """
+        count = min(self.sequence, self.max_blocks)
+        if count == 0:
+            return None
+        last = (self.sequence - 1) % self.max_blocks
+        index = last
+        for offset in range(count):
+            index = (last - offset) % self.max_blocks
+            if self.block_time[index] <= timestamp:
+                break
+        return int(self.block_start[index] + round((timestamp - self.block_time[index]) * self.sample_rate))
+
+    def _frames(self, seconds, frames):
+        if frames is None:
+            frames = int(round((seconds or 0.0) * self.sample_rate))
+        return min(int(frames), self.capacity)
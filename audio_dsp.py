@@ -0,0 +1,118 @@
+import math
+
+import numpy as np
+
+
+"""音声コールバック用の処理チェイン(ゲイン・リミッター・ミュート)"""
+class AudioDspChain:
+
+    def __init__(self, max_frames, channels, sample_rate, ramp_ms=20.0, limiter_threshold=0.98, limiter_release_ms=200.0):
+        """
+        作業用のバッファは全てここで確保し、process()ではメモリ確保をしない
+
+        Args:
+        - max_frames (int): 1ブロックの最大フレーム数
+        - channels (int): チャンネル数
+        - sample_rate (int): サンプリングレート
+        - ramp_ms (float): ゲイン変更にかける時間(ms)
+        - limiter_threshold (float): リミッターの上限(1.0 = フルスケール)
+        - limiter_release_ms (float): リミッターが戻るまでの時間(ms)
+        """
+        self.max_frames = max_frames
+        self.channels = channels
+        self.sample_rate = sample_rate
+
+        # ゲイン(現在値と目標値)
+        self.gain = 1.0
+        self.target_gain = 1.0
+        self.is_muted = False
+        self.ramp_step = 1.0 / max(1.0, sample_rate * ramp_ms / 1000.0)   # 1フレームあたりの最大変化量(ゲイン1.0基準)
+
+        # リミッター
+        self.limiter_enabled = True
+        self.limiter_threshold = limiter_threshold
+        self.limiter_gain = 1.0
+        self.limiter_release = 1.0 - math.exp(-1.0 / max(1.0, sample_rate * limiter_release_ms / 1000.0))
+
+        # 作業用バッファ
+        # 列方向のブロードキャストはnumpy内部で一時バッファを確保するため、全てチャンネル数分の幅で持つ
+        self.frame_index = np.repeat(np.arange(1, max_frames + 1, dtype=np.float32)[:, None], channels, axis=1)   # 1, 2, 3, ...
+        self.ramp = np.empty((max_frames, channels), dtype=np.float32)
+        self.scratch = np.empty((max_frames, channels), dtype=np.float32)
+
+    def set_gain(self, gain):
+        """
+        目標ゲインを設定(process内で滑らかに変化する)
+        """
+        self.target_gain = float(gain)
+
+    def set_mute(self, is_muted):
+        """
+        ミュート(ゲイン0へ滑らかに変化する)
+        """
+        self.is_muted = bool(is_muted)
+
+    def process(self, indata, outdata):
+        """
+        indata を処理して outdata に書き込む(その場で計算し一時配列を作らない)
+
+        Args:
+        - indata (numpy): (frames, channels) 入力
+        - outdata (numpy): (frames, channels) 出力
+        """
+        frames = len(indata)
+        target = 0.0 if self.is_muted else self.target_gain
+        start_gain = self.gain
+
+        # ゲイン
+        if self.gain == target:
+            np.multiply(indata, self.gain, out=outdata)
+        else:
+            # 現在値から目標値へ直線で近づける
+            ramp = self.ramp[:frames]
+            step = self.ramp_step if target > self.gain else -self.ramp_step
+            np.multiply(self.frame_index[:frames], step, out=ramp)
+            np.add(ramp, self.gain, out=ramp)
+            if step > 0:
+                np.minimum(ramp, target, out=ramp)
+            else:
+                np.maximum(ramp, target, out=ramp)
+            np.multiply(indata, ramp, out=outdata)
+            self.gain = float(ramp[frames - 1, 0])
+            # float32の丸め誤差で目標値に届かないままにならないようにする
+            if abs(self.gain - target) < 1e-6:
+                self.gain = target
+
+        # リミッター(200%など1.0を超えるゲインの時のみ)
+        if self.limiter_enabled and max(start_gain, self.gain) > 1.0:
+            self._limit(outdata, frames)
+        else:
+            self.limiter_gain = 1.0
+
+    def _limit(self, outdata, frames):
+        """
+        ピークが上限を超えないようにゲインを下げる(アタックは即時、リリースは緩やか)
+        """
+        scratch = self.scratch[:frames]
+        np.abs(outdata, out=scratch)
+        peak = float(scratch.max())
+
+        # リリース: 1.0に向かって戻す
+        released = self.limiter_gain + (1.0 - self.limiter_gain) * (1.0 - (1.0 - self.limiter_release) ** frames)
+        required = self.limiter_threshold / peak if peak > self.limiter_threshold else 1.0
+
+        if required < released:
+            # アタック: ブロック全体に即時適用してピークを抑える
+            self.limiter_gain = required
+            np.multiply(outdata, required, out=outdata)
+        elif released < 1.0 or self.limiter_gain < 1.0:
+            # 前回のゲインから戻り値までを直線で補間してクリックを防ぐ
+            ramp = self.ramp[:frames]
+            np.multiply(self.frame_index[:frames], (released - self.limiter_gain) / frames, out=ramp)
+            np.add(ramp, self.limiter_gain, out=ramp)
+            np.multiply(outdata, ramp, out=outdata)
+            self.limiter_gain = released
+
+        # 念のため範囲外をクリップ
+        np.minimum(outdata, 1.0, out=outdata)
+        np.maximum(outdata, -1.0, out=outdata)
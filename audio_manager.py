@@ -1,17 +1,34 @@
-import queue
+import os
+import time
+import wave
+import threading
+
+import numpy as np
 import sounddevice as sd
 
 from PyQt5.QtCore import QObject, pyqtSignal
 
+from audio_buffer import AudioRingBuffer
+from audio_dsp import AudioDspChain
+from audio_stats import AudioStreamStats
+from event_bus import event_bus, AudioCueDetected, CaptureError
+from media_clock import AVSyncEstimator, audio_block_time
+import media_clock
+from scene_recognizer import SceneRecognizer, GameScene
+
 class AudioManager(QObject):
     error_signal = pyqtSignal(Exception)
+    # 最後に停止したストリームの計測値の保存先
+    HEALTH_PATH = "./data/cache/audio_health.json"
 
-    def __init__(self, sample_rate=48000, channels=2, buffer_size=1024):
+    def __init__(self, sample_rate=48000, channels=2, buffer_size=1024, ring_seconds=10.0, latency='low'):
         """      
         Args:
             sample_rate (int): サンプリングレート
             channels (int): チャンネル数
             buffer_size (int): バッファサイズ
+            ring_seconds (float): リングバッファに保持する秒数
+            latency (str or float): ストリームのレイテンシ設定('low', 'high' または秒数)
         """
         super().__init__()
         # デバイス設定の最適化
@@ -23,10 +40,27 @@ class AudioManager(QObject):
         self.sample_rate = sample_rate
         self.channels = channels
         self.buffer_size = buffer_size
+        self.latency = latency
         self.volume = 1.0
         
-        # 音声データキュー
-        self.audio_queue = queue.Queue(maxsize=5) 
+        # コールバックの処理時間・アンダーフロー等の計測
+        self.stats = AudioStreamStats(sample_rate, buffer_size)
+        
+        # 音量・リミッター・ミュート(コールバック内でメモリ確保しないよう事前に確保)
+        self.dsp = AudioDspChain(buffer_size, channels, sample_rate)
+        
+        # 音声データのリングバッファ(コールバックでメモリ確保しないよう事前に確保)
+        self.ring_buffer = AudioRingBuffer(int(sample_rate * ring_seconds), channels, sample_rate)
+        
+        # 映像とのずれの推定(音声の検出と映像のシーン遷移の時刻を比べる)
+        self.av_sync = AVSyncEstimator()
+        event_bus.add_sink(self.av_sync)
+        
+        # 効果音・ジングルによるシーン遷移の裏付け(参照音声が無ければ動かさない)
+        self.cue_detector = AudioCueDetector(sample_rate)
+        self.cue_detector.load_directory()
+        self.cue_stop = threading.Event()
+        self.cue_thread = None
         
         # パフォーマンスチューニングフラグ
         self.is_running = False
@@ -123,18 +157,19 @@ class AudioManager(QObject):
             """
             ゼロコピーのリアルタイムコールバック
             """
-            # デバッグ用ステータス表示
-            if status:
-                print(f"オーディオステータス: {status}")
+            callback_start = time.perf_counter()
+            block_time = audio_block_time(time_info, frames, self.sample_rate, media_clock.now())
             
-            # 音量調節
-            outdata[:] = indata * self.volume
+            # 音量調節(outdataに直接書き込む)
+            for start in range(0, frames, self.dsp.max_frames):
+                end = min(frames, start + self.dsp.max_frames)
+                self.dsp.process(indata[start:end], outdata[start:end])
             
-            # キューに追加
-            try:
-                self.audio_queue.put_nowait(indata.copy())
-            except queue.Full:
-                pass  # キューがいっぱいの場合は最新データを破棄
+            # リングバッファに追加(古いデータから上書き)
+            self.ring_buffer.write(indata, block_time)
+            
+            # 処理時間・ステータスの記録
+            self.stats.record(frames, status, callback_start, time.perf_counter())
 
         try:
             # ストリーム設定
@@ -145,12 +180,15 @@ class AudioManager(QObject):
                 dtype='float32',
                 callback=audio_callback,
                 blocksize=self.buffer_size,
-                latency='low'  # 最低レイテンシモード
+                latency=self.latency  # 既定は最低レイテンシモード
             )
             
             # ストリーム開始
+            self.stats.reset()
             self.stream.start()
+            self.stats.latency = tuple(self.stream.latency)
             self.is_running = True
+            self.start_cue_detection()
         
         except Exception as e:
             e.args = ("オーディオストリーム初期化エラー: " + e.args[0],)
@@ -163,17 +201,340 @@ class AudioManager(QObject):
         self.stop()
         self.start(input_device=input_device, output_device=output_device)
 
+    def read_latest(self, seconds, out=None):
+        """
+        直近の入力音声を読み出す
+
+        Args:
+            seconds (float): 読み出す秒数
+            out (numpy): 書き込み先(渡すとメモリ確保しない)
+
+        Return:
+            data (numpy): (フレーム数, チャンネル数) 古い順
+            info (ReadInfo): 通し番号・時刻・上書きの有無
+        """
+        return self.ring_buffer.read_latest(seconds=seconds, out=out)
+
+    def audio_for_frame(self, frame_time, duration=1 / 60, out=None):
+        """
+        映像フレームに対応する入力音声を読み出す(推定した映像とのずれを補正)
+
+        Args:
+            frame_time (float): フレームの時刻(VideoCapture.frame_time)
+            duration (float): 読み出す秒数
+            out (numpy): 書き込み先(渡すとメモリ確保しない)
+
+        Return:
+            data (numpy): (フレーム数, チャンネル数)  音声が無ければNone
+            info (ReadInfo)
+        """
+        return self.av_sync.audio_span(self.ring_buffer, frame_time, duration, out=out)
+
+    def stream_health(self):
+        """
+        ストリームの計測値(コールバック処理時間の分布・アンダーフロー回数・レイテンシ・リングバッファ使用率)
+
+        Return:
+            stats (dict)
+        """
+        return self.stats.snapshot(self.ring_buffer)
+
+    def stream_health_summary(self):
+        """
+        ストリームの計測値を表示用の文字列で返す
+        """
+        return self.stats.summary(self.ring_buffer)
+
     def set_volume(self, vol):
         """
         MainWindowからのボリューム設定用
         """
         self.volume = 1.0 * vol / 100.0
+        self.dsp.set_gain(self.volume)
+
+    def set_mute(self, is_muted):
+        """
+        MainWindowからのミュート設定用
+        """
+        self.dsp.set_mute(is_muted)
+
+    def start_cue_detection(self):
+        """
+        効果音・ジングルの検出スレッドを開始
+        """
+        if not self.cue_detector.cues or self.cue_thread is not None:
+            return
+        self.cue_stop.clear()
+        self.cue_thread = threading.Thread(target=self._cue_loop, daemon=True)
+        self.cue_thread.start()
+
+    def stop_cue_detection(self):
+        """
+        効果音・ジングルの検出スレッドを停止
+        """
+        if self.cue_thread is None:
+            return
+        self.cue_stop.set()
+        self.cue_thread.join(timeout=1.0)
+        self.cue_thread = None
+
+    def _cue_loop(self):
+        """
+        一定間隔でリングバッファを解析し、検出したシーンをSceneRecognizerに通知する
+        """
+        interval = self.cue_detector.hop / self.cue_detector.analysis_rate
+        while not self.cue_stop.wait(interval):
+            try:
+                detections = self.cue_detector.update(self.ring_buffer)
+            except Exception as e:
+                event_bus.publish(CaptureError("audio_cue", "効果音検出エラー: " + str(e)))
+                continue
+            for name, scene, confidence, cue_time in detections:
+                SceneRecognizer.add_audio_hint(scene, confidence)
+                event_bus.publish(AudioCueDetected(name, scene.value, confidence, audio_time=cue_time))
 
     def stop(self):
         """
         オーディオストリームを停止
         """
+        self.stop_cue_detection()
         if hasattr(self, 'stream'):
+            if self.stats.callback_count:
+                self.stats.dump(self.HEALTH_PATH, self.ring_buffer)
             self.stream.stop()
             self.stream.close()
-        self.is_running = False
\ No newline at end of file
+        self.is_running = False
+
+"""効果音・ジングルの検出クラス"""
+class AudioCueDetector:
+    # 参照音声の置き場所 (ファイル名はGameSceneの値、同じシーンが複数ある場合は "VERSUS-2.wav" のように付ける)
+    CUE_DIR = "./data/audio_cues"
+
+    def __init__(self, sample_rate=48000, analysis_rate=8000, hop_seconds=0.25, max_cue_seconds=2.0,
+                 min_confidence=0.6, cpu_budget=0.02):
+        """
+        入力音声をモノラル・低サンプリングレートに落とし、一定長の窓ごとに
+        全ての参照音声との正規化相互相関をFFTでまとめて計算する
+
+        Args:
+            sample_rate (int): 入力音声のサンプリングレート
+            analysis_rate (int): 解析用のサンプリングレート(sample_rateの約数)
+            hop_seconds (float): 解析の間隔(秒)
+            max_cue_seconds (float): 参照音声の最大長(秒) これより長い部分は切り捨てる
+            min_confidence (float): 検出とみなす相関の最小値
+            cpu_budget (float): 1秒あたりに解析へ使ってよい時間(秒)
+        """
+        self.sample_rate = sample_rate
+        self.decimation = max(1, sample_rate // analysis_rate)
+        self.analysis_rate = sample_rate / self.decimation
+        self.hop = int(round(hop_seconds * self.analysis_rate))
+        self.max_cue_length = int(round(max_cue_seconds * self.analysis_rate))
+        self.min_confidence = min_confidence
+        self.cpu_budget = cpu_budget
+
+        # 参照音声 (name, scene, 長さ) と FFT済みの参照 (cues, fft_size//2+1)
+        self.cues = []
+        self.cue_spectra = None
+        self.window_length = 0
+        self.fft_size = 0
+
+        # 同じ音声を続けて検出しないための最終検出時刻
+        self.last_detected = {}
+
+        # CPU時間の予算(トークンバケット) 解析が重ければ間引く
+        self.budget = cpu_budget
+        self.last_update = None
+        self.skipped_count = 0
+        self.analysis_count = 0
+
+    def load_directory(self, cue_dir=None):
+        """
+        ディレクトリ内のWAVファイルを参照音声として読み込む(無ければ何もしない)
+
+        Return:
+            count (int): 読み込んだ参照音声の数
+        """
+        cue_dir = self.CUE_DIR if cue_dir is None else cue_dir
+        if not os.path.isdir(cue_dir):
+            return 0
+        scenes = {scene.value: scene for scene in GameScene}
+        for file_name in sorted(os.listdir(cue_dir)):
+            stem, ext = os.path.splitext(file_name)
+            scene = scenes.get(stem.split("-")[0].upper())
+            if ext.lower() != ".wav" or scene is None:
+                continue
+            samples, rate = self.read_wav(os.path.join(cue_dir, file_name))
+            self.add_cue(stem, scene, samples, rate)
+        return len(self.cues)
+
+    @staticmethod
+    def read_wav(path):
+        """
+        WAVファイル(8/16/32bit PCM)をモノラルのfloat32で読み込む
+
+        Return:
+            samples (numpy): (frames,) -1.0~1.0
+            sample_rate (int): サンプリングレート
+        """
+        with wave.open(path, "rb") as f:
+            channels = f.getnchannels()
+            width = f.getsampwidth()
+            rate = f.getframerate()
+            raw = f.readframes(f.getnframes())
+        if width == 1:
+            samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+        elif width == 2:
+            samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+        elif width == 4:
+            samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+        else:
+            raise ValueError(f"未対応のWAV形式です: {path}")
+        return samples.reshape(-1, channels).mean(axis=1), rate
+
+    def add_cue(self, name, scene, samples, rate):
+        """
+        参照音声を追加する
+
+        Args:
+            name (str): 参照音声の名前
+            scene (GameScene): 検出時に通知するシーン
+            samples (numpy): (frames,) or (frames, channels) の音声
+            rate (int): samplesのサンプリングレート
+        """
+        cue = self._prepare(samples, rate)[:self.max_cue_length]
+        cue = cue - cue.mean()
+        norm = np.linalg.norm(cue)
+        if len(cue) < self.hop or norm == 0:
+            raise ValueError(f"参照音声が短すぎるか無音です: {name}")
+        self.cues.append((name, scene, cue / norm))
+        self._build_spectra()
+
+    def _build_spectra(self):
+        """
+        窓の長さとFFTサイズを決め、全参照音声のFFTを1つの配列にまとめる
+        """
+        longest = max(len(cue) for _, _, cue in self.cues)
+        self.window_length = longest + self.hop
+        self.fft_size = 1 << (self.window_length + longest - 1).bit_length()
+        spectra = np.empty((len(self.cues), self.fft_size // 2 + 1), dtype=np.complex64)
+        for i, (_, _, cue) in enumerate(self.cues):
+            spectra[i] = np.conj(np.fft.rfft(cue, self.fft_size))
+        self.cue_spectra = spectra
+
+    def _prepare(self, samples, rate):
+        """
+        モノラル化して解析用のサンプリングレートに落とす(平均による間引き)
+        """
+        samples = np.asarray(samples, dtype=np.float32)
+        if samples.ndim == 2:
+            samples = samples.mean(axis=1)
+        decimation = max(1, int(round(rate / self.analysis_rate)))
+        usable = len(samples) - len(samples) % decimation
+        return samples[:usable].reshape(-1, decimation).mean(axis=1)
+
+    def window_frames(self):
+        """
+        1回の解析に必要な入力音声のフレーム数(入力サンプリングレート)
+        """
+        return self.window_length * self.decimation
+
+    def analyze(self, window):
+        """
+        1窓分の相関を計算する
+
+        Args:
+            window (numpy): (window_length,) 解析用サンプリングレートのモノラル音声
+
+        Return:
+            confidences (numpy): (cues,) 各参照音声との正規化相互相関の最大値
+            offsets (numpy): (cues,) 最大となった位置(窓の先頭からのサンプル数)
+        """
+        window = window - window.mean()
+        correlation = np.fft.irfft(np.fft.rfft(window, self.fft_size)[None, :] * self.cue_spectra, self.fft_size)
+
+        # 窓内の各位置のエネルギー(参照音声の長さごと)
+        energy = np.concatenate(([0.0], np.cumsum(window.astype(np.float64) ** 2)))
+        confidences = np.zeros(len(self.cues), dtype=np.float32)
+        offsets = np.zeros(len(self.cues), dtype=np.int64)
+        for i, (_, _, cue) in enumerate(self.cues):
+            lags = len(window) - len(cue) + 1
+            norms = np.sqrt(np.maximum(energy[len(cue):len(cue) + lags] - energy[:lags], 1e-12))
+            scores = correlation[i, :lags] / norms
+            offsets[i] = int(np.argmax(scores))
+            confidences[i] = scores[offsets[i]]
+        return confidences, offsets
+
+    def update(self, ring_buffer, now=None):
+        """
+        リングバッファの直近の音声を解析する(一定間隔で呼ぶ)
+        予算を超えている場合は解析を飛ばす
+
+        Args:
+            ring_buffer (AudioRingBuffer): 入力音声
+            now (float): 現在時刻(time.monotonic)
+
+        Return:
+            detections[] (tuple): (name, scene, confidence, time) 検出した参照音声
+        """
+        now = time.monotonic() if now is None else now
+        if not self.cues or ring_buffer.available_frames() < self.window_frames():
+            return []
+
+        # 経過時間に応じて予算を補充する(最大1秒分)
+        if self.last_update is not None:
+            self.budget = min(self.cpu_budget, self.budget + (now - self.last_update) * self.cpu_budget)
+        self.last_update = now
+        if self.budget <= 0:
+            self.skipped_count += 1
+            return []
+
+        start = time.perf_counter()
+        samples, info = ring_buffer.read_latest(frames=self.window_frames())
+        window = self._prepare(samples, self.sample_rate)
+        detections = self._detect(window, info.end_time)
+        self.budget -= time.perf_counter() - start
+        self.analysis_count += 1
+        return detections
+
+    def scan(self, samples, rate):
+        """
+        録音済みの音声全体を解析する(WAVファイルでのオフライン確認用)
+
+        Args:
+            samples (numpy): (frames,) or (frames, channels) の音声
+            rate (int): サンプリングレート
+
+        Return:
+            detections[] (tuple): (name, scene, confidence, time) timeは音声先頭からの秒数
+        """
+        if not self.cues:
+            return []
+        signal = self._prepare(samples, rate)
+        self.last_detected = {}
+        detections = []
+        for end in range(self.window_length, len(signal) + 1, self.hop):
+            detections.extend(self._detect(signal[end - self.window_length:end], end / self.analysis_rate))
+        return detections
+
+    def _detect(self, window, end_time):
+        """
+        Args:
+            window (numpy): 解析用の窓
+            end_time (float): 窓の末尾の時刻
+
+        Return:
+            detections[] (tuple): (name, scene, confidence, time) timeは参照音声の先頭の時刻
+        """
+        confidences, offsets = self.analyze(window)
+        detections = []
+        for i, (name, scene, cue) in enumerate(self.cues):
+            if confidences[i] < self.min_confidence:
+                continue
+            cue_start = end_time - (len(window) - offsets[i]) / self.analysis_rate
+            # 同じ音声は参照音声の長さ以内なら1回とみなす
+            last = self.last_detected.get(name)
+            if last is not None and cue_start - last < len(cue) / self.analysis_rate:
+                continue
+            self.last_detected[name] = cue_start
+            detections.append((name, scene, float(confidences[i]), float(cue_start)))
+        return detections
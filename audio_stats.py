@@ -0,0 +1,171 @@
+import os
+import json
+import time
+
+import numpy as np
+
+
+"""音声ストリームの動作状況の計測クラス"""
+class AudioStreamStats:
+    # コールバック処理時間のヒストグラム(ブロック周期に対する割合)
+    BIN_WIDTH = 0.05        # 5%刻み
+    BIN_COUNT = 41          # 0%-200% + それ以上
+
+    def __init__(self, sample_rate, block_size):
+        """
+        コールバック内で呼ぶ record() はメモリ確保をしない
+
+        Args:
+            sample_rate (int): サンプリングレート
+            block_size (int): ブロックサイズ(フレーム数)
+        """
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.histogram = np.zeros(self.BIN_COUNT, dtype=np.int64)
+        self.reset()
+
+    def reset(self):
+        """
+        計測値を初期化(ストリームを開き直した時など)
+        """
+        self.histogram[:] = 0
+        self.callback_count = 0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+        self.late_count = 0             # 処理時間がブロック周期を超えた回数
+        self.max_interval = 0.0         # コールバック呼び出し間隔の最大値
+        self.last_callback = None
+        self.frame_mismatch_count = 0   # block_sizeと異なるフレーム数で呼ばれた回数
+
+        # PortAudioが報告するステータス
+        self.input_underflow = 0
+        self.input_overflow = 0
+        self.output_underflow = 0
+        self.output_overflow = 0
+        self.priming_output = 0
+
+        self.latency = None             # (入力, 出力) ストリームが報告するレイテンシ(秒)
+        self.started_at = time.monotonic()
+
+    def block_period(self, frames=None):
+        """
+        1ブロックの周期(秒)
+        """
+        return (self.block_size if frames is None else frames) / self.sample_rate
+
+    def record(self, frames, status, start, end):
+        """
+        コールバック1回分を記録する(コールバックの最後で呼ぶ)
+
+        Args:
+            frames (int): フレーム数
+            status (CallbackFlags): コールバックに渡されたステータス
+            start (float): コールバック開始時刻(perf_counter)
+            end (float): コールバック終了時刻(perf_counter)
+        """
+        duration = end - start
+        period = self.block_period(frames)
+        self.callback_count += 1
+        self.total_duration += duration
+        if duration > self.max_duration:
+            self.max_duration = duration
+        if duration > period:
+            self.late_count += 1
+        if frames != self.block_size:
+            self.frame_mismatch_count += 1
+
+        index = int(duration / period / self.BIN_WIDTH)
+        self.histogram[index if index < self.BIN_COUNT - 1 else self.BIN_COUNT - 1] += 1
+
+        if self.last_callback is not None and start - self.last_callback > self.max_interval:
+            self.max_interval = start - self.last_callback
+        self.last_callback = start
+
+        if status:
+            self.input_underflow += status.input_underflow
+            self.input_overflow += status.input_overflow
+            self.output_underflow += status.output_underflow
+            self.output_overflow += status.output_overflow
+            self.priming_output += status.priming_output
+
+    def snapshot(self, ring_buffer=None):
+        """
+        現在の計測値(GUIスレッドなどから呼ぶ)
+
+        Args:
+            ring_buffer (AudioRingBuffer): 使用率・上書き回数も含める場合に渡す
+
+        Return:
+            stats (dict)
+        """
+        count = max(1, self.callback_count)
+        period = self.block_period()
+        histogram = self.histogram.copy()
+        stats = {
+            'sample_rate': self.sample_rate,
+            'block_size': self.block_size,
+            'block_period_ms': period * 1000,
+            'uptime_s': time.monotonic() - self.started_at,
+            'callbacks': self.callback_count,
+            'mean_callback_ms': self.total_duration / count * 1000,
+            'max_callback_ms': self.max_duration * 1000,
+            'p99_load': self._percentile(histogram, 0.99),
+            'late_callbacks': self.late_count,
+            'max_interval_ms': self.max_interval * 1000,
+            'frame_mismatch': self.frame_mismatch_count,
+            'input_underflow': self.input_underflow,
+            'input_overflow': self.input_overflow,
+            'output_underflow': self.output_underflow,
+            'output_overflow': self.output_overflow,
+            'priming_output': self.priming_output,
+            'latency_ms': None if self.latency is None else [value * 1000 for value in self.latency],
+            'load_histogram': {
+                f"{i * self.BIN_WIDTH:.2f}": int(n) for i, n in enumerate(histogram) if n
+            },
+        }
+        if ring_buffer is not None:
+            stats['ring_occupancy'] = ring_buffer.occupancy()
+            stats['ring_overruns'] = ring_buffer.overrun_count
+            stats['ring_dropped_frames'] = ring_buffer.dropped_frames
+        return stats
+
+    def _percentile(self, histogram, q):
+        """
+        ヒストグラムからブロック周期に対する処理時間の割合のパーセンタイルを求める(ビンの上端)
+        """
+        total = histogram.sum()
+        if total == 0:
+            return 0.0
+        index = int(np.searchsorted(np.cumsum(histogram), q * total))
+        return (index + 1) * self.BIN_WIDTH
+
+    def summary(self, ring_buffer=None):
+        """
+        計測値を読みやすい文字列にする
+
+        Return:
+            text (str)
+        """
+        stats = self.snapshot(ring_buffer)
+        latency = stats['latency_ms']
+        lines = [
+            f"ブロック: {stats['block_size']} フレーム / {stats['sample_rate']} Hz (周期 {stats['block_period_ms']:.2f} ms)",
+            f"レイテンシ: " + ("不明" if latency is None else f"入力 {latency[0]:.1f} ms / 出力 {latency[1]:.1f} ms"),
+            f"コールバック: {stats['callbacks']} 回 平均 {stats['mean_callback_ms']:.3f} ms 最大 {stats['max_callback_ms']:.3f} ms"
+            f" (p99 負荷 {stats['p99_load'] * 100:.0f}%以下, 周期超過 {stats['late_callbacks']} 回)",
+            f"呼び出し間隔の最大: {stats['max_interval_ms']:.2f} ms",
+            f"入力 アンダーフロー {stats['input_underflow']} / オーバーフロー {stats['input_overflow']}",
+            f"出力 アンダーフロー {stats['output_underflow']} / オーバーフロー {stats['output_overflow']}",
+        ]
+        if ring_buffer is not None:
+            lines.append(f"リングバッファ: 使用率 {stats['ring_occupancy'] * 100:.0f}% 上書き {stats['ring_overruns']} 回")
+        lines.append("負荷分布: " + " ".join(f"{key}:{value}" for key, value in stats['load_histogram'].items()))
+        return "\n".join(lines)
+
+    def dump(self, path, ring_buffer=None):
+        """
+        計測値をJSONで保存する(機材ごとの設定比較用)
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(ring_buffer), f, ensure_ascii=False, indent=2)
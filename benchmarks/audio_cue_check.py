@@ -0,0 +1,52 @@
+"""
+効果音・ジングル検出(AudioCueDetector)のオフライン確認
+
+録音したWAVファイルを参照音声と照合し、検出したシーン・時刻と
+音声1秒あたりの解析時間(CPU負荷)を表示する
+
+使い方:
+    python benchmarks/audio_cue_check.py recordings/match01.wav --cue-dir data/audio_cues
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+from audio_manager import AudioCueDetector
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AudioCueDetector offline check")
+    parser.add_argument("recordings", nargs="+", help="確認するWAVファイル")
+    parser.add_argument("--cue-dir", default=AudioCueDetector.CUE_DIR)
+    parser.add_argument("--min-confidence", type=float, default=0.6)
+    parser.add_argument("--hop", type=float, default=0.25, help="解析の間隔(秒)")
+    args = parser.parse_args()
+
+    detector = AudioCueDetector(hop_seconds=args.hop, min_confidence=args.min_confidence)
+    if detector.load_directory(args.cue_dir) == 0:
+        print(f"参照音声がありません: {args.cue_dir}")
+        sys.exit(1)
+
+    for path in args.recordings:
+        samples, rate = detector.read_wav(path)
+        start = time.perf_counter()
+        detections = detector.scan(samples, rate)
+        elapsed = time.perf_counter() - start
+        duration = len(samples) / rate
+
+        for name, scene, confidence, at in detections:
+            print(json.dumps({'file': path, 'cue': name, 'scene': scene.value,
+                              'confidence': round(confidence, 3), 'time': round(at, 3)}, ensure_ascii=False))
+        # scan()は全ての窓を解析するため、実際の update() はこれに cpu_budget の上限がかかる
+        print(json.dumps({'file': path, 'duration_s': round(duration, 2), 'windows': len(range(detector.window_length, int(duration * detector.analysis_rate) + 1, detector.hop)),
+                          'cpu_ms_per_s': round(elapsed * 1000 / max(duration, 1e-9), 3)}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
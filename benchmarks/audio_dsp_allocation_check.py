@@ -0,0 +1,137 @@
+"""
+音声処理チェイン(AudioDspChain)のメモリ確保チェック
+
+合成した音声ブロックでコールバックと同じ呼び出しを繰り返し、
+1回の処理で確保される一時メモリを tracemalloc で計測する
+ufuncの呼び出し自体が確保する小さなオブジェクト(ビュー・スカラー等)はブロックサイズに依らないため、
+ブロックサイズを変えて比較し、音声データに比例する一時配列が無いことを確認する
+あわせてゲイン変更が滑らかなこと・200%でもクリップしないことを確認する
+
+使い方:
+    python benchmarks/audio_dsp_allocation_check.py --frames 1024 --blocks 2000
+"""
+import os
+import sys
+import argparse
+import tracemalloc
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from audio_dsp import AudioDspChain
+
+
+def synthesize_blocks(frames, channels, sample_rate, count, seed=0):
+    """
+    正弦波+ノイズの入力ブロックを作る(フルスケール付近まで振れる)
+
+    Return:
+    - blocks[] (numpy): (frames, channels) float32
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(frames * count) / sample_rate
+    signal = 0.8 * np.sin(2 * np.pi * 440.0 * t) + 0.15 * rng.standard_normal(len(t))
+    signal = np.clip(signal, -1.0, 1.0)
+    signal = np.repeat(signal[:, None], channels, axis=1).astype(np.float32)
+    return [np.ascontiguousarray(signal[i * frames:(i + 1) * frames]) for i in range(count)]
+
+
+def gain_schedule(block):
+    """
+    コールバック中に変わるメニュー操作を模したゲイン・ミュート
+    """
+    phase = block % 400
+    if phase < 100:
+        return 1.0, False
+    if phase < 200:
+        return 2.0, False
+    if phase < 300:
+        return 0.4, False
+    return 2.0, phase >= 350
+
+
+def run(frames, channels, sample_rate, block_count):
+    chain = AudioDspChain(frames, channels, sample_rate)
+    blocks = synthesize_blocks(frames, channels, sample_rate, 16)
+    outdata = np.empty((frames, channels), dtype=np.float32)
+    block_bytes = outdata.nbytes
+
+    # ufuncの初回呼び出しで作られるキャッシュ等を除くため、全ての分岐を1周回しておく
+    for i in range(400):
+        gain, is_muted = gain_schedule(i)
+        chain.set_gain(gain)
+        chain.set_mute(is_muted)
+        chain.process(blocks[i % len(blocks)], outdata)
+
+    peak_growth = 0
+    max_abs = 0.0
+    max_jump = 0.0
+    previous_last = None
+
+    tracemalloc.start()
+    for i in range(block_count):
+        gain, is_muted = gain_schedule(i)
+        chain.set_gain(gain)
+        chain.set_mute(is_muted)
+
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        chain.process(blocks[i % len(blocks)], outdata)
+        _, peak = tracemalloc.get_traced_memory()
+        peak_growth = max(peak_growth, peak - before)
+
+        # 検証(計測の外)
+        max_abs = max(max_abs, float(np.abs(outdata).max()))
+        if previous_last is not None:
+            max_jump = max(max_jump, float(np.abs(outdata[0] - previous_last).max()))
+        previous_last = outdata[-1].copy()
+    tracemalloc.stop()
+
+    return {
+        'frames': frames,
+        'channels': channels,
+        'blocks': block_count,
+        'block_bytes': block_bytes,
+        'peak_growth_bytes': peak_growth,
+        'max_abs': max_abs,
+        'max_block_jump': max_jump,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AudioDspChain allocation check")
+    parser.add_argument("--frames", type=int, default=1024)
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--sample-rate", type=int, default=48000)
+    parser.add_argument("--blocks", type=int, default=2000)
+    parser.add_argument("--scale", type=int, default=8, help="比較用に大きくするブロックサイズの倍率")
+    # ビューやPythonのfloatなど小さなオブジェクトの揺らぎは許容する
+    parser.add_argument("--tolerance", type=int, default=512, help="ブロックサイズ間で許容する一時メモリの差(byte)")
+    args = parser.parse_args()
+
+    results = [
+        run(args.frames, args.channels, args.sample_rate, args.blocks),
+        run(args.frames * args.scale, args.channels, args.sample_rate, args.blocks // args.scale),
+    ]
+    failures = []
+    for result in results:
+        print(", ".join(f"{key}: {value}" for key, value in result.items()))
+        if result['max_abs'] > 1.0:
+            failures.append(f"output exceeded full scale: {result['max_abs']:.4f}")
+
+    small, large = results
+    if large['peak_growth_bytes'] - small['peak_growth_bytes'] > args.tolerance:
+        failures.append(
+            f"allocation grows with block size: {small['peak_growth_bytes']} -> {large['peak_growth_bytes']} bytes")
+
+    if failures:
+        for failure in failures:
+            print("FAIL: " + failure)
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+キャプチャー位置の補正(CaptureCalibrator)の確認
+
+参照画像を本来の位置に貼った画面を、指定した拡大率・ずれで変形して推定させ、
+推定した補正値の誤差と、補正の前後でのシーン判定の一致度を表示する
+誤差が許容値を超えたら終了コード1で終わる
+
+使い方:
+    python benchmarks/capture_calibration_check.py --scale 1.03 --offset 7 -5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+import cv2
+import numpy as np
+
+from scene_recognizer import SceneRecognizer
+from capture_geometry import CaptureCalibrator, apply_geometry
+
+WIDTH, HEIGHT = 1920, 1080
+
+
+def make_frame(background, names, scale, offset_x, offset_y):
+    """
+    参照画像を貼った画面を、画面の中心を基準に拡大してずらす(RGB)
+    """
+    frame = background.copy()
+    for name in names:
+        x, y, width, height = SceneRecognizer.regions[name]
+        frame[y:y + height, x:x + width] = SceneRecognizer.ref_images[name]
+    center_x, center_y = WIDTH / 2, HEIGHT / 2
+    matrix = np.float32([[scale, 0, center_x * (1 - scale) + offset_x],
+                         [0, scale, center_y * (1 - scale) + offset_y]])
+    frame = cv2.warpAffine(frame, matrix, (WIDTH, HEIGHT), flags=cv2.INTER_LINEAR)
+    return cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CaptureCalibrator synthetic check")
+    parser.add_argument("--scale", type=float, default=1.03)
+    parser.add_argument("--offset", type=float, nargs=2, default=(7.0, -5.0), metavar=("X", "Y"))
+    parser.add_argument("--scenes", nargs="+", default=["pokemon_select", "versus", "team_select"],
+                        help="1フレームずつ表示する参照画像")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="許容する位置の誤差(ピクセル)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    background = cv2.GaussianBlur(rng.integers(0, 255, (HEIGHT, WIDTH), dtype=np.uint8), (0, 0), 3)
+    # 中心基準の変形を 映像の座標 = scale * 参照の座標 + offset に直した真値
+    true_offset_x = WIDTH / 2 * (1 - args.scale) + args.offset[0]
+    true_offset_y = HEIGHT / 2 * (1 - args.scale) + args.offset[1]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        calibrator = CaptureCalibrator("check@1920x1080", cache_path=os.path.join(temp_dir, "geometry.json"))
+        geometry = None
+        for index, name in enumerate(args.scenes):
+            frame = make_frame(background, [name], args.scale, *args.offset)
+            start = time.perf_counter()
+            geometry = calibrator.update(frame, index * calibrator.interval)
+            print(json.dumps({'scene': name, 'matched': sorted(calibrator.matches), 'geometry': repr(geometry),
+                              'ms': round((time.perf_counter() - start) * 1000, 1)}, ensure_ascii=False))
+
+    if geometry is None:
+        print(json.dumps({'error': "補正値を推定できませんでした"}, ensure_ascii=False))
+        sys.exit(1)
+
+    # 参照画像の四隅での位置の誤差
+    corners = [(0, 0), (WIDTH, 0), (0, HEIGHT), (WIDTH, HEIGHT)]
+    error = float(max(np.hypot(geometry.scale * x + geometry.offset_x - (args.scale * x + true_offset_x),
+                               geometry.scale * y + geometry.offset_y - (args.scale * y + true_offset_y))
+                      for x, y in corners))
+
+    frame = make_frame(background, [args.scenes[0]], args.scale, *args.offset)
+    apply_geometry(None)
+    before = float(SceneRecognizer.calculate_match_score(frame, args.scenes[0]))
+    apply_geometry(geometry)
+    after = float(SceneRecognizer.calculate_match_score(frame, args.scenes[0]))
+    apply_geometry(None)
+
+    result = {
+        'true': {'scale': args.scale, 'offset_x': round(true_offset_x, 2), 'offset_y': round(true_offset_y, 2)},
+        'estimated': {key: round(value, 4) for key, value in geometry.to_dict().items()},
+        'max_corner_error_px': round(error, 2),
+        'score_before': round(before, 3),
+        'score_after': round(after, 3),
+        'passed': error <= args.tolerance,
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if not result['passed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
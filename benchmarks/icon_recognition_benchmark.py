@@ -0,0 +1,277 @@
+"""
+ポケモンアイコン認識の精度・速度ベンチマーク
+
+img/Pokemon Icons のアイコンから実際のキャプチャーに近い切り抜き画像を合成し、
+top-1/top-k精度、1枚あたり・バッチあたりの推論時間、メモリ使用量を計測してJSONに書き出す
+
+使い方:
+    python benchmarks/icon_recognition_benchmark.py --backend keras --batch-sizes 1 6 32
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ICON_DIR = os.path.join(ROOT_DIR, "img", "Pokemon Icons")
+
+
+"""合成データ生成"""
+class CropSynthesizer:
+    # 実機のアイコン背景に近い色(RGB)
+    BACKGROUND_COLORS = [
+        (27, 27, 35), (40, 44, 62), (231, 231, 231), (251, 204, 0), (60, 60, 60), (16, 16, 16),
+    ]
+
+    def __init__(self, region_size, seed=0, max_offset=3, scale_range=(0.9, 1.1), jpeg_quality=(60, 95), noise_sigma=3.0):
+        """
+        Args:
+        - region_size (int): 切り抜きサイズ(MY_PARTY_REGION_SIZE or OPPONENT_PARTY_REGION_SIZE)
+        - seed (int): 乱数シード
+        - max_offset (int): 切り抜き位置のずれ(px)
+        - scale_range (tuple): アイコンの拡大縮小率の範囲
+        - jpeg_quality (tuple): JPEG圧縮品質の範囲
+        - noise_sigma (float): キャプチャーノイズの標準偏差
+        """
+        self.region_size = region_size
+        self.rng = np.random.default_rng(seed)
+        self.max_offset = max_offset
+        self.scale_range = scale_range
+        self.jpeg_quality = jpeg_quality
+        self.noise_sigma = noise_sigma
+
+    def background(self, size):
+        """
+        単色 + 縦グラデーションの背景を作る
+        """
+        base = np.array(self.BACKGROUND_COLORS[self.rng.integers(len(self.BACKGROUND_COLORS))], dtype=np.float32)
+        gradient = np.linspace(-12, 12, size, dtype=np.float32)[:, None, None]
+        canvas = np.clip(base[None, None, :] + gradient, 0, 255)
+        return np.ascontiguousarray(np.broadcast_to(canvas, (size, size, 3)), dtype=np.float32)
+
+    def synthesize(self, icon_rgba):
+        """
+        アイコン画像(RGBA)からキャプチャー映像の切り抜きに近い画像を生成する
+
+        Args:
+        - icon_rgba (numpy): RGBAアイコン画像
+
+        Return:
+        - crop (numpy): (region_size, region_size, 3) のuint8 RGB画像
+        """
+        import cv2
+        canvas_size = self.region_size + self.max_offset * 2
+        canvas = self.background(canvas_size)
+
+        # 拡大縮小して背景に合成
+        scale = self.rng.uniform(*self.scale_range)
+        icon_size = max(8, int(round(self.region_size * scale)))
+        icon = cv2.resize(icon_rgba, (icon_size, icon_size), interpolation=cv2.INTER_AREA).astype(np.float32)
+        alpha = icon[:, :, 3:4] / 255.0
+
+        top = (canvas_size - icon_size) // 2
+        src_y0, dst_y0 = max(0, -top), max(0, top)
+        length = min(icon_size - src_y0, canvas_size - dst_y0)
+        region = canvas[dst_y0:dst_y0 + length, dst_y0:dst_y0 + length]
+        icon_part = icon[src_y0:src_y0 + length, src_y0:src_y0 + length]
+        alpha_part = alpha[src_y0:src_y0 + length, src_y0:src_y0 + length]
+        region[:] = icon_part[:, :, :3] * alpha_part + region * (1.0 - alpha_part)
+
+        # 切り抜き位置のずれ
+        dx, dy = self.rng.integers(0, self.max_offset * 2 + 1, size=2)
+        crop = canvas[dy:dy + self.region_size, dx:dx + self.region_size]
+
+        # キャプチャーノイズ
+        crop = crop + self.rng.normal(0.0, self.noise_sigma, crop.shape)
+        crop = np.clip(crop, 0, 255).astype(np.uint8)
+
+        # JPEG圧縮ノイズ
+        quality = int(self.rng.integers(self.jpeg_quality[0], self.jpeg_quality[1] + 1))
+        _, encoded = cv2.imencode(".jpg", cv2.cvtColor(crop, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return cv2.cvtColor(cv2.imdecode(encoded, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+
+
+def load_icon_labels(max_icons=None):
+    """
+    pokemon_data.xlsx から(ラベル, アイコンファイル名)の一覧を取得する
+
+    Args:
+    - max_icons (int): 使用するアイコン数の上限
+
+    Return:
+    - [(label, file_name), ...]
+    """
+    from pokemon_table import PokemonTable
+    table = PokemonTable.load()
+    images = table.column('image')
+    pairs = [(label, str(images[row])) for label, row in enumerate(table.label_to_row)
+             if label != 0 and row >= 0 and str(images[row]).endswith(".png")]
+    if max_icons is not None:
+        pairs = pairs[:max_icons]
+    return pairs
+
+
+def build_dataset(pairs, region_sizes, samples_per_icon, seed):
+    """
+    合成データセットを作成する
+
+    Return:
+    - crops[] (numpy): 合成画像
+    - labels (numpy): 正解ラベル
+    """
+    import cv2
+    synthesizers = [CropSynthesizer(size, seed=seed + i) for i, size in enumerate(region_sizes)]
+    crops, labels = [], []
+    for label, file_name in pairs:
+        icon = cv2.imread(os.path.join(ICON_DIR, file_name), cv2.IMREAD_UNCHANGED)
+        if icon is None:
+            continue
+        if icon.shape[2] == 3:
+            icon = cv2.cvtColor(icon, cv2.COLOR_BGR2BGRA)
+        icon = cv2.cvtColor(icon, cv2.COLOR_BGRA2RGBA)
+        for i in range(samples_per_icon):
+            crops.append(synthesizers[i % len(synthesizers)].synthesize(icon))
+            labels.append(label)
+    return crops, np.array(labels, dtype=np.int64)
+
+
+"""推論バックエンド(名前 -> 確率を返す関数の生成)"""
+def keras_backend():
+    from icon_recognizer import IconRecognizer
+    IconRecognizer.load_model()
+    return IconRecognizer.predict_probabilities
+
+def worker_backend():
+    from inference_worker import InferenceWorker
+    worker = InferenceWorker(max_batch=64)
+    worker.start()
+
+    def predict(images):
+        # 別プロセスは最上位のラベルのみ返すため、そのラベルを1.0とした分布に変換(top-kはtop-1と同値になる)
+        labels = []
+        for start in range(0, len(images), worker.buffer_shape[0]):
+            batch_labels, _ = worker.recognize(images[start:start + worker.buffer_shape[0]])
+            labels += batch_labels
+        probs = np.zeros((len(labels), max(labels) + 1), dtype=np.float32)
+        probs[np.arange(len(labels)), labels] = 1.0
+        return probs
+    return predict
+
+BACKENDS = {
+    'keras': keras_backend,
+    'worker': worker_backend,
+}
+
+
+def measure_accuracy(predict, crops, labels, batch_size, top_k):
+    """
+    top-1/top-k精度を計測する
+    """
+    top1 = topk = 0
+    for start in range(0, len(crops), batch_size):
+        probs = np.asarray(predict(crops[start:start + batch_size]))
+        truth = labels[start:start + batch_size]
+        top1 += int(np.sum(np.argmax(probs, axis=1) == truth))
+        ranked = np.argpartition(-probs, min(top_k, probs.shape[1] - 1), axis=1)[:, :top_k]
+        topk += int(np.sum(np.any(ranked == truth[:, None], axis=1)))
+    return top1 / len(crops), topk / len(crops)
+
+
+def measure_latency(predict, crops, batch_size, repeats, warmup=2):
+    """
+    バッチ単位の推論時間を計測する(ミリ秒)
+    """
+    batches = [crops[i:i + batch_size] for i in range(0, len(crops) - batch_size + 1, batch_size)][:repeats]
+    if not batches:
+        return None
+    for batch in batches[:warmup]:
+        predict(batch)
+
+    timings = []
+    for batch in batches:
+        start = time.perf_counter()
+        predict(batch)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    timings = np.array(timings)
+    return {
+        'batch_size': batch_size,
+        'batches': len(timings),
+        'batch_ms_mean': float(timings.mean()),
+        'batch_ms_p50': float(np.percentile(timings, 50)),
+        'batch_ms_p95': float(np.percentile(timings, 95)),
+        'image_ms_mean': float(timings.mean() / batch_size),
+    }
+
+
+def measure_memory(predict, crops, batch_size):
+    """
+    推論1バッチあたりのPythonヒープ増加量とプロセスのRSSを計測する
+    """
+    import psutil
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    tracemalloc.start()
+    predict(crops[:batch_size])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'batch_size': batch_size,
+        'python_peak_bytes': int(peak),
+        'rss_bytes': int(process.memory_info().rss),
+        'rss_delta_bytes': int(process.memory_info().rss - rss_before),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ポケモンアイコン認識ベンチマーク")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="keras")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 6, 32])
+    parser.add_argument("--samples-per-icon", type=int, default=2)
+    parser.add_argument("--max-icons", type=int, default=None)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--latency-repeats", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--device", choices=["cpu", "gpu"], default="cpu")
+    parser.add_argument("--output", default="icon_recognition_benchmark.json")
+    args = parser.parse_args(argv)
+
+    if args.device == "cpu":
+        os.environ["CUDA_VISIBLE_DEVICES"] = "-1"   # TensorFlowをCPUで実行
+    os.chdir(ROOT_DIR)
+    sys.path.insert(0, ROOT_DIR)
+    from icon_capture import IconCapture
+
+    region_sizes = [IconCapture.MY_PARTY_REGION_SIZE, IconCapture.OPPONENT_PARTY_REGION_SIZE]
+    pairs = load_icon_labels(args.max_icons)
+    crops, labels = build_dataset(pairs, region_sizes, args.samples_per_icon, args.seed)
+
+    predict = BACKENDS[args.backend]()
+    top1, topk = measure_accuracy(predict, crops, labels, max(args.batch_sizes), args.top_k)
+
+    results = {
+        'backend': args.backend,
+        'device': args.device,
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'seed': args.seed,
+        'icons': len(pairs),
+        'samples': len(crops),
+        'region_sizes': region_sizes,
+        'accuracy': {'top1': top1, f'top{args.top_k}': topk},
+        'latency': [result for result in (measure_latency(predict, crops, size, args.latency_repeats)
+                                          for size in args.batch_sizes) if result is not None],
+        'memory': [measure_memory(predict, crops, size) for size in args.batch_sizes],
+    }
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(json.dumps(results['accuracy']), f"-> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+配信オーバーレイ用サーバー(OverlayServer)のlocalhostでの確認
+
+空いているポートでサーバーを起動し、WebSocketクライアントで snapshot・diff・ping を、
+HTTPで /state を確認する。読まない遅いクライアントがいてもイベントの発行が
+待たされないこと(送信キューが溢れたら snapshot を送り直すこと)も確認する
+
+使い方:
+    python benchmarks/overlay_server_check.py
+"""
+import os
+import sys
+import json
+import time
+import socket
+import base64
+import argparse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+from event_bus import SceneChanged, PartyRecognized
+from overlay_server import OverlayServer, encode_frame
+
+
+def connect_websocket(port):
+    sock = socket.create_connection(("127.0.0.1", port), timeout=5.0)
+    key = base64.b64encode(os.urandom(16)).decode("ascii")
+    sock.sendall((f"GET /ws HTTP/1.1\r\nHost: 127.0.0.1\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode("latin-1"))
+    response = b""
+    while b"\r\n\r\n" not in response:
+        response += sock.recv(1)
+    assert response.startswith(b"HTTP/1.1 101"), response
+    return sock
+
+
+def recv_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("closed")
+        data += chunk
+    return data
+
+
+def recv_frame(sock):
+    """
+    サーバーからのフレーム(マスクなし)を1つ読む
+    """
+    first, second = recv_exactly(sock, 2)
+    length = second & 0x7F
+    if length == 126:
+        length = int.from_bytes(recv_exactly(sock, 2), "big")
+    elif length == 127:
+        length = int.from_bytes(recv_exactly(sock, 8), "big")
+    return first & 0x0F, recv_exactly(sock, length)
+
+
+def send_masked(sock, payload, opcode):
+    """
+    クライアントからのフレームはマスクが必要
+    """
+    mask = os.urandom(4)
+    frame = bytearray(encode_frame(payload, opcode))
+    frame[1] |= 0x80
+    sock.sendall(bytes(frame[:len(frame) - len(payload)]) + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OverlayServer localhost check")
+    parser.add_argument("--events", type=int, default=2000, help="遅いクライアントがいる状態で発行するイベント数")
+    parser.add_argument("--client-queue", type=int, default=16)
+    args = parser.parse_args()
+
+    server = OverlayServer(port=0, client_queue=args.client_queue)
+    server.start()
+    try:
+        client = connect_websocket(server.port)
+        opcode, payload = recv_frame(client)
+        assert json.loads(payload)['type'] == "snapshot"
+
+        server.push(SceneChanged("POKEMON_SELECT", "MATCHING_WAIT"))
+        server.push(PartyRecognized("opponent", [25, 0, 0, 0, 0, 0], [0.9, 0, 0, 0, 0, 0]))
+        scene_diff = json.loads(recv_frame(client)[1])
+        party_diff = json.loads(recv_frame(client)[1])
+        assert scene_diff['changes'] == {'scene': "POKEMON_SELECT"}, scene_diff
+        assert party_diff['changes']['parties']['opponent'][0]['icon'] == "/icons/pokemon/25.png", party_diff
+        print(json.dumps({'check': "diff", 'scene': scene_diff, 'party': party_diff}, ensure_ascii=False))
+
+        send_masked(client, b"check", 0x9)
+        assert recv_frame(client) == (0xA, b"check")
+
+        http = socket.create_connection(("127.0.0.1", server.port), timeout=5.0)
+        http.sendall(b"GET /state HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n")
+        response = b""
+        while chunk := http.recv(65536):
+            response += chunk
+        state = json.loads(response.split(b"\r\n\r\n", 1)[1])
+        assert state['scene'] == "POKEMON_SELECT"
+        print(json.dumps({'check': "state", 'state': state}, ensure_ascii=False))
+
+        # 読まないクライアントがいてもpush()は待たされない
+        slow = connect_websocket(server.port)
+        slow.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        start = time.perf_counter()
+        for i in range(args.events):
+            server.push(PartyRecognized("my", [i % 1000 + 1] * 6, [0.5] * 6))
+        elapsed = time.perf_counter() - start
+        time.sleep(0.5)
+        print(json.dumps({'check': "slow_client", 'events': args.events,
+                          'push_us': round(elapsed * 1e6 / args.events, 2), 'resync_count': server.resync_count}))
+        slow.close()
+        client.close()
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""
+録画した映像による認識パイプライン全体(エンドツーエンド)のベンチマーク
+
+GUIと同じ MainGraphicWidget(映像取り込み -> SceneRecognizer -> IconCapture -> 推論プロセス ->
+PartyPokemonsDock の更新) を Qt の offscreen モードで動かし、次の値を計測する
+- 相手パーティのアイコンが出揃ったフレームから、ドックが更新されるまでの時間
+- 定常状態のフレームレート・1フレームの処理時間・1フレームあたりのCPU時間
+
+アイコンが出揃ったフレームは --annotations のJSON ({"opponent_visible": [フレーム番号, ...]}) で指定する
+指定しなければ事前に全フレームでシーンを判定し、選出画面で相手の6枠全てにアイコンがある最初のフレームとする
+
+結果はJSONで書き出し、保存済みの基準値(録画ファイル名ごと)と比較して悪化していたら終了コード1で終わる
+
+使い方:
+    python benchmarks/pipeline_latency_check.py recordings/match01.mp4 --update-baseline
+    python benchmarks/pipeline_latency_check.py recordings/match01.mp4 --output pipeline_latency.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+os.chdir(ROOT_DIR)
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")     # ウィンドウを画面に出さない
+
+from startup_profiler import startup_profiler
+
+import cv2
+import numpy as np
+
+import media_clock
+from event_bus import event_bus
+from scene_recognizer import SceneRecognizer, GameScene
+from icon_capture import IconStabilityDetector
+from capture_geometry import CaptureCalibrator, apply_geometry
+
+BASELINE_PATH = os.path.join("benchmarks", "baselines", "pipeline_latency.json")
+
+# 基準値と比較する値 -> (大きい方が良いか, 許容する差の下限)
+# 差が 基準値 * tolerance と下限の大きい方を超えたら悪化とする(短い時間のばらつきで失敗しないように)
+COMPARED_METRICS = {
+    'opponent_latency_ms_p50': (False, 20.0),
+    'opponent_latency_ms_max': (False, 50.0),
+    'frame_ms_p95': (False, 2.0),
+    'cpu_ms_per_frame': (False, 2.0),
+    'fps': (True, 1.0),
+}
+
+
+"""イベントの受信時刻を記録するSink"""
+class TimelineSink:
+
+    def __init__(self):
+        self.events = []    # (media_clock の時刻, イベント)
+
+    def push(self, event):
+        # PartyRecognized はドックを更新した直後にGUIスレッドで発行される
+        self.events.append((media_clock.now(), event))
+
+    def times(self, kind, **fields):
+        return [at for at, event in self.events
+                if event.kind == kind and all(getattr(event, name) == value for name, value in fields.items())]
+
+    def durations(self, name):
+        return [event.duration_ms for _, event in self.events if event.kind == "timing" and event.name == name]
+
+
+def find_opponent_visible_frames(source, min_detail):
+    """
+    全フレームでシーンを判定し、選出画面に入ってから相手の6枠全てにアイコンが表示された最初のフレームを返す
+    (VERSUSを経るまでは次の選出画面とみなさない: GUIの認識と同じ)
+
+    Return:
+    - frames[] (int): フレーム番号
+    """
+    capture = cv2.VideoCapture(source)
+    detector = IconStabilityDetector(min_detail=min_detail)
+    frames = []
+    index = 0
+    is_waiting = False
+    is_captured = False
+    while True:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        if index == 0:
+            # GUIと同じく保存済みの補正値を使う
+            calibrator = CaptureCalibrator(CaptureCalibrator.device_key(source, frame.shape))
+            apply_geometry(calibrator.load())
+
+        match SceneRecognizer.current_scene_recognition(frame):
+            case GameScene.POKEMON_SELECT if not is_captured:
+                is_waiting = is_captured = True
+            case GameScene.VERSUS:
+                is_waiting = is_captured = False
+
+        if is_waiting and np.all(detector.sample(frame).std(axis=(1, 2, 3)) >= min_detail):
+            frames.append(index)
+            is_waiting = False
+        index += 1
+    capture.release()
+    SceneRecognizer.current_scene = GameScene.OTHER_SCENE
+    apply_geometry(None)
+    return frames
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 2) if len(values) else None
+
+
+def run_pipeline(args):
+    """
+    MainGraphicWidget に録画を1フレームずつ読み込ませて計測する
+
+    Return:
+    - frame_times[] (float): 各フレームの取り込み時刻(media_clock)
+    - frame_ms[] (float): 各フレームの処理時間(ms)
+    - cpu_seconds[] (float): 各フレームの処理後のCPU時間の累計(秒、推論プロセスを含む)
+    - fps (float): 録画のフレームレート
+    - sink (TimelineSink): 受信したイベント
+    - widget (MainGraphicWidget)
+    """
+    from PyQt5.QtWidgets import QApplication, QMainWindow
+    app = QApplication(sys.argv[:1])
+    from graphic_widget import MainGraphicWidget
+    from pokemon import PokemonData
+
+    window = QMainWindow()
+    widget = MainGraphicWidget(main_window=window, video_source=args.source)
+    widget.timer.stop()     # フレームはこのベンチマークが読み込ませる
+    capture = widget.video_capture.cap
+    fps = args.fps or capture.get(cv2.CAP_PROP_FPS) or 60.0
+
+    # モデルの読み込みは計測に含めない(起動時間は startup_time_check.py で計測する)
+    deadline = time.monotonic() + args.model_timeout
+    while not PokemonData.inference_worker.poll_ready() and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.05)
+
+    sink = TimelineSink()
+    event_bus.add_sink(sink)
+    cpu_time = cpu_time_reader()
+
+    frame_times, frame_ms, cpu_seconds = [], [], []
+    started_at = time.monotonic()
+    while args.max_frames is None or len(frame_times) < args.max_frames:
+        if args.realtime:
+            # 録画のフレームレートで読み込む(ライブのキャプチャーと同じ間隔)
+            due = started_at + len(frame_times) / fps
+            while time.monotonic() < due:
+                app.processEvents()
+                time.sleep(min(0.002, max(0.0, due - time.monotonic())))
+
+        previous_time = widget.video_capture.frame_time
+        start = time.perf_counter()
+        widget.update_frame()
+        elapsed = time.perf_counter() - start
+        if widget.video_capture.frame_time == previous_time:
+            break   # 録画の終わり
+        app.processEvents()     # 認識結果(ワーカースレッドからのシグナル)をGUIスレッドで受け取る
+
+        frame_times.append(widget.frame_time)
+        frame_ms.append(elapsed * 1000.0)
+        cpu_seconds.append(cpu_time())
+
+    # 実行中の認識の結果を待つ
+    deadline = time.monotonic() + args.drain
+    while time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+
+    event_bus.remove_sink(sink)
+    widget.close()
+    return frame_times, frame_ms, cpu_seconds, fps, sink, widget
+
+
+def cpu_time_reader():
+    """
+    このプロセスと推論プロセス(子プロセス)のCPU時間の累計を返す関数
+    psutil が無ければこのプロセスのみ
+    """
+    try:
+        import psutil
+    except ImportError:
+        return time.process_time
+    process = psutil.Process()
+
+    def read():
+        total = time.process_time()
+        for child in process.children(recursive=True):
+            try:
+                times = child.cpu_times()
+            except psutil.Error:
+                continue
+            total += times.user + times.system
+        return total
+    return read
+
+
+def measure(args):
+    """
+    Return:
+    - result (dict): 計測結果
+    """
+    if args.annotations:
+        with open(args.annotations, encoding="utf-8") as f:
+            visible_frames = json.load(f)['opponent_visible']
+    else:
+        visible_frames = find_opponent_visible_frames(args.source, args.min_detail)
+
+    frame_times, frame_ms, cpu_seconds, fps, sink, widget = run_pipeline(args)
+
+    # アイコンが出揃ったフレームごとに、その後で最初に相手パーティのドックが更新されるまでの時間
+    updates = sink.times("party_recognized", side="opponent")
+    latencies, missed = [], []
+    for index in visible_frames:
+        if index >= len(frame_times):
+            continue
+        visible_at = frame_times[index]
+        later = [at for at in updates if at >= visible_at]
+        if later:
+            latencies.append((later[0] - visible_at) * 1000.0)
+        else:
+            missed.append(index)
+
+    # 定常状態(読み込み開始直後を除く)のフレームレートとCPU時間
+    warmup = min(int(args.warmup * fps), max(0, len(frame_times) - 2))
+    steady_frames = len(frame_times) - 1 - warmup
+    steady_seconds = frame_times[-1] - frame_times[warmup] if steady_frames > 0 else 0.0
+    steady_cpu = cpu_seconds[-1] - cpu_seconds[warmup] if steady_frames > 0 else 0.0
+
+    return {
+        'source': os.path.basename(args.source),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'realtime': args.realtime,
+        'source_fps': round(fps, 2),
+        'frames': len(frame_times),
+        'opponent_visible_frames': visible_frames,
+        'opponent_updates': len(updates),
+        'opponent_missed_frames': missed,
+        'opponent_latency_ms': [round(latency, 1) for latency in latencies],
+        'opponent_latency_ms_p50': percentile(latencies, 50),
+        'opponent_latency_ms_max': round(max(latencies), 1) if latencies else None,
+        # 内訳: アイコンが止まるまでの待機時間、認識の依頼からドックの更新までの時間
+        'opponent_wait_ms': [round(duration, 1) for duration in sink.durations("opponent_party_wait")],
+        'opponent_job_ms': [round(duration, 1) for duration in sink.durations("opponent_party")],
+        'fps': round(steady_frames / steady_seconds, 2) if steady_seconds > 0 else None,
+        'frame_ms_p50': percentile(frame_ms[warmup:], 50),
+        'frame_ms_p95': percentile(frame_ms[warmup:], 95),
+        'cpu_ms_per_frame': round(steady_cpu / steady_frames * 1000.0, 3) if steady_frames > 0 else None,
+        'scene_scheduler': widget.scene_scheduler.stats(frame_times[-1] if frame_times else None),
+        'first_frame_ms': startup_profiler.report()['first_frame_ms'],
+    }
+
+
+def compare(result, baseline, tolerance):
+    """
+    基準値と比較する
+
+    Return:
+    - regressions[] (str): 悪化した項目の説明
+    """
+    regressions = []
+    if len(result['opponent_missed_frames']) > len(baseline.get('opponent_missed_frames', [])):
+        regressions.append(f"opponent_missed_frames: {baseline.get('opponent_missed_frames', [])} -> {result['opponent_missed_frames']}")
+    for name, (higher_is_better, min_margin) in COMPARED_METRICS.items():
+        value, reference = result.get(name), baseline.get(name)
+        if value is None or reference is None:
+            continue
+        margin = max(abs(reference) * tolerance, min_margin)
+        is_worse = value < reference - margin if higher_is_better else value > reference + margin
+        if is_worse:
+            regressions.append(f"{name}: {reference} -> {value} (許容 ±{margin:.1f})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline latency benchmark")
+    parser.add_argument("source", help="録画した動画ファイル")
+    parser.add_argument("--annotations", default=None, help="相手のアイコンが出揃ったフレーム番号のJSON")
+    parser.add_argument("--min-detail", type=float, default=12.0, help="アイコンがあるとみなす画素値の標準偏差")
+    parser.add_argument("--no-realtime", dest="realtime", action="store_false",
+                        help="録画のフレームレートを待たずに読み込む(処理能力の計測用)")
+    parser.add_argument("--fps", type=float, default=None, help="録画のフレームレート(Noneなら動画から取得)")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--warmup", type=float, default=2.0, help="定常状態の計測から除く最初の秒数")
+    parser.add_argument("--drain", type=float, default=2.0, help="録画の終わりの後、認識結果を待つ秒数")
+    parser.add_argument("--model-timeout", type=float, default=120.0, help="推論モデルの読み込みを待つ最大秒数")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基準値のJSON(録画ファイル名ごと)")
+    parser.add_argument("--update-baseline", action="store_true", help="今回の結果を基準値として保存する")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="基準値からの悪化を許容する割合")
+    parser.add_argument("--output", default=None, help="結果のJSONの書き出し先")
+    args = parser.parse_args()
+
+    result = measure(args)
+
+    try:
+        with open(args.baseline, encoding="utf-8") as f:
+            baselines = json.load(f)
+    except (OSError, ValueError):
+        baselines = {}
+    baseline = baselines.get(result['source'])
+
+    if baseline is None:
+        result['regressions'] = None    # 比較する基準値が無い
+    else:
+        result['regressions'] = compare(result, baseline, args.tolerance)
+        if baseline.get('platform') != result['platform']:
+            result['baseline_platform'] = baseline.get('platform')  # 別の環境の基準値(参考程度)
+    result['passed'] = not result['regressions']
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.update_baseline:
+        baselines[result['source']] = {key: value for key, value in result.items()
+                                       if key not in ('regressions', 'passed', 'baseline_platform')}
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=2)
+    if not result['passed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+起動時間(最初のフレームまでの時間)のベンチマーク
+
+app.py を --exit-after-first-frame 付きで別プロセスとして起動し、startup_profiler が書き出す
+段階ごとの時間を集計する。最初のフレームまでの時間(中央値)が予算を超えたら終了コード1で終わる
+
+使い方:
+    python benchmarks/startup_time_check.py --source recordings/match01.mp4 --budget-ms 4000
+    python benchmarks/startup_time_check.py --headless --source recordings/match01.mp4 --budget-ms 1500
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from statistics import median
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_once(args, report_path):
+    """
+    アプリを1回起動して計測結果を返す(最初のフレームまで届かなければNone)
+    """
+    command = [sys.executable, "app.py", "--source", args.source, "--startup-report", report_path,
+               "--exit-after-first-frame"]
+    if args.headless:
+        command += ["--headless", "--output", os.devnull]
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")     # ウィンドウを画面に出さない
+
+    try:
+        subprocess.run(command, cwd=ROOT_DIR, env=env, timeout=args.timeout,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except subprocess.TimeoutExpired:
+        pass
+    try:
+        with open(report_path, encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return report if report.get('first_frame_ms') is not None else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time-to-first-frame benchmark")
+    parser.add_argument("--source", default="0", help="キャプチャーデバイス番号、または録画した動画ファイル")
+    parser.add_argument("--headless", action="store_true", help="ヘッドレス実行の起動時間を計測する")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--budget-ms", type=float, default=4000.0, help="最初のフレームまでの時間の上限(中央値)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="1回の起動を待つ最大時間(秒)")
+    parser.add_argument("--forbid", nargs="*", default=["keras", "tensorflow", "pandas"],
+                        help="最初のフレームまでに読み込まれていたら失敗とするモジュール")
+    parser.add_argument("--output", default=None, help="結果のJSONの書き出し先")
+    args = parser.parse_args()
+
+    reports = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for run in range(args.runs):
+            report = run_once(args, os.path.join(temp_dir, f"startup_{run}.json"))
+            if report is None:
+                print(json.dumps({'run': run, 'error': "最初のフレームまで届きませんでした"}, ensure_ascii=False))
+                sys.exit(1)
+            reports.append(report)
+            print(json.dumps({'run': run, 'first_frame_ms': report['first_frame_ms'],
+                              'heavy_modules': report['heavy_modules']}, ensure_ascii=False))
+
+    # 段階ごとの所要時間(中央値)
+    phase_durations = {}
+    for report in reports:
+        for phase in report['phases']:
+            phase_durations.setdefault(phase['name'], []).append(phase['duration_ms'])
+    first_frame = median(report['first_frame_ms'] for report in reports)
+    loaded = sorted({name for report in reports for name in report['heavy_modules'] if name in args.forbid})
+
+    result = {
+        'mode': "headless" if args.headless else "gui",
+        'runs': args.runs,
+        'first_frame_ms': first_frame,
+        'budget_ms': args.budget_ms,
+        'phases_ms': {name: median(durations) for name, durations in phase_durations.items()},
+        'forbidden_modules_loaded': loaded,
+        'passed': first_frame <= args.budget_ms and not loaded,
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if not result['passed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+キャプチャー位置の補正
+
+キャプチャーボードによっては映像が数ピクセルずれたり、オーバースキャンで拡大・縮小されるため、
+固定座標の比較領域(SceneRecognizer)・切り抜き領域(IconCapture)が合わなくなる
+参照画像と映像を比較して 映像の座標 = scale * 参照の座標 + offset を推定し、デバイスごとに保存する
+推定後も認識処理は補正済みの小さな固定領域だけを使う
+"""
+import os
+import json
+import time
+
+import cv2
+import numpy as np
+
+from array_backend import to_numpy
+from scene_recognizer import SceneRecognizer
+from icon_capture import IconCapture
+
+
+"""映像の座標変換(拡大率とずれ)"""
+class CaptureGeometry:
+
+    def __init__(self, scale=1.0, offset_x=0.0, offset_y=0.0):
+        self.scale = float(scale)
+        self.offset_x = float(offset_x)
+        self.offset_y = float(offset_y)
+
+    def is_identity(self):
+        """
+        補正が不要か(1ピクセル未満のずれ)
+        """
+        return (abs(self.offset_x) < 0.5 and abs(self.offset_y) < 0.5
+                and abs(self.scale - 1.0) * 1920 < 0.5)
+
+    def map_point(self, x, y):
+        return int(round(self.scale * x + self.offset_x)), int(round(self.scale * y + self.offset_y))
+
+    def map_rect(self, x, y, width, height):
+        """
+        参照の座標の領域 (x, y, 幅, 高さ) を映像の座標に変換する
+        """
+        mapped_x, mapped_y = self.map_point(x, y)
+        return max(0, mapped_x), max(0, mapped_y), int(round(width * self.scale)), int(round(height * self.scale))
+
+    def to_dict(self):
+        return {'scale': self.scale, 'offset_x': self.offset_x, 'offset_y': self.offset_y}
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(values['scale'], values['offset_x'], values['offset_y'])
+
+    def __repr__(self):
+        return f"CaptureGeometry(scale={self.scale:.4f}, offset=({self.offset_x:.1f}, {self.offset_y:.1f}))"
+
+
+def apply_geometry(geometry):
+    """
+    補正を全ての比較・切り抜き領域に反映する(Noneなら補正なし)
+    """
+    if geometry is not None and geometry.is_identity():
+        geometry = None
+    SceneRecognizer.set_geometry(geometry)
+    IconCapture.geometry = geometry
+
+
+"""参照画像からキャプチャー位置を推定するクラス"""
+class CaptureCalibrator:
+    CACHE_PATH = "./data/cache/capture_geometry.json"
+
+    # 推定に使う参照画像の最小面積(小さい画像は誤って一致しやすい)
+    MIN_TEMPLATE_AREA = 2000
+    # 最初に調べる拡大率(その後、最も一致した拡大率の周辺を細かく調べる)
+    COARSE_SCALES = (1.0, 0.99, 1.01, 0.98, 1.02, 0.97, 1.03, 0.96, 1.04, 0.95, 1.05)
+    FINE_STEP = 0.0025
+
+    def __init__(self, device_key, cache_path=None, interval=1.0, max_offset=48, min_score=0.85,
+                 min_templates=2, max_single_attempts=10):
+        """
+        Args:
+        - device_key (str): 保存に使うデバイスの識別子 (device_key() を参照)
+        - cache_path (str): 推定結果の保存先
+        - interval (float): 推定を試す間隔(秒)
+        - max_offset (int): 探すずれの最大値(ピクセル)
+        - min_score (float): 一致とみなす最小の一致度
+        - min_templates (int): 推定を確定するのに必要な一致した参照画像の数
+        - max_single_attempts (int): 一致した参照画像が1つのまま、この回数試したらそれで確定する
+        """
+        self.device_key = device_key
+        self.cache_path = cache_path or self.CACHE_PATH
+        self.interval = interval
+        self.max_offset = max_offset
+        self.min_score = min_score
+        self.min_templates = min_templates
+        self.max_single_attempts = max_single_attempts
+        self.reset()
+
+    @staticmethod
+    def device_key(source, frame_shape):
+        """
+        デバイスと解像度ごとに補正値を保存する
+        """
+        return f"{source}@{frame_shape[1]}x{frame_shape[0]}"
+
+    def reset(self):
+        """
+        推定をやり直す(保存済みの値は使わない)
+        """
+        self.geometry = None
+        self.matches = {}       # 参照画像名 -> (一致度, 拡大率, 参照のx, y, 映像のx, y)
+        self.attempts = 0
+        self.last_attempt = None
+
+    @property
+    def is_calibrated(self):
+        return self.geometry is not None
+
+    def is_due(self, now):
+        return not self.is_calibrated and (self.last_attempt is None or now - self.last_attempt >= self.interval)
+
+    """"""
+    def load(self):
+        """
+        保存済みの補正値を読み込む(無ければNone)
+        """
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                values = json.load(f).get(self.device_key)
+        except (OSError, ValueError):
+            return None
+        if values is None:
+            return None
+        self.geometry = CaptureGeometry.from_dict(values)
+        return self.geometry
+
+    def save(self):
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        entry = self.geometry.to_dict()
+        entry.update({'templates': sorted(self.matches), 'calibrated_at': time.time()})
+        cache[self.device_key] = entry
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        with open(self.cache_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+
+    """"""
+    def update(self, frame, now):
+        """
+        フレームから一致する参照画像を探し、十分に集まったら補正値を確定して保存する
+        (1回で数十~数百ms かかるため、GUIでは別スレッドから呼ぶ)
+
+        Args:
+        - frame (cupy or numpy): キャプチャーした画面(RGB)
+        - now (float): 現在時刻
+
+        Return:
+        - geometry (CaptureGeometry): 確定した補正値(未確定ならNone)
+        """
+        self.last_attempt = now
+        self.attempts += 1
+        for name, match in self.find_matches(frame).items():
+            if name not in self.matches or match[0] > self.matches[name][0]:
+                self.matches[name] = match
+
+        if len(self.matches) >= self.min_templates or (self.matches and self.attempts >= self.max_single_attempts):
+            geometry = self.fit(list(self.matches.values()))
+            if geometry is not None:
+                self.geometry = geometry
+                self.save()
+        return self.geometry
+
+    def find_matches(self, frame):
+        """
+        各参照画像を、本来の位置の周辺で拡大率を変えながら探す
+
+        Return:
+        - matches (dict): 参照画像名 -> (一致度, 拡大率, 参照のx, y, 映像のx, y)
+        """
+        gray = cv2.cvtColor(to_numpy(frame), cv2.COLOR_RGB2GRAY)
+        center_x, center_y = gray.shape[1] / 2, gray.shape[0] / 2
+
+        matches = {}
+        for name in SceneRecognizer.scene_references.values():
+            template = SceneRecognizer.ref_images.get(name)
+            if template is None or template.size < self.MIN_TEMPLATE_AREA:
+                continue
+            x, y, _, _ = SceneRecognizer.regions[name]
+
+            best = max((self._match(gray, template, x, y, scale, center_x, center_y) for scale in self.COARSE_SCALES),
+                       key=lambda match: match[0])
+            if best[0] < self.min_score * 0.8:
+                continue
+            # 最も一致した拡大率の周辺を細かく調べる
+            fine_scales = best[1] + self.FINE_STEP * np.arange(-4, 5)
+            best = max((self._match(gray, template, x, y, scale, center_x, center_y) for scale in fine_scales),
+                       key=lambda match: match[0])
+            if best[0] >= self.min_score:
+                matches[name] = best
+        return matches
+
+    def _match(self, gray, template, x, y, scale, center_x, center_y):
+        """
+        拡大率 scale の時に参照画像がありうる範囲(中心基準の拡大 ± max_offset)だけを探す
+        """
+        height, width = template.shape[:2]
+        scaled_width, scaled_height = int(round(width * scale)), int(round(height * scale))
+        expected_x = int(round(center_x + scale * (x - center_x)))
+        expected_y = int(round(center_y + scale * (y - center_y)))
+
+        left, top = max(0, expected_x - self.max_offset), max(0, expected_y - self.max_offset)
+        right = min(gray.shape[1], expected_x + scaled_width + self.max_offset)
+        bottom = min(gray.shape[0], expected_y + scaled_height + self.max_offset)
+        if right - left < scaled_width or bottom - top < scaled_height:
+            return (-1.0, scale, x, y, 0, 0)
+
+        scaled = template if scale == 1.0 else cv2.resize(template, (scaled_width, scaled_height), interpolation=cv2.INTER_AREA)
+        result = cv2.matchTemplate(gray[top:bottom, left:right], scaled, cv2.TM_CCOEFF_NORMED)
+        _, score, _, location = cv2.minMaxLoc(result)
+        return (float(score), float(scale), x, y, left + location[0], top + location[1])
+
+    @staticmethod
+    def fit(matches, max_scale_error=0.08):
+        """
+        一致した参照画像の位置から 映像の座標 = scale * 参照の座標 + offset を求める
+        離れた位置に2つ以上あれば位置から最小二乗で、1つなら一致した拡大率を使う
+
+        Args:
+        - matches[] (tuple): (一致度, 拡大率, 参照のx, y, 映像のx, y)
+
+        Return:
+        - geometry (CaptureGeometry): 推定できなければNone
+        """
+        if not matches:
+            return None
+        points = np.array([match[2:] for match in matches], dtype=np.float64)    # (参照x, 参照y, 映像x, 映像y)
+        spread = np.ptp(points[:, :2], axis=0).max() if len(points) >= 2 else 0.0
+
+        if spread >= 200:
+            # [x 1 0] [scale offset_x offset_y]^T = 映像x, [y 0 1] ... = 映像y
+            count = len(points)
+            a = np.zeros((count * 2, 3))
+            a[:count, 0], a[:count, 1] = points[:, 0], 1.0
+            a[count:, 0], a[count:, 2] = points[:, 1], 1.0
+            b = np.concatenate([points[:, 2], points[:, 3]])
+            scale, offset_x, offset_y = np.linalg.lstsq(a, b, rcond=None)[0]
+        else:
+            weights = np.array([match[0] for match in matches])
+            scale = float(np.average([match[1] for match in matches], weights=weights))
+            offset_x = float(np.average(points[:, 2] - scale * points[:, 0], weights=weights))
+            offset_y = float(np.average(points[:, 3] - scale * points[:, 1], weights=weights))
+
+        if abs(scale - 1.0) > max_scale_error:
+            return None
+        return CaptureGeometry(scale, offset_x, offset_y)
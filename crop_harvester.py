@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import queue
+import threading
+
+import cv2
+import numpy as np
+from array_backend import to_numpy
+
+from event_bus import event_bus, CaptureError
+
+
+"""学習データ収集用 アイコン切り抜き画像保存クラス"""
+class CropHarvester:
+    # ハッシュ比較用の縮小サイズ(8x8 = 64bit)
+    HASH_SIZE = 8
+    # 書き込みスレッドが停止を確認する間隔(秒)
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, output_dir="./harvest", max_queue=64, hash_distance=4, max_hashes_per_label=256):
+        """
+        Args:
+        - output_dir (str): 切り抜き画像と推論結果の保存先
+        - max_queue (int): 書き込み待ちキューの最大数(溢れた分は破棄)
+        - hash_distance (int): 同一画像とみなすハッシュのハミング距離
+        - max_hashes_per_label (int): ラベルごとに保持するハッシュ数の上限
+        """
+        self.output_dir = output_dir
+        self.hash_distance = hash_distance
+        self.max_hashes_per_label = max_hashes_per_label
+
+        # 書き込み待ちキュー(認識処理を止めないようにput_nowaitのみ使用)
+        self.crop_queue = queue.Queue(maxsize=max_queue)
+
+        # ラベルごとの保存済みハッシュ
+        self.saved_hashes = {}
+
+        # 統計情報
+        self.saved_count = 0        # 保存した枚数
+        self.duplicate_count = 0    # 重複で破棄した枚数
+        self.dropped_count = 0      # キューが溢れて破棄した回数
+
+        self.is_running = False
+        self.writer_thread = None
+        self.stop_event = None
+
+    def start(self):
+        """
+        書き込みスレッドを開始
+        """
+        if self.is_running:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.is_running = True
+        # スレッドごとの停止フラグ(停止が間に合わず再開した場合も古いスレッドは終了する)
+        self.stop_event = threading.Event()
+        self.writer_thread = threading.Thread(target=self._writer_loop, args=(self.stop_event,), daemon=True)
+        self.writer_thread.start()
+
+    def stop(self):
+        """
+        書き込みスレッドを停止(キューに残った分は書き出してから終了)
+        """
+        if not self.is_running:
+            return
+        self.is_running = False
+        self.stop_event.set()
+        try:
+            self.crop_queue.put(None, timeout=self.POLL_INTERVAL)   # 待機中のget()をすぐ起こす
+        except queue.Full:
+            pass    # キューが溢れていても書き込みスレッドは停止フラグで終了する
+        self.writer_thread.join(timeout=2.0)
+        self.writer_thread = None
+
+    def submit(self, images, labels, confidences, side):
+        """
+        切り抜き画像と推論結果を書き込みキューに追加する
+        認識処理から呼ばれるため、ブロックせずキューが溢れていれば破棄する
+
+        Args:
+        - images[] (cupy or numpy): 切り抜かれたアイコン画像
+        - labels[] (int): 推測ラベル
+        - confidences[] (float): 推測ラベルの確率
+        - side (str): "my" or "opponent"
+        """
+        if not self.is_running:
+            return
+        try:
+            self.crop_queue.put_nowait((list(images), list(labels), list(confidences), side, time.time()))
+        except queue.Full:
+            self.dropped_count += 1
+
+    def _writer_loop(self, stop_event):
+        """
+        キューから取り出して重複を除いて保存する(停止後はキューが空になったら終了)
+        """
+        while True:
+            try:
+                item = self.crop_queue.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                if stop_event.is_set():
+                    break
+                continue
+            if item is None:
+                if stop_event.is_set():
+                    break
+                continue    # 前回の停止で残った停止要求
+            try:
+                self._write_crops(*item)
+            except Exception as e:
+                event_bus.publish(CaptureError("crop_harvester", "切り抜き画像保存エラー: " + str(e)))
+
+    def _write_crops(self, images, labels, confidences, side, timestamp):
+        """
+        Args:
+        - images[] (cupy or numpy): 切り抜かれたアイコン画像
+        - labels[] (int): 推測ラベル
+        - confidences[] (float): 推測ラベルの確率
+        - side (str): "my" or "opponent"
+        - timestamp (float): キャプチャー時刻
+        """
+        records = []
+        for slot, (img, label, confidence) in enumerate(zip(images, labels, confidences)):
+            # GPUからの転送は書き込みスレッド側で行う
+            img = to_numpy(img)
+            img = np.ascontiguousarray(img, dtype=np.uint8)
+
+            crop_hash = self.difference_hash(img)
+            if self._is_duplicate(int(label), crop_hash):
+                self.duplicate_count += 1
+                continue
+
+            label_dir = os.path.join(self.output_dir, f"{int(label):04d}")
+            os.makedirs(label_dir, exist_ok=True)
+            file_name = f"{side}_{int(timestamp * 1000)}_{slot}_{crop_hash:016x}.png"
+            cv2.imwrite(os.path.join(label_dir, file_name), cv2.cvtColor(img, cv2.COLOR_RGB2BGR))
+
+            records.append({
+                'file': os.path.join(f"{int(label):04d}", file_name),
+                'label': int(label),
+                'confidence': float(confidence),
+                'side': side,
+                'slot': slot,
+                'timestamp': timestamp,
+                'hash': f"{crop_hash:016x}",
+            })
+            self.saved_count += 1
+
+        # 推論結果はJSON Linesで追記
+        if records:
+            with open(os.path.join(self.output_dir, "labels.jsonl"), "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+
+    def _is_duplicate(self, label, crop_hash):
+        """
+        同じラベルの保存済み画像とハッシュが近ければ重複とみなす
+
+        Args:
+        - label (int): 推測ラベル
+        - crop_hash (int): 画像のハッシュ値
+
+        Return:
+        - True or False: 重複しているか
+        """
+        hashes = self.saved_hashes.setdefault(label, [])
+        for saved_hash in hashes:
+            if bin(saved_hash ^ crop_hash).count("1") <= self.hash_distance:
+                return True
+
+        hashes.append(crop_hash)
+        if len(hashes) > self.max_hashes_per_label:
+            hashes.pop(0)
+        return False
+
+    @classmethod
+    def difference_hash(cls, img):
+        """
+        差分ハッシュ(dHash)で画像の64bitハッシュを計算する
+        明るさやわずかなノイズの違いでは値が変わりにくい
+
+        Args:
+        - img (numpy): RGB画像
+
+        Return:
+        - crop_hash (int): 64bitハッシュ値
+        """
+        gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+        small = cv2.resize(gray, (cls.HASH_SIZE + 1, cls.HASH_SIZE), interpolation=cv2.INTER_AREA)
+        bits = (small[:, 1:] > small[:, :-1]).flatten()
+        return int(np.packbits(bits).view('>u8')[0])
@@ -0,0 +1,164 @@
+import sys
+import json
+import time
+import queue
+import threading
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from typing import ClassVar, List, Optional
+
+
+"""イベント定義"""
+@dataclass(frozen=True)
+class Event:
+    kind: ClassVar[str] = "event"
+    timestamp: float = field(default_factory=time.time, kw_only=True)
+
+    def to_dict(self):
+        data = asdict(self)
+        data['kind'] = self.kind
+        return data
+
+@dataclass(frozen=True)
+class SceneChanged(Event):
+    """シーン遷移"""
+    kind: ClassVar[str] = "scene_changed"
+    scene: str
+    previous: str
+    frame_time: Optional[float] = None      # 判定に使ったフレームの時刻(media_clock)
+
+@dataclass(frozen=True)
+class PartyRecognized(Event):
+    """パーティ認識結果"""
+    kind: ClassVar[str] = "party_recognized"
+    side: str                   # "my" or "opponent"
+    labels: List[int]
+    confidences: List[float]
+
+@dataclass(frozen=True)
+class CaptureError(Event):
+    """キャプチャー・認識処理のエラー"""
+    kind: ClassVar[str] = "capture_error"
+    source: str
+    message: str
+
+@dataclass(frozen=True)
+class AudioCueDetected(Event):
+    """効果音・ジングルの検出"""
+    kind: ClassVar[str] = "audio_cue"
+    cue: str
+    scene: str
+    confidence: float
+    audio_time: Optional[float] = None      # 音声の先頭の時刻(media_clock)
+
+@dataclass(frozen=True)
+class CaptureCalibrated(Event):
+    """キャプチャー位置の補正値の確定 (映像の座標 = scale * 参照の座標 + offset)"""
+    kind: ClassVar[str] = "capture_calibrated"
+    device: str
+    scale: float
+    offset_x: float
+    offset_y: float
+
+@dataclass(frozen=True)
+class TimingSample(Event):
+    """処理時間の計測値"""
+    kind: ClassVar[str] = "timing"
+    name: str
+    duration_ms: float
+
+
+"""イベントバス"""
+class EventBus:
+
+    def __init__(self, capacity=1024):
+        """
+        Args:
+        - capacity (int): 保持する直近イベント数(リングバッファ)
+        """
+        self.history = deque(maxlen=capacity)
+        self.sinks = []
+
+    def publish(self, event):
+        """
+        イベントを発行する
+        各Sinkへの通知はキューへの追加のみで、書き出し・表示はSink側で行う
+
+        Args:
+        - event (Event): 発行するイベント
+        """
+        self.history.append(event)
+        for sink in self.sinks:
+            sink.push(event)
+
+    def add_sink(self, sink):
+        self.sinks = self.sinks + [sink]
+
+    def remove_sink(self, sink):
+        self.sinks = [s for s in self.sinks if s is not sink]
+
+    def recent(self, kind=None, count=None):
+        """
+        直近のイベントを返す
+
+        Args:
+        - kind (str): イベントの種類で絞り込む(Noneなら全て)
+        - count (int): 最大件数(Noneなら全て)
+
+        Return:
+        - events[] (Event): 古い順
+        """
+        events = [event for event in list(self.history) if kind is None or event.kind == kind]
+        return events[-count:] if count else events
+
+
+"""JSON Lines形式でファイル(または標準出力)へ書き出すSink"""
+class JsonLinesSink:
+
+    def __init__(self, path=None, stream=None, max_queue=1024, kinds=None):
+        """
+        Args:
+        - path (str): 書き出し先ファイル(追記)
+        - stream: 書き出し先ストリーム(pathがNoneの場合、既定は標準出力)
+        - max_queue (int): 書き込み待ちの最大数(溢れた分は破棄)
+        - kinds (set): 書き出すイベントの種類(Noneなら全て)
+        """
+        self.file = open(path, "a", encoding="utf-8") if path else None
+        self.stream = self.file or stream or sys.stdout
+        self.kinds = kinds
+        self.event_queue = queue.Queue(maxsize=max_queue)
+        self.dropped_count = 0
+
+        self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer_thread.start()
+
+    def push(self, event):
+        if self.kinds is not None and event.kind not in self.kinds:
+            return
+        try:
+            self.event_queue.put_nowait(event)
+        except queue.Full:
+            self.dropped_count += 1
+
+    def _writer_loop(self):
+        while True:
+            event = self.event_queue.get()
+            if event is None:
+                break
+            try:
+                self.stream.write(json.dumps(event.to_dict(), ensure_ascii=False) + "\n")
+                # まとめて書いてからflush
+                if self.event_queue.empty():
+                    self.stream.flush()
+            except (OSError, ValueError):
+                pass
+
+    def close(self):
+        self.event_queue.put(None)
+        self.writer_thread.join(timeout=1.0)
+        if self.file is not None:
+            self.file.close()
+
+
+"""アプリ全体で共有するイベントバス"""
+event_bus = EventBus()
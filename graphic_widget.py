@@ -2,38 +2,61 @@ import numpy as np
 import cv2
 import time
 import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import OpenGL.GL as gl
-import cupy as cp
+import array_backend
 
 from PyQt5.QtCore import Qt, QTimer, QObject, pyqtSignal
 import PyQt5.QtOpenGL as QtOpenGL
 """"""
 from party_pokemon_dock import PartyPokemonsDock
 from scene_recognizer import SceneRecognizer, GameScene
-from icon_capture import IconCapture
+from scene_scheduler import SceneScheduler
+from capture_geometry import CaptureCalibrator, apply_geometry
+from icon_capture import IconCapture, TeamSwitchDetector, IconStabilityDetector
+from inference_worker import InferenceWorker
+from pokemon import PokemonData
+from matchup_engine import MatchupEngine
+from event_bus import event_bus, SceneChanged, PartyRecognized, CaptureError, CaptureCalibrated, TimingSample
+import media_clock
+from startup_profiler import startup_profiler
 
 """映像表示クラス"""
 class MainGraphicWidget(QtOpenGL.QGLWidget):
     """エラーメッセージ送信"""
     error_signal = pyqtSignal(Exception)
+    """キャプチャー位置の推定結果(推定スレッド -> GUIスレッド)"""
+    calibration_signal = pyqtSignal(object)
 
-    def __init__(self, main_window=None, parent=None):
+    def __init__(self, main_window=None, parent=None, party_surface=None, video_source=0):
+        """
+        Args:
+        - main_window (QMainWindow): パーティー表示用ドックの親
+        - parent (QWidget): 親Widget
+        - party_surface (PartySurface): 両パーティを1枚で描画する場合のSurface(Noneならドック表示)
+        - video_source (int or str): キャプチャーデバイス番号、または動画ファイル
+        """
         super().__init__(parent)
         
         # CUDA support (optional)
-        try:
-            self.CUDA_AVAILABLE = True
-        except ImportError:
-            self.CUDA_AVAILABLE = False
+        # CuPyは裏で読み込み、読み込みが終わるまではCPUで変換する
+        self.CUDA_AVAILABLE = array_backend.CUPY_AVAILABLE
+        if self.CUDA_AVAILABLE:
+            array_backend.preload_cupy()
+        else:
             print("CUDA unavailable. Falling back to CPU conversion.")
         
         """ゲーム映像キャプチャー変数"""
-        self.video_capture = VideoCapture(cuda_available=self.CUDA_AVAILABLE)
+        self.video_source = video_source
+        with startup_profiler.phase("capture_open"):
+            self.video_capture = VideoCapture(video_source, cuda_available=self.CUDA_AVAILABLE)
         self.video_capture.error_signal.connect(self.error_signal_emit)
         
         self.texture = None
         self.frame = None
+        self.frame_time = None      # self.frame の取り込み時刻(media_clock)
 
         # ゲーム映像アスペクト比維持用
         self.ASPECT_RATIO = 16/9
@@ -43,21 +66,38 @@ class MainGraphicWidget(QtOpenGL.QGLWidget):
         self.timer.timeout.connect(self.update_frame)
         self.timer.start(16)  # ~60 FPS
 
-        """シーン遷移検出用スレッド"""
+        """キャプチャー位置の補正(デバイスごとに1度だけ推定して保存)"""
+        self.calibrator = None              # 最初のフレームで作成
+        self.is_calibrating = False
+        self.calibration_signal.connect(self.apply_calibration)
+
+        """シーン遷移検出(新しいフレームごとに、シーンに応じた間隔・CPU予算で実行)"""
         self.current_scene = GameScene.OTHER_SCENE
-        self.detect_timer = QTimer(self)
-        self.detect_timer.timeout.connect(self.scene_recognition)
-        self.detect_timer.start(100)  # 0.1秒ごと
+        self.scene_scheduler = SceneScheduler(base_interval=0.1, cpu_budget=0.15)
 
         """アイコンキャプチャー用変数"""
-        self.next_predict_frame = None              # 画像推測待機用フレーム保持変数
-        self.is_predict_running = False             # 現在推論実行中フラグ
-        self.is_check_my_party_running = False      # バトルチーム確認スレッド実行中フラグ
-        self.is_captured_oppponent_party = False    # 相手パーティがキャプチャー済みかどうか
+        self.is_captured_oppponent_party = False    # 相手パーティがキャプチャー済みかどうか(この対戦で認識を開始したか)
+        self.team_switch_detector = TeamSwitchDetector()    # バトルチーム切り替え検出(フレームごと)
+        self.opponent_party_detector = IconStabilityDetector()  # 相手パーティのアイコン表示完了の検出(フレームごと)
+
+        """アイコン推論用プロセス(GUIプロセスのGILと競合しないように)"""
+        PokemonData.inference_worker = InferenceWorker()
+        PokemonData.inference_worker.start()
+
+        """両パーティの相性表(パーティ変更時に計算)"""
+        self.matchup_engine = MatchupEngine(PokemonData.pokemon_table)
+
+        """認識処理のスケジューラ(レーンごとに最新のみ実行)"""
+        self.recognition_scheduler = RecognitionScheduler(self)
+        self.recognition_scheduler.job_finished.connect(self.apply_party_recognition)
 
         """パーティー表示用ドック"""
-        self.my_party_dock = PartyPokemonsDock(Qt.LeftDockWidgetArea, main_window)
-        self.opponent_party_dock = PartyPokemonsDock(Qt.RightDockWidgetArea, main_window)
+        if party_surface is not None:
+            self.my_party_dock = party_surface.side(party_surface.MY_PARTY)
+            self.opponent_party_dock = party_surface.side(party_surface.OPPONENT_PARTY)
+        else:
+            self.my_party_dock = PartyPokemonsDock(Qt.LeftDockWidgetArea, main_window)
+            self.opponent_party_dock = PartyPokemonsDock(Qt.RightDockWidgetArea, main_window)
 
     def initializeGL(self):
         """
@@ -150,121 +190,165 @@ class MainGraphicWidget(QtOpenGL.QGLWidget):
         new_frame = self.video_capture.read_frame()
         if new_frame is not None:
             self.frame = new_frame
+            self.frame_time = self.video_capture.frame_time
+            self.process_frame(new_frame)
             self.updateGL()
+            startup_profiler.first_frame()
+            # 表示を先に済ませてから認識する
+            self.update_calibration(new_frame)
+            if self.scene_scheduler.is_due(self.frame_time):
+                self.scene_recognition()
+
+    def process_frame(self, frame):
+        """
+        新しいフレームごとの軽い検出処理
+
+        Args:
+        - frame (cupy or numpy): 新しいフレーム
+        """
+        # バトルチーム選択画面: カーソルが移動して落ち着いた時に1度だけ認識
+        if self.current_scene == GameScene.TEAM_SELECT:
+            if self.team_switch_detector.update(frame):
+                self.request_my_party_prediction(frame)
+
+        # 選出画面: 相手パーティのアイコンが出揃って止まったフレームで1度だけ認識
+        if self.current_scene == GameScene.POKEMON_SELECT and self.opponent_party_detector.is_waiting:
+            if self.opponent_party_detector.update(frame, self.frame_time):
+                event_bus.publish(TimingSample("opponent_party_wait", self.opponent_party_detector.wait_time * 1000))
+                self.recognition_scheduler.submit(RecognitionScheduler.OPPONENT_PARTY, self.predict_opponent_party, frame)
+
+    def update_calibration(self, frame):
+        """
+        デバイスの補正値を読み込む 保存されていなければ、一定間隔で別スレッドで推定する
+        """
+        if self.calibrator is None:
+            self.calibrator = CaptureCalibrator(CaptureCalibrator.device_key(self.video_source, frame.shape))
+            apply_geometry(self.calibrator.load())
+        if self.is_calibrating or not self.calibrator.is_due(self.frame_time):
+            return
+        self.is_calibrating = True
+        threading.Thread(target=self.calibrate, args=(self.calibrator, frame, self.frame_time), daemon=True).start()
+
+    def calibrate(self, calibrator, frame, frame_time):
+        """
+        キャプチャー位置を推定する(推定スレッド)
+        """
+        try:
+            geometry = calibrator.update(frame, frame_time)
+        except Exception as e:
+            event_bus.publish(CaptureError("capture_geometry", "キャプチャー位置の推定エラー: " + str(e)))
+            geometry = None
+        self.calibration_signal.emit((calibrator, geometry))
+
+    def apply_calibration(self, result):
+        """
+        推定結果を反映する(GUIスレッド)
+        """
+        calibrator, geometry = result
+        self.is_calibrating = False
+        if calibrator is self.calibrator and geometry is not None:
+            apply_geometry(geometry)
+            event_bus.publish(CaptureCalibrated(calibrator.device_key, geometry.scale, geometry.offset_x, geometry.offset_y))
+
+    def recalibrate(self):
+        """
+        保存済みの補正値を使わずに推定し直す(メニューから)
+        """
+        if self.calibrator is not None:
+            self.calibrator.reset()
 
     def scene_recognition(self):
         """
         ゲーム映像の現在のシーン遷移を検出
         """
-        current_frame = self.frame.copy()
-        SceneRecognizer.current_scene_recognition(current_frame)
+        # 推論プロセスのモデル読み込み完了を待たずに確認(起動時間の記録用)
+        if not PokemonData.inference_worker.is_ready:
+            PokemonData.inference_worker.poll_ready()
+
+        frame_time = self.frame_time
+        self.scene_scheduler.recognize(self.frame, frame_time)
         if self.current_scene is not SceneRecognizer.current_scene:
+            event_bus.publish(SceneChanged(SceneRecognizer.current_scene.value, self.current_scene.value, frame_time=frame_time))
             self.current_scene = SceneRecognizer.current_scene
 
         # 各シーンで必要な処理
         match self.current_scene:
-            case GameScene.TEAM_SELECT:
-                if not self.is_check_my_party_running:
-                    self.is_check_my_party_running = True
-                    threading.Thread(target=self.check_battle_team, daemon=True).start()
-
             case GameScene.POKEMON_SELECT:
-                if self.is_check_my_party_running:
-                    self.is_check_my_party_running = False
-
                 if not self.is_captured_oppponent_party:   
-                    threading.Thread(target=self.predict_opponent_party, daemon=True).start()
+                    self.opponent_party_detector.start(frame_time)  # 認識はprocess_frameでアイコンが止まってから
                     self.is_captured_oppponent_party = True
 
             case GameScene.VERSUS:
-                if self.is_check_my_party_running:
-                    self.is_check_my_party_running = False
                 self.is_captured_oppponent_party = False
+                self.opponent_party_detector.cancel()
 
-            case _:
-                if self.is_check_my_party_running:
-                    self.is_check_my_party_running = False
-
+            case GameScene.TEAM_SELECT:
+                pass    # チーム切り替えはprocess_frameでフレームごとに検出
 
-        try: # シーン認識確認デバッグ用
-            raise RuntimeError(self.current_scene)
-        except Exception as e:
-            e.args = ("現在のシーン: " + e.args[0],)
-            self.error_signal.emit(e)
+            case _:
+                self.team_switch_detector.reset()
 
-    def check_battle_team(self):
-        """
+    def request_my_party_prediction(self, frame):
         """
-        while self.is_check_my_party_running:
-            try:
-                current_frame = self.frame.copy()
-                start_time = time.time()  # ループ開始時間を記録
+        自分パーティの認識を依頼する。実行中の認識があればそれは破棄され、このフレームが優先される
 
-                # バトルチームが選択中で画面中央に存在するか
-                if IconCapture.verify_selected_team(current_frame):
-                    # チーム選択の変更が行われた後か
-                    if IconCapture.is_team_switch:
-                        
-                        # 現在推論が行われていないなら推論実行
-                        if not self.is_predict_running:
-                            print("現在の画像を処理")
-                            time.sleep(2/30)
-                            current_frame = self.frame.copy()
-                            threading.Thread(target=self.predict_my_party, args=(current_frame,), daemon=True).start()  
-                            self.next_predict_frame = None      # 最新のフレームで推論してるので念のため空に
-
-                        else: # 推論実行中なら推論待機に現在のフレームを追加
-                            time.sleep(2/30)
-                            if IconCapture.verify_selected_team(self.frame):
-                                self.next_predict_frame = self.frame.copy()
-                    
-                        # 推論実行したらフラグは戻す
-                        IconCapture.is_team_switch = False
-
-                else: # バトルチームが中央から動いたらフラグを立てる
-                    IconCapture.is_team_switch = True
-
-                # モデルが推論をしていないかつ推論待機画像があるなら推論実行
-                if (self.next_predict_frame is not None) and (not self.is_predict_running):
-                    print("待機画像を処理")
-                    threading.Thread(target=self.predict_my_party, args=(self.next_predict_frame.copy(),), daemon=True).start()
-                    self.next_predict_frame = None
+        Args:
+        - frame (cupy or numpy): 切り替えが確定したフレーム
+        """
+        self.recognition_scheduler.submit(RecognitionScheduler.MY_PARTY, self.predict_my_party, frame)
 
-                # 経過時間を計算し、次のフレームまで待機
-                elapsed_time = time.time() - start_time
-                sleep_time = max(0, 1/60 - elapsed_time)  # 負の値にならないように調整
-                time.sleep(sleep_time)
+    def predict_my_party(self, job, frame):
+        """
+        映像から自分パーティを認識する(ワーカースレッド)
 
-            except Exception as e:
-                e.args = ("パーティー取得エラー: " + e.args[0],)
-                self.error_signal.emit(e)
+        Args: 
+        - job (RecognitionJob): 実行中のジョブ(キャンセル確認用)
+        - frame (cupy): 画像認識を行う映像のフレーム
 
+        Return:
+        - (切り抜き画像, ラベル, 確率) キャンセルされたらNone
+        """
+        imgs_cp = IconCapture.capture_my_party(frame)       # 映像からパーティアイコンのトリミング
+        if job.is_cancelled():
+            return None
+        labels, confidences = PokemonData.recognize_pokemon_icon_with_confidence(imgs_cp)  # トリミングされた画像からポケモン推測
+        return imgs_cp, labels, confidences
 
-    def predict_my_party(self, frame):
+    def predict_opponent_party(self, job, frame):
         """
-        映像から自分パーティを認識する
+        映像から相手パーティを認識する(ワーカースレッド)
 
         Args: 
-        - frame (cupy): 画像認識を行う映像のフレーム
+        - job (RecognitionJob): 実行中のジョブ(キャンセル確認用)
+        - frame (cupy): アイコンの表示完了を検出したフレーム
+
+        Return:
+        - (切り抜き画像, ラベル, 確率) キャンセルされたらNone
         """
-        # time.sleep(0.05)    # 完全にチームが中央に来るのを待つ
-        imgs_cp = IconCapture.capture_my_party(frame)       # 映像からパーティアイコンのトリミング
-        if not self.is_predict_running: # 念のため再チェック
-            self.is_predict_running = True
-            self.my_party_dock.set_pokemon_icon(imgs_cp)        # トリミングされた画像からポケモン推測及び画像表示
-            self.is_predict_running = False
+        if job.is_cancelled():
+            return None
+        imgs_cp = IconCapture.capture_opponent_party(frame)
+        labels, confidences = PokemonData.recognize_pokemon_icon_with_confidence(imgs_cp)  # トリミングされた画像からポケモン推測
+        return imgs_cp, labels, confidences
 
-    def predict_opponent_party(self):
+    def apply_party_recognition(self, lane, result):
         """
-        映像から相手パーティを認識する
+        認識結果をドックに反映する(GUIスレッド)
+
+        Args:
+        - lane (str): ジョブのレーン名
+        - result (tuple): (切り抜き画像, ラベル, 確率)
         """
-        time.sleep(0.5)   # 念のためアイコン読み込みを待つ
-        current_frame = self.frame.copy()
-        imgs_cp = IconCapture.capture_opponent_party(current_frame)
-        if not self.is_predict_running: # 念のため再チェック
-            self.is_predict_running = True
-            self.opponent_party_dock.set_pokemon_icon(imgs_cp)        # トリミングされた画像からポケモン推測及び画像表示
-            self.is_predict_running = False
+        imgs_cp, labels, confidences = result
+        if lane == RecognitionScheduler.MY_PARTY:
+            dock, side = self.my_party_dock, "my"
+        else:
+            dock, side = self.opponent_party_dock, "opponent"
+
+        dock.set_party_labels(labels)  # 画像表示
+        self.matchup_engine.set_party(side, labels)
+        event_bus.publish(PartyRecognized(side, list(labels), list(confidences)))
+        IconCapture.harvest(imgs_cp, labels, confidences, side)
 
 
     def get_my_party_dock(self):
@@ -282,6 +366,8 @@ class MainGraphicWidget(QtOpenGL.QGLWidget):
         """
         self.video_capture.stop_capture()
         self.video_capture.start_capture(device_index)
+        self.video_source = device_index
+        self.calibrator = None  # デバイスごとの補正値を読み込み直す
 
     def error_signal_emit(self, error):
         """
@@ -294,9 +380,150 @@ class MainGraphicWidget(QtOpenGL.QGLWidget):
         Cleanup on window close
         """
         self.video_capture.stop_capture()
+        self.recognition_scheduler.shutdown()
+        if PokemonData.inference_worker is not None:
+            PokemonData.inference_worker.stop()
+            PokemonData.inference_worker = None
+        PokemonData.pixmap_cache.save_usage()
         super().closeEvent(event)
 
 
+"""認識ジョブ"""
+class RecognitionJob:
+
+    def __init__(self, lane, generation, fn, args):
+        self.lane = lane
+        self.generation = generation        # レーン内の通し番号(大きいほど新しい)
+        self.fn = fn
+        self.args = args
+        self.submitted_at = time.perf_counter()
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def is_cancelled(self):
+        return self.cancelled.is_set()
+
+
+"""認識ジョブのスケジューラ"""
+class RecognitionScheduler(QObject):
+    """認識完了シグナル (レーン名, 結果) GUIスレッドで受け取る"""
+    job_finished = pyqtSignal(str, object)
+
+    MY_PARTY = "my_party"
+    OPPONENT_PARTY = "opponent_party"
+
+    def __init__(self, parent=None, max_workers=2, metrics_size=64):
+        """
+        レーンごとに実行中1件・待機1件までとし、新しいジョブが来たら古いジョブは破棄する
+
+        Args:
+        - max_workers (int): ワーカースレッド数の上限
+        - metrics_size (int): レーンごとに保持する計測値の数
+        """
+        super().__init__(parent)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="recognition")
+        self.lock = threading.Lock()
+        self.generations = {}   # レーン -> 最新の通し番号
+        self.running = {}       # レーン -> 実行中のジョブ
+        self.pending = {}       # レーン -> 待機中のジョブ
+        self.metrics_size = metrics_size
+        self.latencies = {}     # レーン -> deque[(待ち時間ms, 実行時間ms)]
+        self.counters = {}      # レーン -> {'submitted', 'coalesced', 'cancelled', 'completed', 'failed'}
+
+    def submit(self, lane, fn, *args):
+        """
+        ジョブを追加する。fn(job, *args) がワーカースレッドで実行され、結果がjob_finishedで届く
+
+        Args:
+        - lane (str): レーン名
+        - fn (callable): 実行する関数
+        """
+        with self.lock:
+            generation = self.generations.get(lane, 0) + 1
+            self.generations[lane] = generation
+            job = RecognitionJob(lane, generation, fn, args)
+            counters = self._counters(lane)
+            counters['submitted'] += 1
+
+            # 実行中のジョブは結果を使わない
+            running = self.running.get(lane)
+            if running is not None:
+                running.cancel()
+                counters['cancelled'] += 1
+                # 待機中のジョブは最新のものに置き換え
+                if self.pending.get(lane) is not None:
+                    counters['coalesced'] += 1
+                self.pending[lane] = job
+                return job
+
+            self.running[lane] = job
+        self.executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        started_at = time.perf_counter()
+        result = None
+        error = None
+        try:
+            if not job.is_cancelled():
+                result = job.fn(job, *job.args)
+        except Exception as e:
+            error = e
+        finished_at = time.perf_counter()
+
+        with self.lock:
+            if error is not None:
+                self._counters(job.lane)['failed'] += 1
+            is_latest = job.generation == self.generations.get(job.lane)
+            next_job = self.pending.pop(job.lane, None)
+            self.running[job.lane] = next_job
+            if result is not None and is_latest and not job.is_cancelled():
+                self._counters(job.lane)['completed'] += 1
+                self.latencies.setdefault(job.lane, deque(maxlen=self.metrics_size)).append(
+                    ((started_at - job.submitted_at) * 1000.0, (finished_at - started_at) * 1000.0))
+            else:
+                result = None
+
+        if next_job is not None:
+            self.executor.submit(self._run, next_job)
+        if error is not None:
+            event_bus.publish(CaptureError(job.lane, "パーティー取得エラー: " + str(error)))
+        if result is not None:
+            event_bus.publish(TimingSample(job.lane, (finished_at - job.submitted_at) * 1000.0))
+            self.job_finished.emit(job.lane, result)
+
+    def _counters(self, lane):
+        return self.counters.setdefault(lane, {'submitted': 0, 'coalesced': 0, 'cancelled': 0, 'completed': 0, 'failed': 0})
+
+    def metrics(self, lane):
+        """
+        レーンの計測値
+
+        Return:
+        - dict: 件数と待ち時間・実行時間(ms)の平均と最大
+        """
+        with self.lock:
+            samples = list(self.latencies.get(lane, []))
+            metrics = dict(self._counters(lane))
+        if samples:
+            waits, runs = np.array(samples).T
+            metrics.update({
+                'wait_ms_mean': float(waits.mean()), 'wait_ms_max': float(waits.max()),
+                'run_ms_mean': float(runs.mean()), 'run_ms_max': float(runs.max()),
+            })
+        return metrics
+
+    def shutdown(self):
+        with self.lock:
+            for lane in list(self.running):
+                if self.running[lane] is not None:
+                    self.running[lane].cancel()
+            self.pending.clear()
+        self.executor.shutdown(wait=False)
+
+
 class VideoCapture(QObject):
     error_signal = pyqtSignal(Exception)
 
@@ -306,6 +533,7 @@ class VideoCapture(QObject):
         """
         super().__init__()
         self.CUDA_AVAILABLE = cuda_available
+        self.frame_time = None  # 最後に読み込んだフレームの取り込み時刻(media_clock)
 
         self.start_capture(device_index)
 
@@ -326,9 +554,12 @@ class VideoCapture(QObject):
         ret, frame = self.cap.read()
         if not ret:
             return None
+        # read()が返った時点を取り込み時刻とする(音声ブロックと同じ時計)
+        self.frame_time = media_clock.now()
         
-        # GPU-based color conversion if CUDA available
-        if self.CUDA_AVAILABLE:
+        # GPU-based color conversion if CUDA available (CuPyの読み込みが終わってから)
+        cp = array_backend.cp
+        if self.CUDA_AVAILABLE and cp is not None:
             gpu_frame = cp.asarray(frame)
             return gpu_frame[:, :, ::-1]  # BGR to RGB
         
@@ -336,7 +567,10 @@ class VideoCapture(QObject):
     
     def start_capture(self, device_index=0):
         try:
-            self.cap = cv2.VideoCapture(device_index, cv2.CAP_DSHOW)
+            if isinstance(device_index, str):
+                self.cap = cv2.VideoCapture(device_index)   # 録画した動画
+            else:
+                self.cap = cv2.VideoCapture(device_index, cv2.CAP_DSHOW)
             
             # Optimized capture settings
             self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
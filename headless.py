@@ -0,0 +1,367 @@
+"""
+ヘッドレス実行 (Qt・OpenGLを使わない)
+
+キャプチャー → シーン認識 → パーティ認識 を行い、結果をJSON Lines形式のイベントで
+標準出力またはソケットへ書き出す (大会配信のオーバーレイ用サーバーなど)
+
+使い方:
+    python app.py --headless --source 0 --output -
+    python app.py --headless --source match.mp4 --output 127.0.0.1:9000
+"""
+import sys
+import time
+import socket
+import argparse
+
+import cv2
+
+import media_clock
+from startup_profiler import startup_profiler
+from event_bus import event_bus, JsonLinesSink, SceneChanged, PartyRecognized, CaptureError, CaptureCalibrated, TimingSample
+from scene_recognizer import SceneRecognizer, GameScene
+from scene_scheduler import SceneScheduler
+from icon_capture import IconCapture, TeamSwitchDetector, IconStabilityDetector
+from icon_recognizer import IconRecognizer
+from capture_geometry import CaptureCalibrator, apply_geometry
+
+
+"""キャプチャーから認識までを1スレッドで行うクラス"""
+class HeadlessPipeline:
+    def __init__(self, source=0, max_fps=30.0, scene_interval=0.1, timing_interval=5.0, use_worker=False, realtime=False,
+                 cpu_budget=None, calibration="auto"):
+        """
+        Args:
+        - source (int or str): キャプチャーデバイス番号、または動画ファイル・URL
+        - max_fps (float): 処理するフレーム数の上限(超えた分はデコードせずに捨てる)
+        - scene_interval (float): シーン認識の基準の間隔(秒) シーンごとの倍率は SceneScheduler を参照
+        - timing_interval (float): シーン認識の処理時間をまとめて出力する間隔(秒)
+        - use_worker (bool): アイコン認識を別プロセスで行うか
+        - realtime (bool): 動画ファイルを実時間で再生するか(Falseなら可能な限り速く処理)
+        - cpu_budget (float): 映像1秒あたりにシーン認識へ使ってよい時間(秒) Noneなら制限しない
+        - calibration (str): キャプチャー位置の補正 "auto" 保存済みの値を使い、無ければ推定する
+                             "recalibrate" 推定し直す, "off" 補正しない
+        """
+        self.source = source
+        self.frame_interval = 1.0 / max_fps if max_fps else 0.0
+        self.scene_scheduler = SceneScheduler(base_interval=scene_interval, cpu_budget=cpu_budget)
+        self.timing_interval = timing_interval
+        self.realtime = realtime
+
+        self.cap = None
+        self.clock_origin = None    # 動画ファイルの再生位置0の時刻
+        self.is_running = False
+        self.frame_count = 0
+
+        # シーン・パーティの状態(MainGraphicWidgetと同じ)
+        self.current_scene = GameScene.OTHER_SCENE
+        self.is_captured_oppponent_party = False
+        self.team_switch_detector = TeamSwitchDetector()
+        self.opponent_party_detector = IconStabilityDetector()
+
+        # キャプチャー位置の補正(最初のフレームで読み込み・推定を始める)
+        self.calibration = calibration
+        self.calibrator = None
+
+        # 処理時間の集計
+        self.scene_durations = []
+        self.last_timing_report = None
+
+        # アイコン認識
+        self.inference_worker = None
+        if use_worker:
+            from inference_worker import InferenceWorker
+            self.inference_worker = InferenceWorker()
+            self.inference_worker.start()
+
+    def open(self):
+        """
+        キャプチャーデバイス(または動画)を開く
+        """
+        if isinstance(self.source, int):
+            self.cap = cv2.VideoCapture(self.source, cv2.CAP_DSHOW if sys.platform == "win32" else cv2.CAP_ANY)
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
+            self.cap.set(cv2.CAP_PROP_FPS, 60)
+        else:
+            self.cap = cv2.VideoCapture(self.source)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Could not open video source: {self.source}")
+
+    def run(self, max_frames=None):
+        """
+        映像が終わるか stop() されるまで処理する
+
+        Args:
+        - max_frames (int): 処理するフレーム数の上限(Noneなら無制限)
+        """
+        if self.cap is None:
+            with startup_profiler.phase("capture_open"):
+                self.open()
+        source_fps = self.cap.get(cv2.CAP_PROP_FPS) or 60.0
+        is_file = not isinstance(self.source, int)
+        # 動画ファイルは再生位置で間引く(実時間に依らず同じ結果になる)
+        step = max(1, int(round(source_fps * self.frame_interval))) if is_file else 1
+        self.is_running = True
+        started = media_clock.now()
+        self.clock_origin = started if is_file else None
+        next_frame = started
+
+        while self.is_running:
+            # 上限を超えるフレームはデコードせずに捨てる
+            if is_file:
+                if not all(self.cap.grab() for _ in range(step - 1)):
+                    break
+            else:
+                now = media_clock.now()
+                if now < next_frame:
+                    if not self.cap.grab():
+                        break
+                    continue
+                next_frame = max(next_frame + self.frame_interval, now)
+
+            frame, frame_time = self.read_frame()
+            if frame is None:
+                if is_file:
+                    break
+                continue
+            self.process_frame(frame, frame_time)
+            if self.frame_count == 0:
+                startup_profiler.first_frame()
+
+            self.frame_count += 1
+            if max_frames is not None and self.frame_count >= max_frames:
+                break
+            if is_file and self.realtime:
+                delay = frame_time + step / source_fps - media_clock.now()
+                if delay > 0:
+                    time.sleep(delay)
+
+        self.report_timing(force=True)
+
+    def stop(self):
+        self.is_running = False
+
+    def close(self):
+        """
+        キャプチャーと推論プロセスを終了
+        """
+        self.stop()
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        if self.inference_worker is not None:
+            self.inference_worker.stop()
+            self.inference_worker = None
+
+    def read_frame(self):
+        """
+        Return:
+        - frame (numpy): RGB画像 (読めなければNone)
+        - frame_time (float): 取り込み時刻(media_clock) 動画ファイルは開始時刻+再生位置
+        """
+        ret, frame = self.cap.read()
+        if not ret:
+            return None, None
+        if self.clock_origin is None:
+            frame_time = media_clock.now()
+        else:
+            frame_time = self.clock_origin + self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), frame_time
+
+    def process_frame(self, frame, frame_time):
+        """
+        フレームごとの処理(GUI版のupdate_frame・scene_recognitionをまとめたもの)
+        """
+        if self.calibration != "off":
+            self.update_calibration(frame, frame_time)
+
+        # バトルチーム選択画面: カーソルが落ち着いた時に1度だけ認識
+        if self.current_scene == GameScene.TEAM_SELECT:
+            if self.team_switch_detector.update(frame):
+                self.recognize_party("my", IconCapture.capture_my_party(frame))
+
+        # 選出画面: 相手パーティのアイコンが出揃って止まったフレームで1度だけ認識
+        if self.current_scene == GameScene.POKEMON_SELECT and self.opponent_party_detector.is_waiting:
+            if self.opponent_party_detector.update(frame, frame_time):
+                event_bus.publish(TimingSample("opponent_party_wait", self.opponent_party_detector.wait_time * 1000))
+                self.recognize_party("opponent", IconCapture.capture_opponent_party(frame))
+
+        if self.scene_scheduler.is_due(frame_time):
+            self.scene_recognition(frame, frame_time)
+
+    def update_calibration(self, frame, frame_time):
+        """
+        デバイスの補正値を読み込む 保存されていなければ、一定間隔で推定する(推定中はそのフレームの処理が遅れる)
+        """
+        if self.calibrator is None:
+            self.calibrator = CaptureCalibrator(CaptureCalibrator.device_key(self.source, frame.shape))
+            apply_geometry(None if self.calibration == "recalibrate" else self.calibrator.load())
+        if not self.calibrator.is_due(frame_time):
+            return
+        geometry = self.calibrator.update(frame, frame_time)
+        if geometry is not None:
+            apply_geometry(geometry)
+            event_bus.publish(CaptureCalibrated(self.calibrator.device_key, geometry.scale, geometry.offset_x, geometry.offset_y))
+
+    def scene_recognition(self, frame, frame_time):
+        """
+        シーン遷移を検出してイベントを発行する
+        """
+        start = time.perf_counter()
+        self.scene_scheduler.recognize(frame, frame_time)
+        self.scene_durations.append(time.perf_counter() - start)
+        self.report_timing()
+
+        if self.current_scene is SceneRecognizer.current_scene:
+            return
+        event_bus.publish(SceneChanged(SceneRecognizer.current_scene.value, self.current_scene.value, frame_time=frame_time))
+        self.current_scene = SceneRecognizer.current_scene
+
+        match self.current_scene:
+            case GameScene.POKEMON_SELECT:
+                if not self.is_captured_oppponent_party:
+                    self.opponent_party_detector.start(frame_time)
+                    self.is_captured_oppponent_party = True
+            case GameScene.VERSUS:
+                self.is_captured_oppponent_party = False
+                self.opponent_party_detector.cancel()
+            case GameScene.TEAM_SELECT:
+                pass
+            case _:
+                self.team_switch_detector.reset()
+
+    def recognize_party(self, side, images):
+        """
+        切り抜いたアイコンを認識してイベントを発行する
+
+        Args:
+        - side (str): "my" or "opponent"
+        - images[] (numpy): 切り抜かれたアイコン画像
+        """
+        start = time.perf_counter()
+        try:
+            if self.inference_worker is not None:
+                # ライブ・実時間再生ではモデルの読み込みを待たない(映像の処理を止めないように)
+                is_live = self.realtime or isinstance(self.source, int)
+                labels, confidences = self.inference_worker.recognize(images, ready_timeout=0.0 if is_live else None)
+            else:
+                labels, confidences = IconRecognizer.recognize(images)
+        except Exception as e:
+            event_bus.publish(CaptureError("headless", "アイコン認識エラー: " + str(e)))
+            if self.inference_worker is not None:
+                self.inference_worker.recover(e)
+            return
+        event_bus.publish(TimingSample(f"recognize_{side}_party", (time.perf_counter() - start) * 1000))
+        event_bus.publish(PartyRecognized(side, [int(label) for label in labels], [float(c) for c in confidences]))
+        IconCapture.harvest(images, labels, confidences, side)
+
+    def report_timing(self, force=False):
+        """
+        シーン認識の平均処理時間を一定間隔でまとめて発行する
+        """
+        now = media_clock.now()
+        if self.last_timing_report is None:
+            self.last_timing_report = now
+        if not self.scene_durations or (not force and now - self.last_timing_report < self.timing_interval):
+            return
+        mean = sum(self.scene_durations) / len(self.scene_durations)
+        event_bus.publish(TimingSample("scene_recognition", mean * 1000))
+        self.scene_durations = []
+        self.last_timing_report = now
+
+
+def open_output(target, kinds=None):
+    """
+    イベントの書き出し先を作る
+
+    Args:
+    - target (str): "-" なら標準出力、"host:port" ならTCPソケット、それ以外はファイル
+    - kinds (set): 書き出すイベントの種類(Noneなら全て)
+
+    Return:
+    - sink (JsonLinesSink)
+    - connection (socket): TCPソケット(それ以外はNone) sinkを閉じた後に閉じる
+    """
+    if target == "-":
+        return JsonLinesSink(stream=sys.stdout, kinds=kinds), None
+    host, separator, port = target.rpartition(":")
+    if separator and port.isdigit():
+        connection = socket.create_connection((host or "127.0.0.1", int(port)))
+        return JsonLinesSink(stream=connection.makefile("w", encoding="utf-8"), kinds=kinds), connection
+    return JsonLinesSink(path=target, kinds=kinds), None
+
+
+def parse_source(source):
+    """
+    数字ならデバイス番号、それ以外はファイル・URL
+    """
+    return int(source) if source.isdigit() else source
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless capture and recognition")
+    parser.add_argument("--source", default="0", help="キャプチャーデバイス番号、または動画ファイル・URL")
+    parser.add_argument("--output", default="-", help="'-' (標準出力), 'host:port' (TCP), またはファイル")
+    parser.add_argument("--events", nargs="*", default=None, help="出力するイベントの種類 (既定は全て)")
+    parser.add_argument("--max-fps", type=float, default=30.0, help="処理するフレーム数の上限")
+    parser.add_argument("--scene-interval", type=float, default=0.1, help="シーン認識の基準の間隔(秒)")
+    parser.add_argument("--calibration", choices=["auto", "recalibrate", "off"], default="auto",
+                        help="キャプチャー位置の補正 (auto: 保存済みの値を使い、無ければ推定する)")
+    parser.add_argument("--cpu-budget", type=float, default=None, help="映像1秒あたりにシーン認識へ使ってよい時間(秒)")
+    parser.add_argument("--worker", action="store_true", help="アイコン認識を別プロセスで行う")
+    parser.add_argument("--realtime", action="store_true", help="動画ファイルを実時間で処理する")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--match-db", default=None, help="対戦記録を保存するSQLiteファイル (既定は保存しない)")
+    parser.add_argument("--overlay-port", type=int, default=None, help="配信オーバーレイ用サーバーのポート (既定は起動しない)")
+    args = parser.parse_args(argv)
+
+    sink, connection = open_output(args.output, set(args.events) if args.events else None)
+    event_bus.add_sink(sink)
+    match_store = None
+    if args.match_db:
+        from match_store import MatchStore
+        match_store = MatchStore(args.match_db)
+        event_bus.add_sink(match_store)
+    overlay_server = None
+    if args.overlay_port is not None:
+        from overlay_server import OverlayServer
+        from pokemon_table import PokemonTable
+        from sprite_atlas import SpriteAtlas
+        overlay_server = OverlayServer(port=args.overlay_port, table=PokemonTable.load(), atlas=SpriteAtlas.load())
+        try:
+            overlay_server.start()
+        except OSError as e:
+            event_bus.publish(CaptureError("overlay", f"オーバーレイサーバーを起動できません (ポート {args.overlay_port}): {e}"))
+            overlay_server = None
+        else:
+            event_bus.add_sink(overlay_server)
+
+    pipeline = HeadlessPipeline(parse_source(args.source), max_fps=args.max_fps, scene_interval=args.scene_interval,
+                                use_worker=args.worker, realtime=args.realtime, cpu_budget=args.cpu_budget,
+                                calibration=args.calibration)
+    try:
+        pipeline.run(max_frames=args.max_frames)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        event_bus.publish(CaptureError("headless", str(e)))
+    finally:
+        pipeline.close()
+        event_bus.remove_sink(sink)
+        sink.close()
+        if connection is not None:
+            try:
+                sink.stream.close()     # makefile() のバッファを書き出してから閉じる
+            except OSError:
+                pass
+            connection.close()
+        if match_store is not None:
+            event_bus.remove_sink(match_store)
+            match_store.close()
+        if overlay_server is not None:
+            event_bus.remove_sink(overlay_server)
+            overlay_server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,9 @@
 import numpy as np
-import cupy as cp
+from array_backend import to_numpy, is_gpu_array
 
-class IconCapture:
+from crop_harvester import CropHarvester
 
-    # バトルチーム切り替えフラグ
-    is_team_switch = True
+class IconCapture:
 
     # バトルチーム切り替えフラグチェック用領域
     VERIFICATION_REGION = (807, 190, 52, 52)
@@ -31,6 +30,12 @@ class IconCapture:
         (1233, 730)    # Sixth region
     ]
     OPPONENT_PARTY_REGION_SIZE = 92
+
+    # 学習データ収集用(Noneなら収集しない)
+    harvester = None
+
+    # キャプチャー位置の補正 (CaptureGeometry, Noneなら補正なし) 上の座標は補正前の値
+    geometry = None
         
     """"""
     @classmethod
@@ -60,6 +65,42 @@ class IconCapture:
         return cls.capture_icon(frame, cls.OPPONENT_PARTY_REGIONS, cls.OPPONENT_PARTY_REGION_SIZE)
     
 
+    @classmethod
+    def enable_harvester(cls, output_dir="./harvest"):
+        """
+        切り抜き画像の収集を開始する
+
+        Args:
+        - output_dir (str): 保存先フォルダ
+        """
+        if cls.harvester is None:
+            cls.harvester = CropHarvester(output_dir)
+        cls.harvester.start()
+
+    @classmethod
+    def disable_harvester(cls):
+        """
+        切り抜き画像の収集を停止する
+        """
+        if cls.harvester is not None:
+            cls.harvester.stop()
+            cls.harvester = None
+
+    @classmethod
+    def harvest(cls, images, labels, confidences, side):
+        """
+        capture_my_party/capture_opponent_partyで切り抜いた画像を推論結果と共に収集キューへ送る
+        収集が無効なら何もしない(認識処理をブロックしない)
+
+        Args:
+        - images[] (cupy or numpy): 切り抜かれた画像
+        - labels[] (int): 推測ラベル
+        - confidences[] (float): 推測ラベルの確率
+        - side (str): "my" or "opponent"
+        """
+        if cls.harvester is not None:
+            cls.harvester.submit(images, labels, confidences, side)
+
     @classmethod
     def verify_selected_team(cls, frame):
         """
@@ -72,19 +113,20 @@ class IconCapture:
         - True or False: 特定の領域が指定した単色になっているか
         """
         start_x, start_y, width, height = IconCapture.VERIFICATION_REGION
+        if IconCapture.geometry is not None:
+            start_x, start_y, width, height = IconCapture.geometry.map_rect(start_x, start_y, width, height)
+            # 補正の丸めで縁の色が混ざらないように1ピクセル内側を見る
+            start_x, start_y, width, height = start_x + 1, start_y + 1, width - 2, height - 2
 
-        # Extract the specified region
+        # Extract the specified region (52x52のみCPUへ転送)
         region = frame[start_y:start_y+height, start_x:start_x+width]
+        region = to_numpy(region)
         
         # 目標とする色 (R, G, B) を numpy 配列にする
-        target_color = cp.array([251, 204, 0], dtype=np.uint8)
-
-        # region のデータ型を統一
-        if region.dtype != cp.uint8:
-            region = region.astype(cp.uint8)
+        target_color = np.array(IconCapture.UNIFORM_COLOR, dtype=np.uint8)
 
         # 全ピクセルが target_color と一致するか判定
-        is_uniform = cp.all(region == target_color)
+        is_uniform = bool(np.all(region == target_color))
         
         return  is_uniform
     
@@ -103,16 +145,151 @@ class IconCapture:
         """
 
         output_images = []
+        geometry = IconCapture.geometry
         # If verification passes, extract and save additional regions
         for i, (start_x, start_y) in enumerate(output_regions, 1):
+            size = trim_size
+            if geometry is not None:
+                start_x, start_y, size, _ = geometry.map_rect(start_x, start_y, trim_size, trim_size)
             # Extract region
-            if isinstance(frame, cp.ndarray):
-                output_region = frame[start_y:start_y+trim_size, start_x:start_x+trim_size, :]
+            if is_gpu_array(frame):
+                output_region = frame[start_y:start_y+size, start_x:start_x+size, :]
             else:
-                output_region = frame[start_y:start_y+trim_size, start_x:start_x+trim_size]
+                output_region = frame[start_y:start_y+size, start_x:start_x+size]
             output_images.append(output_region)
             
         return output_images
-    
-    
-    
\ No newline at end of file
+
+
+"""バトルチーム切り替え検出クラス"""
+class TeamSwitchDetector:
+
+    def __init__(self, settle_frames=4):
+        """
+        新しいフレームごとに VERIFICATION_REGION だけを調べ、
+        カーソルがチームに移動してアイコンが落ち着いた時に1度だけ通知する
+
+        Args:
+        - settle_frames (int): カーソル到着後、連続して一致したら確定とするフレーム数
+        """
+        self.settle_frames = settle_frames
+        self.reset()
+
+    def reset(self):
+        """
+        チーム選択画面に入った時などに初期状態へ戻す
+        """
+        self.is_armed = True        # カーソルが離れた後(次の到着で通知する)
+        self.stable_count = 0       # 連続して一致したフレーム数
+
+    def update(self, frame):
+        """
+        Args:
+        - frame (cupy or numpy): 新しいフレーム
+
+        Return:
+        - True or False: このフレームで切り替えが確定したか
+        """
+        if not IconCapture.verify_selected_team(frame):
+            # バトルチームが中央から動いたら次の到着を待つ
+            self.is_armed = True
+            self.stable_count = 0
+            return False
+
+        if not self.is_armed:
+            return False
+
+        self.stable_count += 1
+        if self.stable_count >= self.settle_frames:
+            self.is_armed = False
+            return True
+        return False
+
+
+"""パーティアイコンの表示完了(静止)の検出クラス"""
+class IconStabilityDetector:
+
+    def __init__(self, regions=None, region_size=None, settle_frames=3, motion_threshold=2.0, min_detail=12.0,
+                 timeout=1.0, step=4):
+        """
+        新しいフレームごとに各アイコン領域を間引いて前のフレームとの差を調べ、
+        全てのアイコンが表示されて動かなくなった時に1度だけ通知する(確定しなければタイムアウトで通知)
+
+        Args:
+        - regions (list): アイコン領域の左上 (x, y) (Noneなら相手パーティ)
+        - region_size (int): アイコン領域のサイズ
+        - settle_frames (int): 全ての領域が静止したまま続いたら確定とするフレーム数
+        - motion_threshold (float): 静止とみなす前フレームとの差(画素値の平均絶対差)
+        - min_detail (float): アイコンが表示済みとみなす画素値の標準偏差(空欄の背景と区別する)
+        - timeout (float): 待機開始から確定しなくても通知するまでの秒数
+        - step (int): 領域を間引く間隔(画素)
+        """
+        self.regions = IconCapture.OPPONENT_PARTY_REGIONS if regions is None else regions
+        self.region_size = IconCapture.OPPONENT_PARTY_REGION_SIZE if region_size is None else region_size
+        self.settle_frames = settle_frames
+        self.motion_threshold = motion_threshold
+        self.min_detail = min_detail
+        self.timeout = timeout
+        self.step = step
+
+        self.is_waiting = False
+        self.started_at = None
+        self.wait_time = None       # 直近の待機時間(秒)
+        self.is_timed_out = False   # 直近の通知がタイムアウトによるものか
+        self.timeout_count = 0
+
+    def start(self, now):
+        """
+        待機を開始する(選出画面に入った時)
+
+        Args:
+        - now (float): フレームの時刻
+        """
+        self.is_waiting = True
+        self.started_at = now
+        self.previous = None
+        self.stable_count = 0
+        self.has_moved = np.zeros(len(self.regions), dtype=bool)   # 待機中に動いた(表示された)領域
+
+    def cancel(self):
+        self.is_waiting = False
+
+    def sample(self, frame):
+        """
+        各領域を間引いた画像 (領域数, h, w, 3) (間引いた部分のみCPUへ転送)
+        """
+        size, step = self.region_size, self.step
+        regions = [(x, y, size) for x, y in self.regions]
+        if IconCapture.geometry is not None:
+            regions = [IconCapture.geometry.map_rect(x, y, size, size)[:3] for x, y, size in regions]
+        return np.stack([to_numpy(frame[y:y+size:step, x:x+size:step, :3]) for x, y, size in regions]).astype(np.int16)
+
+    def update(self, frame, now):
+        """
+        Args:
+        - frame (cupy or numpy): 新しいフレーム
+        - now (float): フレームの時刻
+
+        Return:
+        - True or False: このフレームで認識してよいか(全アイコンが静止、またはタイムアウト)
+        """
+        if not self.is_waiting:
+            return False
+
+        current = self.sample(frame)
+        if self.previous is not None and self.previous.shape == current.shape:  # 補正が変わった場合は比較しない
+            is_moving = np.abs(current - self.previous).mean(axis=(1, 2, 3)) > self.motion_threshold
+            self.has_moved |= is_moving
+            # 静止していて、アイコンがある(背景ではない or 一度動いてから止まった)
+            has_icon = (current.std(axis=(1, 2, 3)) >= self.min_detail) | self.has_moved
+            self.stable_count = self.stable_count + 1 if np.all(~is_moving & has_icon) else 0
+        self.previous = current
+
+        self.is_timed_out = self.stable_count < self.settle_frames
+        if self.is_timed_out and now - self.started_at < self.timeout:
+            return False
+        if self.is_timed_out:
+            self.timeout_count += 1
+        self.is_waiting = False
+        self.wait_time = now - self.started_at
+        return True
@@ -0,0 +1,83 @@
+import cv2
+import numpy as np
+from array_backend import to_numpy
+
+
+"""ポケモンアイコン推測クラス (Qtに依存しない)"""
+class IconRecognizer:
+    # 学習モデルのパス
+    MODEL_PATH = "./model/pokemon_icon_recognition_model.h5"
+
+    # 学習モデルの入力画像サイズ
+    INPUT_SIZE = (85, 85)
+
+    # 読み込み済みモデル
+    model = None
+
+    @classmethod
+    def load_model(cls, model_path=None):
+        """
+        ポケモンアイコン推測モデルを読み込む(読み込み済みならそれを返す)
+
+        Args:
+        - model_path (str): モデルのパス(Noneなら既定のパス)
+
+        Return:
+        - model: kerasモデル
+        """
+        if cls.model is None:
+            from keras.models import load_model
+            cls.model = load_model(model_path or cls.MODEL_PATH)
+        return cls.model
+
+    @classmethod
+    def preprocess(cls, images):
+        """
+        切り抜き画像をモデル入力用のバッチに変換する
+
+        Args:
+        - images[] (cupy or numpy): 画像データ配列
+
+        Return:
+        - batch (numpy): (N, 85, 85, 3) の正規化済みfloat32配列
+        """
+        batch = np.empty((len(images), cls.INPUT_SIZE[1], cls.INPUT_SIZE[0], 3), dtype=np.float32)
+        for i, img in enumerate(images):
+            # CupyならNumPy に変換
+            img = to_numpy(img)
+            resize_img = cv2.resize(img, cls.INPUT_SIZE, interpolation=cv2.INTER_LINEAR)
+            np.multiply(resize_img, 1.0 / 255.0, out=batch[i], casting='unsafe')  # 正規化
+        return batch
+
+    @classmethod
+    def predict_probabilities(cls, images):
+        """
+        各画像の全ラベルに対する確率を返す
+
+        Args:
+        - images[] (cupy or numpy): 画像データ配列
+
+        Return:
+        - predictions (numpy): (N, ラベル数) の確率
+        """
+        batch = cls.preprocess(images)
+        return cls.load_model().predict(batch, batch_size=len(batch), verbose=0)
+
+    @classmethod
+    def recognize(cls, images):
+        """
+        画像が何のポケモンアイコンかを一括で推測する
+
+        Args:
+        - images[] (cupy or numpy): 画像データ配列
+
+        Return:
+        - predicted_labels[] (int): 推測される各アイコンの内部画像番号
+        - confidences[] (float): 推測されたラベルの確率
+        """
+        if len(images) == 0:
+            return [], []
+        predictions = cls.predict_probabilities(images)
+        predicted_labels = [int(label) for label in np.argmax(predictions, axis=1)]  # 最も確率が高いラベルを取得
+        confidences = [float(conf) for conf in np.max(predictions, axis=1)]
+        return predicted_labels, confidences
@@ -0,0 +1,280 @@
+import time
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+from array_backend import to_numpy
+from startup_profiler import startup_profiler
+from event_bus import event_bus, CaptureError
+
+
+def _worker_main(shm_name, conn, buffer_shape, model_path):
+    """
+    推論プロセスのメインループ
+    共有メモリ上の切り抜き画像を読み込み、推論結果(ラベルと確率)だけをパイプで返す
+
+    Args:
+    - shm_name (str): 共有メモリ名
+    - conn (Connection): 親プロセスとのパイプ
+    - buffer_shape (tuple): 共有メモリ上の画像バッファの形状 (最大枚数, 縦, 横, 3)
+    - model_path (str): 学習モデルのパス
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buffer = np.ndarray(buffer_shape, dtype=np.uint8, buffer=shm.buf)
+    try:
+        start = time.perf_counter()
+        try:
+            from icon_recognizer import IconRecognizer
+            IconRecognizer.load_model(model_path)
+        except Exception as e:
+            # 親プロセスに原因を伝えて終了する(再起動しても直らない)
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+            return
+        conn.send(('ready', time.perf_counter() - start))
+
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+            job_id, shapes = message
+            try:
+                images = [buffer[i, :h, :w] for i, (h, w) in enumerate(shapes)]
+                labels, confidences = IconRecognizer.recognize(images)
+                conn.send((job_id, labels, confidences))
+            except Exception as e:
+                conn.send((job_id, None, str(e)))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        del buffer
+        shm.close()
+
+
+"""別プロセスでアイコン推論を行うクラス"""
+class InferenceWorker:
+
+    def __init__(self, max_batch=6, max_crop_size=100, model_path=None, timeout=5.0, max_restarts=3, restart_interval=5.0):
+        """
+        Args:
+        - max_batch (int): 1回で送る画像の最大枚数
+        - max_crop_size (int): 切り抜き画像の最大サイズ(キャプチャー位置の補正で拡大された92pxの切り抜きを含む)
+        - model_path (str): 学習モデルのパス(Noneなら既定のパス)
+        - timeout (float): 推論結果の待機時間(秒)
+        - max_restarts (int): プロセスが落ちた時に自動で再起動する最大回数
+        - restart_interval (float): 自動再起動の最短間隔(秒) 再起動するごとに2倍にする
+        """
+        self.buffer_shape = (max_batch, max_crop_size, max_crop_size, 3)
+        self.model_path = model_path
+        self.timeout = timeout
+        self.max_restarts = max_restarts
+        self.restart_interval = restart_interval
+        self.restart_count = 0
+        self.last_restart = None
+        self.load_error = None      # モデルを読み込めなかった時の原因(自動では再起動しない)
+        self.gave_up = False        # 自動再起動を諦めたことを通知済みか
+
+        self.context = mp.get_context("spawn")
+        self.lock = threading.Lock()    # 共有メモリは1ジョブずつ使用
+        self.job_id = 0
+        self.is_ready = False
+        self.started_at = None      # 起動した時刻(startup_profiler)
+
+        self.process = None
+        self.conn = None
+        self.shm = None
+        self.buffer = None
+
+    def start(self):
+        """
+        推論プロセスを起動する(モデルの読み込みは子プロセス側で行う)
+        """
+        with self.lock:
+            self._start()
+
+    def _start(self):
+        self.shm = shared_memory.SharedMemory(create=True, size=int(np.prod(self.buffer_shape)))
+        self.buffer = np.ndarray(self.buffer_shape, dtype=np.uint8, buffer=self.shm.buf)
+        self.conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(
+            target=_worker_main,
+            args=(self.shm.name, child_conn, self.buffer_shape, self.model_path),
+            daemon=True,
+        )
+        self.started_at = startup_profiler.elapsed()
+        self.process.start()
+        child_conn.close()
+        self.is_ready = False
+
+    def stop(self):
+        """
+        推論プロセスを停止し共有メモリを解放する
+        """
+        with self.lock:
+            self._stop()
+
+    def _stop(self):
+        if self.process is not None:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.join(timeout=1.0)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.shm is not None:
+            self.buffer = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+        self.is_ready = False
+
+    def restart(self):
+        """
+        推論プロセスを再起動する(GUIプロセスはそのまま)
+        """
+        with self.lock:
+            self._stop()
+            self.load_error = None
+            self._start()
+
+    def recover(self, error):
+        """
+        推論に失敗した時に呼ぶ。プロセスが落ちていれば間隔を空けて再起動する(回数に上限あり)
+        モデルを読み込めなかった場合は再起動しても直らないため再起動しない
+
+        Args:
+        - error (Exception): 推論の失敗の原因
+
+        Return:
+        - is_restarted (bool): 再起動したか
+        """
+        if self.is_alive():
+            return False
+        with self.lock:
+            if self.load_error is not None or self.restart_count >= self.max_restarts:
+                if not self.gave_up:
+                    self.gave_up = True
+                    event_bus.publish(CaptureError("inference", f"推論プロセスを再起動しません: {self.load_error or error}"))
+                return False
+            now = time.monotonic()
+            if self.last_restart is not None and now - self.last_restart < self.restart_interval * 2 ** (self.restart_count - 1):
+                return False
+            self.restart_count += 1
+            self.last_restart = now
+            self._stop()
+            self._start()
+        event_bus.publish(CaptureError("inference", f"推論プロセスを再起動しました ({self.restart_count}/{self.max_restarts}): {error}"))
+        return True
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def is_exhausted(self):
+        """
+        プロセスが落ちて自動再起動の上限に達したか(モデルを読み込めなかった場合は含まない)
+        """
+        return self.load_error is None and self.restart_count >= self.max_restarts and not self.is_alive()
+
+    def poll_ready(self):
+        """
+        モデルの読み込みが終わったかを待たずに確認する(推論中・起動前はFalse)
+        """
+        if self.is_ready:
+            return True
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            # 読み込みに失敗して終了した場合も、送られてきた原因を受け取る
+            if self.conn is not None and not self.is_ready and self.conn.poll():
+                self._receive_ready()
+            return self.is_ready
+        except RuntimeError:
+            return False    # 通知済み
+        finally:
+            self.lock.release()
+
+    def _receive_ready(self):
+        """
+        子プロセスの準備完了通知を受け取り、モデルの読み込み時間を記録する
+        """
+        try:
+            status, value = self.conn.recv()
+        except EOFError:
+            status, value = None, "推論プロセスがモデルの読み込み中に終了しました"
+        if status != 'ready':
+            if status == 'error':
+                self.load_error = value
+            self._stop()
+            message = "推論モデルを読み込めません: " + value
+            event_bus.publish(CaptureError("inference", message))
+            raise RuntimeError(message)
+        load_seconds = value
+        self.is_ready = True
+        startup_profiler.add_phase("model_load", self.started_at, self.started_at + load_seconds)
+
+    def wait_ready(self, timeout):
+        """
+        モデルの読み込み完了を待つ(ロックは確認の間だけ取るため、待機中も stop()・restart() できる)
+
+        Args:
+        - timeout (float): 最大待ち時間(秒) 0なら待たずに確認だけする
+        """
+        deadline = time.monotonic() + timeout
+        while not self.poll_ready():
+            if not self.is_alive():
+                raise RuntimeError("推論プロセスが起動していません")
+            if time.monotonic() >= deadline:
+                raise TimeoutError("推論プロセスのモデル読み込みが終わっていません")
+            time.sleep(0.05)
+
+    def recognize(self, images, ready_timeout=None):
+        """
+        切り抜き画像を共有メモリに書き込み、別プロセスで推論する
+        画像データはpickleせず、パイプには形状とジョブ番号のみを送る
+
+        Args:
+        - images[] (cupy or numpy): 切り抜かれた画像
+        - ready_timeout (float): モデルの読み込みを待つ最大時間(秒) Noneなら timeout の6倍
+
+        Return:
+        - predicted_labels[] (int): 推測ラベル
+        - confidences[] (float): 推測ラベルの確率
+        """
+        if len(images) > self.buffer_shape[0]:
+            raise ValueError(f"一度に推論できる画像は{self.buffer_shape[0]}枚までです")
+
+        # モデル読み込み完了待ち(ロックの外で待つ)
+        if not self.is_ready:
+            self.wait_ready(self.timeout * 6 if ready_timeout is None else ready_timeout)
+
+        with self.lock:
+            if not self.is_alive() or not self.is_ready:
+                raise RuntimeError("推論プロセスが起動していません")   # 待機中に停止・再起動された
+
+            # 共有メモリへ書き込み
+            shapes = []
+            for i, img in enumerate(images):
+                img = to_numpy(img)
+                h, w = img.shape[:2]
+                self.buffer[i, :h, :w] = img[:, :, :3]
+                shapes.append((h, w))
+
+            self.job_id += 1
+            self.conn.send((self.job_id, shapes))
+
+            # 結果待ち(タイムアウトした古いジョブの結果は読み捨てる)
+            while True:
+                if not self.conn.poll(self.timeout):
+                    raise TimeoutError("推論がタイムアウトしました")
+                job_id, labels, confidences = self.conn.recv()
+                if job_id == self.job_id:
+                    break
+
+        if labels is None:
+            raise RuntimeError("推論プロセスエラー: " + confidences)
+        return labels, confidences
@@ -1,20 +1,33 @@
 import numpy as np
-from pygrabber.dshow_graph import FilterGraph
 
 
 from graphic_widget import MainGraphicWidget
 from PyQt5.QtWidgets import (QMainWindow, QDockWidget, QWidget,
-                              QVBoxLayout, QHBoxLayout, QAction, QLabel, QPushButton, QSizePolicy)
-from PyQt5.QtCore import Qt
+                              QVBoxLayout, QHBoxLayout, QAction, QLabel, QPushButton, QSizePolicy, QMessageBox)
+from PyQt5.QtCore import Qt, QTimer, QObject
 from PyQt5.QtGui import QCursor
 
 from audio_manager import AudioManager
+from icon_capture import IconCapture
+from party_view import PartySurface
+from event_bus import event_bus, CaptureError
+from startup_profiler import startup_profiler
+from match_store import MatchStore
+from pokemon import PokemonDataDisplayWidget, PokemonData
 
 """メインウィンドウ"""
 class MainWindow(QMainWindow):
     
-    def __init__(self):
+    def __init__(self, party_view_mode="docks", overlay_port=None, video_source=0):
+        """
+        Args:
+        - party_view_mode (str): "docks" パーティを左右のドックに表示
+                                 "surface" 両パーティを1枚のWidgetに描画
+        - overlay_port (int): 配信オーバーレイ用サーバーのポート(Noneなら起動しない)
+        - video_source (int or str): キャプチャーデバイス番号、または動画ファイル
+        """
         super().__init__()
+        self.party_view_mode = party_view_mode
 
         """ウィンドウ"""
         self.setWindowTitle("Game Capture Application")
@@ -35,8 +48,15 @@ class MainWindow(QMainWindow):
         """)
 
         """グラフィック"""
-        self.central_widget = MainGraphicWidget(self) # ゲーム映像
-        self.setCentralWidget(self.central_widget)
+        if self.party_view_mode == "surface":
+            self.party_surface = PartySurface(self)
+            self.central_widget = MainGraphicWidget(self, party_surface=self.party_surface, video_source=video_source) # ゲーム映像
+            self.party_surface.set_center_widget(self.central_widget)
+            self.setCentralWidget(self.party_surface)
+        else:
+            self.party_surface = None
+            self.central_widget = MainGraphicWidget(self, video_source=video_source) # ゲーム映像
+            self.setCentralWidget(self.central_widget)
         self.layout = QHBoxLayout(self.central_widget)
         self.central_widget.error_signal.connect(self.show_error)
 
@@ -57,11 +77,43 @@ class MainWindow(QMainWindow):
         self.error_dock = ErrorDock(self)
         self.error_dock.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
         self.addDockWidget(Qt.BottomDockWidgetArea, self.error_dock)
+        # イベントバスの内容をまとめてドックに表示
+        self.event_dock_sink = EventDockSink(self.error_dock, self)
+        event_bus.add_sink(self.event_dock_sink)
+        # 対戦記録(シーン遷移・パーティ・勝敗)の保存
+        self.match_store = MatchStore()
+        event_bus.add_sink(self.match_store)
+        # 配信オーバーレイ用のローカルサーバー(シーン・パーティをWebSocketで送る)
+        self.overlay_server = None
+        if overlay_port is not None:
+            from overlay_server import OverlayServer
+            overlay_server = OverlayServer(port=overlay_port, table=PokemonData.pokemon_table,
+                                           atlas=PokemonData.pixmap_cache.atlas)
+            try:
+                overlay_server.start()
+            except OSError as e:
+                event_bus.publish(CaptureError("overlay", f"オーバーレイサーバーを起動できません (ポート {overlay_port}): {e}"))
+            else:
+                self.overlay_server = overlay_server
+                event_bus.add_sink(self.overlay_server)
         # パーティー表示ドック(グラフィックWidgetの子要素)
         self.my_party_dock = self.central_widget.get_my_party_dock()
         self.opponent_party_dock = self.central_widget.get_opponent_party_dock()
-        self.addDockWidget(Qt.LeftDockWidgetArea, self.my_party_dock)
-        self.addDockWidget(Qt.RightDockWidgetArea, self.opponent_party_dock)
+        if self.party_surface is None:
+            self.addDockWidget(Qt.LeftDockWidgetArea, self.my_party_dock)
+            self.addDockWidget(Qt.RightDockWidgetArea, self.opponent_party_dock)
+            self.my_party_dock.pokemon_clicked.connect(lambda slot: self.show_matchups("my", slot))
+            self.opponent_party_dock.pokemon_clicked.connect(lambda slot: self.show_matchups("opponent", slot))
+        else:
+            self.party_surface.pokemon_clicked.connect(lambda side, slot, _: self.show_matchups(side, slot))
+        # 対面情報表示用ポップアップ
+        self.pokemon_data_display = PokemonDataDisplayWidget(self)
+
+        # ウィンドウサイズ変更中は処理せず、変更が落ち着いてから1回だけ反映する
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(80)
+        self.resize_timer.timeout.connect(self.resize_party_docks)
     
 
     """メニューバー初期化"""
@@ -78,13 +130,32 @@ class MainWindow(QMainWindow):
             self.mic_menu = self.menubar.addMenu('入力音源')
             self.set_audio_menu()
             self.mic_menu.addActions(self.audio_actions)
-            self.audio_capture.start(self.audio_input_index, self.audio_output_index)
+            with startup_profiler.phase("audio_stream"):
+                self.audio_capture.start(self.audio_input_index, self.audio_output_index)
 
             # 音声ボリュームメニュー
             self.audio_volume_menu = self.menubar.addMenu('ボリューム')
             self.set_audio_volume_menu()
             self.audio_volume_menu.addActions(self.volume_actions)
             self.volume_actions[5].trigger()
+            self.audio_volume_menu.addSeparator()
+            self.mute_action = QAction('ミュート', self)
+            self.mute_action.setCheckable(True)
+            self.mute_action.toggled.connect(self.audio_capture.set_mute)
+            self.audio_volume_menu.addAction(self.mute_action)
+
+            # ツールメニュー
+            self.tool_menu = self.menubar.addMenu('ツール')
+            self.harvest_action = QAction('アイコン収集', self)
+            self.harvest_action.setCheckable(True)
+            self.harvest_action.toggled.connect(self.set_harvest)
+            self.tool_menu.addAction(self.harvest_action)
+            self.audio_health_action = QAction('音声ストリーム統計', self)
+            self.audio_health_action.triggered.connect(self.show_audio_health)
+            self.tool_menu.addAction(self.audio_health_action)
+            self.calibration_action = QAction('キャプチャー位置の再補正', self)
+            self.calibration_action.triggered.connect(self.central_widget.recalibrate)
+            self.tool_menu.addAction(self.calibration_action)
         except Exception as e:
             self.show_error(e)
     
@@ -92,7 +163,10 @@ class MainWindow(QMainWindow):
         """
         入力映像デバイス一覧を取得してメニューにセット
         """
-        devices = FilterGraph().get_input_devices()
+        # DirectShowの列挙(comtypes)は読み込みが重いため、使う時に読み込む
+        with startup_profiler.phase("video_devices"):
+            from pygrabber.dshow_graph import FilterGraph
+            devices = FilterGraph().get_input_devices()
         for device_index, device_name in enumerate(devices):
             self.camera_actions.append(QAction(device_name))
             self.camera_actions[-1].triggered.connect(lambda _, idx=device_index: self.central_widget.reload_capture(idx))
@@ -101,7 +175,8 @@ class MainWindow(QMainWindow):
         """
         入力音声デバイス一覧を取得してメニューにセット
         """
-        input_devices, default_input_index, output_devices, default_output_index = self.audio_capture.device_list()
+        with startup_profiler.phase("audio_devices"):
+            input_devices, default_input_index, output_devices, default_output_index = self.audio_capture.device_list()
 
         # 初期設定デバイスの取得
         self.audio_input_index = default_input_index
@@ -135,6 +210,32 @@ class MainWindow(QMainWindow):
         
         self.audio_capture.set_volume(volume)
 
+    def show_audio_health(self):
+        """
+        音声ストリームの計測値を表示する(buffer_size・latencyを決める目安)
+        """
+        QMessageBox.information(self, '音声ストリーム統計', self.audio_capture.stream_health_summary())
+
+    def set_harvest(self, enabled):
+        """
+        学習用アイコン切り抜き画像の収集を切り替える
+        """
+        if enabled:
+            IconCapture.enable_harvester()
+        else:
+            IconCapture.disable_harvester()
+
+    def show_matchups(self, side, slot):
+        """
+        クリックされたポケモンの対面情報を表示(計算済みの表を参照するだけ)
+        """
+        engine = self.central_widget.matchup_engine
+        label = int(engine.parties[side][slot])
+        if label == 0:
+            return
+        self.pokemon_data_display.show_matchups(label, engine.matchups_for(side, slot),
+                                                has_types=engine.has_types, has_stats=engine.has_stats)
+
     # エラー表示
     def show_error(self, error):
         error_message = str(error)
@@ -149,8 +250,14 @@ class MainWindow(QMainWindow):
         ウィンドウサイズ変更時に呼び出す
         """
         super().resizeEvent(event)
+        self.resize_timer.start()   # 連続したリサイズはまとめる
 
-        # 各種画像をウィンドウサイズに合わせて調整
+    def resize_party_docks(self):
+        """
+        各種画像をウィンドウサイズに合わせて調整
+        """
+        if self.party_surface is not None:
+            return  # Surface表示では自身のresizeEventで調整
         height = self.centralWidget().height() - self.error_dock.height() # メインウィジェットの高さ - 下部ドックの高さ
         self.my_party_dock.setFixedWidth(height // 6)
         self.opponent_party_dock.setFixedWidth(height // 6)
@@ -161,7 +268,14 @@ class MainWindow(QMainWindow):
         """ウィンドウ終了時に呼び出す"""
         if self.central_widget:
             self.central_widget.closeEvent(event)
-        self.audio_capture.stop
+        self.audio_capture.stop()
+        IconCapture.disable_harvester()
+        event_bus.remove_sink(self.event_dock_sink)
+        event_bus.remove_sink(self.match_store)
+        self.match_store.close()
+        if self.overlay_server is not None:
+            event_bus.remove_sink(self.overlay_server)
+            self.overlay_server.stop()
         event.accept()
 
 
@@ -187,6 +301,16 @@ class ErrorDock(QDockWidget):
             }
         """)
         
+        # 現在のシーン表示用のラベル
+        self.status_label = QLabel()
+        self.status_label.setStyleSheet("""
+            QLabel {
+                color: #888888;
+                font-size: 12px;
+                padding: 2px;
+            }
+        """)
+
         # エラーメッセージ用のラベル
         self.error_label = QLabel()
         self.error_label.setStyleSheet("""
@@ -202,6 +326,7 @@ class ErrorDock(QDockWidget):
         self.clear_button.clicked.connect(self.clear_error)
         
         # レイアウトにウィジェットを追加
+        layout.addWidget(self.status_label)
         layout.addWidget(self.error_label, stretch=1)  # エラーラベルを伸縮可能に
         layout.addWidget(self.clear_button, alignment=Qt.AlignRight)
         
@@ -216,12 +341,57 @@ class ErrorDock(QDockWidget):
         self.clear_button.show()
         self.show()
         
+    def show_status(self, message):
+        """状態(現在のシーンなど)を表示 変化が無ければ再レイアウトしない"""
+        if self.status_label.text() != message:
+            self.status_label.setText(message)
+
     def clear_error(self):
         """エラーメッセージをクリア"""
         self.error_label.clear()
         self.clear_button.hide()
         #self.hide()
 
+"""イベントバスからErrorDockへ表示するSink"""
+class EventDockSink(QObject):
+
+    def __init__(self, dock, parent=None, interval=200):
+        """
+        Args:
+        - dock (ErrorDock): 表示先
+        - interval (int): 表示の更新間隔(ms) この間のイベントは種類ごとに最新のみ表示
+        """
+        super().__init__(parent)
+        self.dock = dock
+        self.latest = {}    # イベントの種類 -> 最新イベント (どのスレッドからも代入のみ)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start(interval)
+
+    def push(self, event):
+        self.latest[event.kind] = event
+
+    def flush(self):
+        """
+        溜まったイベントをまとめて表示する(GUIスレッド)
+        """
+        if not self.latest:
+            return
+        latest, self.latest = self.latest, {}
+
+        scene = latest.get("scene_changed")
+        if scene is not None:
+            self.dock.show_status("現在のシーン: " + scene.scene)
+        calibrated = latest.get("capture_calibrated")
+        if calibrated is not None:
+            self.dock.show_status(f"キャプチャー位置を補正しました: 拡大率 {calibrated.scale:.4f}, "
+                                  f"ずれ ({calibrated.offset_x:+.1f}, {calibrated.offset_y:+.1f})")
+        error = latest.get("capture_error")
+        if error is not None:
+            self.dock.show_error(error.message)
+
+
 """エラーテキスト削除ボタンクラス"""
 class ClearButton(QPushButton):
     def __init__(self, parent=None):
@@ -0,0 +1,255 @@
+import os
+import queue
+import sqlite3
+import threading
+
+from scene_recognizer import GameScene
+
+
+"""対戦記録の保存クラス(SQLite)"""
+class MatchStore:
+    DB_PATH = "./data/matches.sqlite3"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS matches (
+            id INTEGER PRIMARY KEY,
+            started_at REAL NOT NULL,
+            ended_at REAL,
+            result TEXT                     -- RESULT_WIN / RESULT_LOSE (不明ならNULL)
+        );
+        CREATE TABLE IF NOT EXISTS scene_events (
+            match_id INTEGER REFERENCES matches(id),
+            at REAL NOT NULL,
+            scene TEXT NOT NULL,
+            previous TEXT
+        );
+        CREATE TABLE IF NOT EXISTS party_members (
+            match_id INTEGER NOT NULL REFERENCES matches(id),
+            side TEXT NOT NULL,             -- my / opponent
+            slot INTEGER NOT NULL,
+            label INTEGER NOT NULL,
+            confidence REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_scene_events_match ON scene_events(match_id, at);
+        CREATE INDEX IF NOT EXISTS idx_party_members_match ON party_members(match_id, side, slot);
+        CREATE INDEX IF NOT EXISTS idx_party_members_label ON party_members(side, label);
+        CREATE INDEX IF NOT EXISTS idx_matches_result ON matches(result);
+    """
+
+    # 対戦の開始・終了となるシーン
+    MATCH_START_SCENES = {GameScene.POKEMON_SELECT.value}
+    RESULT_SCENES = {GameScene.RESULT_WIN.value, GameScene.RESULT_LOSE.value}
+    # 結果が出ないまま戻った場合(切断など)に対戦を閉じるシーン
+    MATCH_ABORT_SCENES = {
+        GameScene.TEAM_SELECT.value, GameScene.BATTLE_STADIUM_CASUAL_MATCH.value,
+        GameScene.BATTLE_STADIUM_RANKED_MATCH.value, GameScene.MATCHING_WAIT.value,
+    }
+
+    def __init__(self, path=None, max_queue=4096, batch_size=256, flush_interval=1.0):
+        """
+        EventBusのSinkとして登録して使う
+        push() はキューに追加するだけで、書き込みは専用スレッドがまとめてトランザクションで行う
+
+        Args:
+        - path (str): データベースファイル
+        - max_queue (int): 書き込み待ちの最大数(溢れた分は破棄)
+        - batch_size (int): 1トランザクションでまとめるイベント数の上限
+        - flush_interval (float): 書き込みを待つ最大時間(秒)
+        """
+        self.path = path or self.DB_PATH
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.event_queue = queue.Queue(maxsize=max_queue)
+        self.dropped_count = 0
+        self.written_count = 0
+
+        # 書き込みスレッド側の状態
+        self.current_match = None   # 記録中の対戦ID
+        self.is_match_started = False   # 記録中の対戦がVERSUSを過ぎたか(GUIの is_captured_oppponent_party と同じ区切り)
+        self.my_party = None        # 直近に認識した自分パーティ [(label, confidence)]
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+            # 前回終了時に閉じられなかった対戦を閉じる
+            conn.execute("UPDATE matches SET ended_at = started_at WHERE ended_at IS NULL")
+        conn.close()
+
+        self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer_thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def push(self, event):
+        """
+        EventBusから呼ばれる(ブロックしない)
+        """
+        if event.kind not in ("scene_changed", "party_recognized"):
+            return
+        try:
+            self.event_queue.put_nowait(event)
+        except queue.Full:
+            self.dropped_count += 1
+
+    def close(self):
+        """
+        キューに残ったイベントを書き出してから終了
+        """
+        self.event_queue.put(None)
+        self.writer_thread.join(timeout=5.0)
+
+    def _writer_loop(self):
+        conn = self._connect()
+        is_closing = False
+        while not is_closing:
+            event = self.event_queue.get()
+            if event is None:
+                break
+
+            # 一定数・一定時間までまとめる
+            batch = [event]
+            try:
+                while len(batch) < self.batch_size:
+                    event = self.event_queue.get(timeout=self.flush_interval if len(batch) == 1 else 0.05)
+                    if event is None:
+                        is_closing = True
+                        break
+                    batch.append(event)
+            except queue.Empty:
+                pass
+
+            try:
+                with conn:
+                    for event in batch:
+                        self._apply(conn, event)
+                self.written_count += len(batch)
+            except sqlite3.Error:
+                # 書き込みに失敗したバッチは破棄して続ける
+                self.dropped_count += len(batch)
+                self.current_match = None
+                self.is_match_started = False
+        conn.close()
+
+    def _apply(self, conn, event):
+        """
+        イベントを対戦記録に反映する(書き込みスレッド)
+        """
+        if event.kind == "party_recognized":
+            members = list(zip(event.labels, event.confidences))
+            if all(int(label) == 0 for label, _ in members):
+                return  # 認識に失敗した結果(直近のパーティを残す)
+            if event.side == "my":
+                self.my_party = members
+                if self.current_match is not None:
+                    self._write_party(conn, self.current_match, "my", members)
+            elif self.current_match is not None:
+                self._write_party(conn, self.current_match, "opponent", members)
+            return
+
+        scene = event.scene
+        # 選出画面へは相手の選出待ちや一瞬の暗転からも戻るため、VERSUSを過ぎるまでは同じ対戦とする
+        if scene in self.MATCH_START_SCENES and (self.current_match is None or self.is_match_started):
+            if self.current_match is not None:
+                # 結果が出ないまま次の対戦が始まった
+                self._end_match(conn, event.timestamp, None)
+            self.current_match = conn.execute("INSERT INTO matches (started_at) VALUES (?)", (event.timestamp,)).lastrowid
+            if self.my_party:
+                self._write_party(conn, self.current_match, "my", self.my_party)
+
+        conn.execute("INSERT INTO scene_events (match_id, at, scene, previous) VALUES (?, ?, ?, ?)",
+                     (self.current_match, event.timestamp, scene, event.previous))
+
+        if self.current_match is not None:
+            if scene == GameScene.VERSUS.value:
+                self.is_match_started = True
+            elif scene in self.RESULT_SCENES:
+                self._end_match(conn, event.timestamp, scene)
+            elif scene in self.MATCH_ABORT_SCENES:
+                self._end_match(conn, event.timestamp, None)
+
+    def _write_party(self, conn, match_id, side, members):
+        """
+        パーティを記録する(同じ対戦で認識し直した場合は置き換える)
+        1匹も認識できなかった結果では、記録済みのパーティを消さない
+        """
+        if all(int(label) == 0 for label, _ in members):
+            return
+        conn.execute("DELETE FROM party_members WHERE match_id = ? AND side = ?", (match_id, side))
+        conn.executemany(
+            "INSERT INTO party_members (match_id, side, slot, label, confidence) VALUES (?, ?, ?, ?, ?)",
+            [(match_id, side, slot, int(label), float(confidence))
+             for slot, (label, confidence) in enumerate(members) if int(label) != 0])
+
+    def _end_match(self, conn, ended_at, result):
+        conn.execute("UPDATE matches SET ended_at = ?, result = ? WHERE id = ?", (ended_at, result, self.current_match))
+        self.current_match = None
+        self.is_match_started = False
+
+    """"""
+    def query(self, sql, params=()):
+        """
+        読み出し用(書き込みスレッドとは別の接続で実行する)
+        """
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def recent_matches(self, limit=20):
+        """
+        直近の対戦
+
+        Return:
+        - rows[] (tuple): (id, started_at, ended_at, result)
+        """
+        return self.query("SELECT id, started_at, ended_at, result FROM matches ORDER BY started_at DESC LIMIT ?", (limit,))
+
+    def match_timeline(self, match_id):
+        """
+        対戦中のシーン遷移
+
+        Return:
+        - rows[] (tuple): (at, scene, previous)
+        """
+        return self.query("SELECT at, scene, previous FROM scene_events WHERE match_id = ? ORDER BY at", (match_id,))
+
+    def match_party(self, match_id, side):
+        """
+        対戦時のパーティ
+
+        Return:
+        - rows[] (tuple): (slot, label, confidence)
+        """
+        return self.query("SELECT slot, label, confidence FROM party_members WHERE match_id = ? AND side = ? ORDER BY slot",
+                          (match_id, side))
+
+    def most_seen_opponents(self, limit=10):
+        """
+        相手パーティによく入っているポケモン
+
+        Return:
+        - rows[] (tuple): (label, 対戦数)
+        """
+        return self.query(
+            "SELECT label, COUNT(DISTINCT match_id) AS seen FROM party_members WHERE side = 'opponent' "
+            "GROUP BY label ORDER BY seen DESC, label LIMIT ?", (limit,))
+
+    def win_rate_by_opponent_first_slot(self, min_matches=1):
+        """
+        相手パーティの並びの先頭(選出画面のslot 0)のポケモンごとの勝率(結果が記録された対戦のみ)
+        実際に先発したポケモンではない(先発は記録していない)
+
+        Return:
+        - rows[] (tuple): (label, 対戦数, 勝利数, 勝率)
+        """
+        return self.query(
+            "SELECT p.label, COUNT(*) AS played, SUM(m.result = 'RESULT_WIN') AS wins, "
+            "AVG(m.result = 'RESULT_WIN') AS win_rate "
+            "FROM matches m JOIN party_members p ON p.match_id = m.id AND p.side = 'opponent' AND p.slot = 0 "
+            "WHERE m.result IS NOT NULL GROUP BY p.label HAVING played >= ? ORDER BY played DESC, p.label",
+            (min_matches,))
@@ -0,0 +1,174 @@
+import numpy as np
+
+
+"""タイプ相性表 (攻撃タイプ x 防御タイプ)"""
+TYPES = [
+    "ノーマル", "ほのお", "みず", "でんき", "くさ", "こおり", "かくとう", "どく", "じめん",
+    "ひこう", "エスパー", "むし", "いわ", "ゴースト", "ドラゴン", "あく", "はがね", "フェアリー",
+]
+TYPE_ALIASES = {
+    "normal": "ノーマル", "fire": "ほのお", "water": "みず", "electric": "でんき", "grass": "くさ",
+    "ice": "こおり", "fighting": "かくとう", "poison": "どく", "ground": "じめん", "flying": "ひこう",
+    "psychic": "エスパー", "bug": "むし", "rock": "いわ", "ghost": "ゴースト", "dragon": "ドラゴン",
+    "dark": "あく", "steel": "はがね", "fairy": "フェアリー",
+}
+
+def _build_type_chart():
+    """
+    (19, 19) の倍率表を作る。最後の行・列は「タイプなし」(倍率1.0)
+    """
+    index = {name: i for i, name in enumerate(TYPES)}
+    chart = np.ones((len(TYPES) + 1, len(TYPES) + 1), dtype=np.float32)
+    effectiveness = {
+        "ノーマル": ([], ["いわ", "はがね"], ["ゴースト"]),
+        "ほのお": (["くさ", "こおり", "むし", "はがね"], ["ほのお", "みず", "いわ", "ドラゴン"], []),
+        "みず": (["ほのお", "じめん", "いわ"], ["みず", "くさ", "ドラゴン"], []),
+        "でんき": (["みず", "ひこう"], ["でんき", "くさ", "ドラゴン"], ["じめん"]),
+        "くさ": (["みず", "じめん", "いわ"], ["ほのお", "くさ", "どく", "ひこう", "むし", "ドラゴン", "はがね"], []),
+        "こおり": (["くさ", "じめん", "ひこう", "ドラゴン"], ["ほのお", "みず", "こおり", "はがね"], []),
+        "かくとう": (["ノーマル", "こおり", "いわ", "あく", "はがね"], ["どく", "ひこう", "エスパー", "むし", "フェアリー"], ["ゴースト"]),
+        "どく": (["くさ", "フェアリー"], ["どく", "じめん", "いわ", "ゴースト"], ["はがね"]),
+        "じめん": (["ほのお", "でんき", "どく", "いわ", "はがね"], ["くさ", "むし"], ["ひこう"]),
+        "ひこう": (["くさ", "かくとう", "むし"], ["でんき", "いわ", "はがね"], []),
+        "エスパー": (["かくとう", "どく"], ["エスパー", "はがね"], ["あく"]),
+        "むし": (["くさ", "エスパー", "あく"], ["ほのお", "かくとう", "どく", "ひこう", "ゴースト", "はがね", "フェアリー"], []),
+        "いわ": (["ほのお", "こおり", "ひこう", "むし"], ["かくとう", "じめん", "はがね"], []),
+        "ゴースト": (["エスパー", "ゴースト"], ["あく"], ["ノーマル"]),
+        "ドラゴン": (["ドラゴン"], ["はがね"], ["フェアリー"]),
+        "あく": (["エスパー", "ゴースト"], ["かくとう", "あく", "フェアリー"], []),
+        "はがね": (["こおり", "いわ", "フェアリー"], ["ほのお", "みず", "でんき", "はがね"], []),
+        "フェアリー": (["かくとう", "ドラゴン", "あく"], ["ほのお", "どく", "はがね"], []),
+    }
+    for attack, (double, half, zero) in effectiveness.items():
+        for defense in double:
+            chart[index[attack], index[defense]] = 2.0
+        for defense in half:
+            chart[index[attack], index[defense]] = 0.5
+        for defense in zero:
+            chart[index[attack], index[defense]] = 0.0
+    return chart
+
+TYPE_CHART = _build_type_chart()
+NO_TYPE = len(TYPES)
+
+
+"""パーティ同士の相性計算クラス"""
+class MatchupEngine:
+    # pokemon_data.xlsx に追加されていれば使用する列
+    TYPE_COLUMNS = ["type1", "type2"]
+    STAT_COLUMNS = ["H", "A", "B", "C", "D", "S"]
+    SPEED_INDEX = 5
+
+    def __init__(self, table):
+        """
+        全ポケモンのタイプ・種族値を配列にしておく(起動時に1度だけ)
+
+        Args:
+        - table (PokemonTable): ポケモンの基礎データ
+        """
+        self.table = table
+        label_count = len(table.label_to_row)
+        rows = np.asarray(table.label_to_row)
+        valid = rows >= 0
+
+        # ラベル -> タイプ番号 (なしはNO_TYPE)
+        self.types = np.full((label_count, 2), NO_TYPE, dtype=np.int64)
+        self.has_types = all(column in table.columns for column in self.TYPE_COLUMNS)
+        if self.has_types:
+            type_index = {name: i for i, name in enumerate(TYPES)}
+            for i, column in enumerate(self.TYPE_COLUMNS):
+                values = table.column(column)
+                for label in np.nonzero(valid)[0]:
+                    name = str(values[rows[label]]).strip()
+                    self.types[label, i] = type_index.get(TYPE_ALIASES.get(name.lower(), name), NO_TYPE)
+
+        # ラベル -> 種族値 (なしはNaN)
+        self.stats = np.full((label_count, len(self.STAT_COLUMNS)), np.nan, dtype=np.float32)
+        self.has_stats = all(column in table.columns for column in self.STAT_COLUMNS)
+        if self.has_stats:
+            for i, column in enumerate(self.STAT_COLUMNS):
+                self.stats[valid, i] = np.asarray(table.column(column), dtype=np.float32)[rows[valid]]
+
+        self.parties = {"my": np.zeros(6, dtype=np.int64), "opponent": np.zeros(6, dtype=np.int64)}
+        self._build_tables()
+
+    def set_party(self, side, labels):
+        """
+        パーティが変わった時に6x6の表を作り直す
+
+        Args:
+        - side (str): "my" or "opponent"
+        - labels[] (int): 推測ラベル
+        """
+        party = np.zeros(6, dtype=np.int64)
+        labels = np.asarray(list(labels)[:6], dtype=np.int64)
+        party[:len(labels)] = np.clip(labels, 0, len(self.types) - 1)
+        if np.array_equal(party, self.parties[side]):
+            return
+        self.parties[side] = party
+        self._build_tables()
+
+    def _build_tables(self):
+        """
+        両パーティの相性表をまとめて計算する
+            attack_multiplier[i, j]: i の一致タイプで j を攻撃した時の最大倍率
+            speed_compare[i, j]: i が j より速ければ1, 同速0, 遅ければ-1 (不明はNaN)
+            stat_delta[i, j, k]: i と j の種族値kの差
+        """
+        my_types = self.types[self.parties["my"]]          # (6, 2)
+        opponent_types = self.types[self.parties["opponent"]]
+
+        self.attack_multiplier = {
+            "my": self._attack_matrix(my_types, opponent_types),
+            "opponent": self._attack_matrix(opponent_types, my_types),
+        }
+
+        my_stats = self.stats[self.parties["my"]]          # (6, 6)
+        opponent_stats = self.stats[self.parties["opponent"]]
+        delta = my_stats[:, None, :] - opponent_stats[None, :, :]
+        self.stat_delta = {"my": delta, "opponent": -delta.transpose(1, 0, 2)}
+        speed = np.sign(delta[:, :, self.SPEED_INDEX])
+        self.speed_compare = {"my": speed, "opponent": -speed.T}
+
+    @staticmethod
+    def _attack_matrix(attacker_types, defender_types):
+        """
+        Args:
+        - attacker_types (numpy): (6, 2) 攻撃側のタイプ
+        - defender_types (numpy): (6, 2) 防御側のタイプ
+
+        Return:
+        - (6, 6) 攻撃側の各タイプで攻撃した時の倍率の最大値
+        """
+        # (攻撃側6, 攻撃タイプ2, 防御側6, 防御タイプ2)
+        multipliers = TYPE_CHART[attacker_types[:, :, None, None], defender_types[None, None, :, :]]
+        multipliers = multipliers.prod(axis=3)
+        # タイプなしの攻撃は候補から外す(両方なしなら1.0)
+        no_attack = (attacker_types == NO_TYPE)[:, :, None]
+        multipliers = np.where(no_attack, -np.inf, multipliers).max(axis=1)
+        return np.where(np.isinf(multipliers), 1.0, multipliers)
+
+    def matchups_for(self, side, slot):
+        """
+        クリックされたポケモンの対面情報(計算済みの表から取り出すだけ)
+
+        Args:
+        - side (str): "my" or "opponent"
+        - slot (int): パーティ内の位置(0-5)
+
+        Return:
+        - rows[] (dict): 相手6匹それぞれの label, attack, defense, speed, stat_delta
+        """
+        other = "opponent" if side == "my" else "my"
+        rows = []
+        for j, label in enumerate(self.parties[other]):
+            if label == 0:
+                continue
+            rows.append({
+                'label': int(label),
+                'attack': float(self.attack_multiplier[side][slot, j]),
+                'defense': float(self.attack_multiplier[other][j, slot]),
+                'speed': float(self.speed_compare[side][slot, j]),
+                'stat_delta': self.stat_delta[side][slot, j].tolist(),
+            })
+        return rows
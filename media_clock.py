@@ -0,0 +1,160 @@
+import time
+import threading
+from collections import deque
+
+import numpy as np
+
+from event_bus import event_bus, TimingSample
+
+
+def now():
+    """
+    映像フレーム・音声ブロックに共通で使う時刻(秒, time.monotonic)
+    """
+    return time.monotonic()
+
+
+def audio_block_time(time_info, frames, sample_rate, callback_time):
+    """
+    音声ブロック先頭フレームの取り込み時刻を共通の時刻に変換する(コールバックから呼ぶ)
+    PortAudioのストリーム時刻が得られない場合はブロック長から逆算する
+
+    Args:
+    - time_info: コールバックに渡された時刻情報(inputBufferAdcTime, currentTime)
+    - frames (int): ブロックのフレーム数
+    - sample_rate (int): サンプリングレート
+    - callback_time (float): コールバック開始時の now()
+
+    Return:
+    - block_time (float): ブロック先頭の時刻
+    """
+    current = time_info.currentTime
+    adc = time_info.inputBufferAdcTime
+    if current and adc:
+        return callback_time - (current - adc)
+    return callback_time - frames / sample_rate
+
+
+"""映像と音声のずれの推定クラス"""
+class AVSyncEstimator:
+
+    def __init__(self, pair_window=3.0, smoothing=0.2, history=256):
+        """
+        同じシーンを示す「音声の検出時刻」と「映像のシーン遷移のフレーム時刻」の組からずれを推定する
+        EventBusのSinkとして登録して使う
+
+        Args:
+        - pair_window (float): 組とみなす2つの時刻の最大差(秒)
+        - smoothing (float): ずれの推定値の平滑化係数(指数移動平均)
+        - history (int): 保持するずれの計測値の数
+        """
+        self.pair_window = pair_window
+        self.smoothing = smoothing
+        self.lock = threading.Lock()
+
+        # 組になる相手を待っている時刻 シーン -> 時刻
+        self.pending_audio = {}
+        self.pending_video = {}
+
+        self.skew_estimate = None               # 映像が音声より遅れている秒数(正なら映像が遅い)
+        self.samples = deque(maxlen=history)    # (時刻, ずれ)
+
+    def push(self, event):
+        """
+        EventBusから呼ばれる(どのスレッドからでも可)
+        """
+        if event.kind == "audio_cue" and event.audio_time is not None:
+            self._add(event.scene, audio_time=event.audio_time)
+        elif event.kind == "scene_changed" and event.frame_time is not None:
+            self._add(event.scene, video_time=event.frame_time)
+
+    def _add(self, scene, audio_time=None, video_time=None):
+        with self.lock:
+            if audio_time is not None:
+                video_time = self._take(self.pending_video, scene, audio_time)
+                if video_time is None:
+                    self.pending_audio[scene] = audio_time
+                    return
+            else:
+                audio_time = self._take(self.pending_audio, scene, video_time)
+                if audio_time is None:
+                    self.pending_video[scene] = video_time
+                    return
+            skew = self.add_sample(video_time, audio_time)
+        event_bus.publish(TimingSample("av_skew", skew * 1000))
+
+    def _take(self, pending, scene, at):
+        """
+        相手側の時刻が近ければ取り出す
+        """
+        other = pending.pop(scene, None)
+        if other is None or abs(at - other) > self.pair_window:
+            return None
+        return other
+
+    def add_sample(self, video_time, audio_time):
+        """
+        同じ出来事の映像・音声の時刻からずれを記録する
+
+        Return:
+        - skew (float): 今回のずれ(秒)
+        """
+        skew = video_time - audio_time
+        self.samples.append((max(video_time, audio_time), skew))
+        if self.skew_estimate is None:
+            self.skew_estimate = skew
+        else:
+            self.skew_estimate += self.smoothing * (skew - self.skew_estimate)
+        return skew
+
+    def skew(self):
+        """
+        現在のずれの推定値(秒) 計測値が無ければ0
+        """
+        return 0.0 if self.skew_estimate is None else self.skew_estimate
+
+    def history(self):
+        """
+        ずれの計測値の推移 [(時刻, ずれ)]
+        """
+        return list(self.samples)
+
+    @staticmethod
+    def audio_clock_drift(ring_buffer):
+        """
+        音声のサンプルクロックと共通の時刻とのずれ(ppm)
+        保持しているブロックの時刻とフレーム位置の傾きから求める
+
+        Return:
+        - drift (float): 正なら音声デバイスのクロックが速い(データが足りなければNone)
+        """
+        count = min(ring_buffer.sequence, ring_buffer.max_blocks)
+        if count < 16:
+            return None
+        times = ring_buffer.block_time[:count]
+        starts = ring_buffer.block_start[:count].astype(np.float64)
+        elapsed = times.max() - times.min()
+        if elapsed <= 0:
+            return None
+        slope = np.polyfit(times - times.min(), starts - starts.min(), 1)[0]
+        return (slope / ring_buffer.sample_rate - 1.0) * 1e6
+
+    def audio_span(self, ring_buffer, frame_time, duration, out=None):
+        """
+        映像フレームに対応する音声を読み出す(推定したずれを補正)
+
+        Args:
+        - ring_buffer (AudioRingBuffer): 入力音声
+        - frame_time (float): フレームの時刻
+        - duration (float): 読み出す秒数(フレーム時刻から)
+        - out (numpy): 書き込み先
+
+        Return:
+        - data (numpy): (frames, channels)
+        - info (ReadInfo)  データが無ければ (None, None)
+        """
+        start_frame = ring_buffer.frame_at(frame_time - self.skew())
+        if start_frame is None:
+            return None, None
+        end_frame = min(ring_buffer.write_frame, start_frame + int(round(duration * ring_buffer.sample_rate)))
+        return ring_buffer.read_range(start_frame, end_frame, out=out)
@@ -0,0 +1,426 @@
+"""
+配信オーバーレイ用のローカルサーバー (HTTP + WebSocket, 標準ライブラリのみ)
+
+    GET /                       簡易オーバーレイページ
+    GET /state                  現在のシーンと両パーティ(JSON)
+    GET /icons/pokemon/<label>.png  ポケモンアイコン
+    GET /ws                     WebSocket (最初に snapshot、以降は変化した部分のみ diff を送る)
+
+EventBusのSinkとして登録して使う。クライアントごとに送信キューの上限があり、
+溢れた場合はキューを捨てて snapshot を送り直す(遅いクライアントがアプリを待たせない)
+"""
+import os
+import json
+import base64
+import struct
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+# クライアントから受け取るフレームの最大長(制御フレームはRFC 6455で125バイトまで)
+MAX_CONTROL_PAYLOAD = 125
+# データフレームは使わないので小さく制限する
+MAX_DATA_PAYLOAD = 4096
+
+OVERLAY_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>PokemonAutoCapture overlay</title>
+<style>body{margin:0;background:transparent;color:#fff;font-family:sans-serif}
+.party{display:flex;gap:4px}.party img{width:96px;height:96px}#scene{font-size:14px}</style></head>
+<body><div id="scene"></div><div class="party" id="my"></div><div class="party" id="opponent"></div>
+<script>
+let state = {scene: null, parties: {my: [], opponent: []}};
+function render() {
+  document.getElementById("scene").textContent = state.scene || "";
+  for (const side of ["my", "opponent"]) {
+    document.getElementById(side).innerHTML = state.parties[side]
+      .map(p => p && p.icon ? `<img src="${p.icon}" title="${p.label}">` : "").join("");
+  }
+}
+function connect() {
+  const ws = new WebSocket(`ws://${location.host}/ws`);
+  ws.onmessage = (e) => {
+    const message = JSON.parse(e.data);
+    if (message.type === "snapshot") state = message.state;
+    else {
+      if ("scene" in message.changes) state.scene = message.changes.scene;
+      for (const [side, slots] of Object.entries(message.changes.parties || {}))
+        for (const p of slots) state.parties[side][p.slot] = p;
+    }
+    render();
+  };
+  ws.onclose = () => setTimeout(connect, 1000);
+}
+connect();
+</script></body></html>
+"""
+
+
+"""オーバーレイ用サーバー"""
+class OverlayServer:
+    ICON_DIR = "./img/Pokemon Icons"
+
+    def __init__(self, host="127.0.0.1", port=8765, table=None, atlas=None, client_queue=64, icon_cache_size=128):
+        """
+        Args:
+        - host (str): 待ち受けアドレス(既定はローカルのみ)
+        - port (int): 待ち受けポート
+        - table (PokemonTable): ラベル -> アイコンファイル名
+        - atlas (SpriteAtlas): ファイルが無い場合のアイコン取得元
+        - client_queue (int): クライアントごとの送信待ちの最大数
+        - icon_cache_size (int): PNGを保持するアイコン数
+        """
+        self.host = host
+        self.port = port
+        self.table = table
+        self.atlas = atlas
+        self.client_queue = client_queue
+
+        # 現在の状態(イベントループのスレッドのみが更新する)
+        self.state = {'scene': None, 'parties': {'my': [None] * 6, 'opponent': [None] * 6}}
+
+        self.clients = set()
+        self.icon_cache = OrderedDict()
+        self.icon_cache_size = icon_cache_size
+        self.resync_count = 0   # 送信キューが溢れてsnapshotを送り直した回数
+
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.error = None       # 待ち受けを開始できなかった時の例外
+
+    def start(self):
+        """
+        サーバースレッドを開始(待ち受けを開始するまで待つ)
+
+        Raises:
+        - OSError: 待ち受けを開始できなかった(ポートが使用中など)
+        """
+        if self.thread is not None:
+            return
+        self.ready.clear()
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.ready.wait(timeout=5.0)
+        if self.error is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+            raise self.error
+
+    def stop(self):
+        """
+        サーバーを停止
+        """
+        if self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self._shutdown)
+        self.thread.join(timeout=2.0)
+        self.thread = None
+        self.loop = None
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            self.server = loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+            # ポート0の場合は割り当てられたポートを使う
+            self.port = self.server.sockets[0].getsockname()[1]
+        except OSError as e:
+            # start()で呼び出し元に伝える(ループは動かさない)
+            self.error = e
+            loop.close()
+            self.ready.set()
+            return
+        self.loop = loop
+        self.ready.set()
+        loop.run_forever()
+        loop.close()
+
+    def _shutdown(self):
+        asyncio.ensure_future(self._close())
+
+    async def _close(self):
+        """
+        待ち受けを止め、接続中の処理を終わらせてからループを止める
+        """
+        self.server.close()
+        for client in list(self.clients):
+            client.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=1.0)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self.loop.stop()
+
+    """"""
+    def push(self, event):
+        """
+        EventBusから呼ばれる(どのスレッドからでも可) 状態の更新はイベントループで行う
+        """
+        loop = self.loop
+        if event.kind not in ("scene_changed", "party_recognized") or loop is None or not loop.is_running():
+            return
+        try:
+            loop.call_soon_threadsafe(self._apply_event, event)
+        except RuntimeError:
+            pass    # 停止済み
+
+    def _apply_event(self, event):
+        """
+        状態を更新し、変化した部分だけを全クライアントへ送る
+        """
+        changes = {}
+        if event.kind == "scene_changed":
+            if self.state['scene'] != event.scene:
+                self.state['scene'] = event.scene
+                changes['scene'] = event.scene
+        else:
+            party = self.state['parties'][event.side]
+            labels = list(event.labels)[:6] + [0] * (6 - len(event.labels))
+            confidences = list(event.confidences)[:6] + [0.0] * (6 - len(event.confidences))
+            slots = []
+            for slot, (label, confidence) in enumerate(zip(labels, confidences)):
+                member = self._member(slot, int(label), float(confidence))
+                if party[slot] != member:
+                    party[slot] = member
+                    slots.append(member)
+            if slots:
+                changes['parties'] = {event.side: slots}
+
+        if changes:
+            self._broadcast({'type': 'diff', 'changes': changes})
+
+    def _member(self, slot, label, confidence):
+        if label == 0:
+            return {'slot': slot, 'label': 0, 'confidence': 0.0, 'icon': None}
+        return {'slot': slot, 'label': label, 'confidence': round(confidence, 4), 'icon': f"/icons/pokemon/{label}.png"}
+
+    def snapshot(self):
+        return {'type': 'snapshot', 'state': self.state}
+
+    def _broadcast(self, message):
+        data = json.dumps(message, ensure_ascii=False)
+        for client in list(self.clients):
+            client.send(data, self)
+
+    """"""
+    async def _handle(self, reader, writer):
+        """
+        1接続分の処理 (HTTPリクエストを1つ読み、WebSocketならそのまま送信を続ける)
+        """
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5.0)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError,
+                asyncio.CancelledError):
+            writer.close()
+            return
+
+        lines = request.decode("latin-1").split("\r\n")
+        parts = lines[0].split(" ")
+        headers = {}
+        for line in lines[1:]:
+            key, _, value = line.partition(":")
+            if key:
+                headers[key.strip().lower()] = value.strip()
+        method, path = (parts[0], parts[1].split("?")[0]) if len(parts) >= 2 else ("", "")
+
+        try:
+            if method != "GET":
+                await self._respond(writer, 405, b"method not allowed", "text/plain")
+            elif path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                await self._websocket(reader, writer, headers)
+            elif path == "/":
+                await self._respond(writer, 200, OVERLAY_PAGE.encode("utf-8"), "text/html; charset=utf-8")
+            elif path == "/state":
+                await self._respond(writer, 200, json.dumps(self.state, ensure_ascii=False).encode("utf-8"), "application/json")
+            elif path.startswith("/icons/pokemon/") and path.endswith(".png"):
+                icon = self._icon_png(path[len("/icons/pokemon/"):-len(".png")])
+                if icon is None:
+                    await self._respond(writer, 404, b"not found", "text/plain")
+                else:
+                    await self._respond(writer, 200, icon, "image/png", cache=True)
+            else:
+                await self._respond(writer, 404, b"not found", "text/plain")
+        except (ConnectionError, asyncio.CancelledError):
+            pass    # 切断・サーバー停止
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, body, content_type, cache=False):
+        reason = {200: "OK", 404: "Not Found", 405: "Method Not Allowed"}[status]
+        header = (f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                  f"Access-Control-Allow-Origin: *\r\nCache-Control: {'max-age=86400' if cache else 'no-store'}\r\n"
+                  "Connection: close\r\n\r\n")
+        writer.write(header.encode("latin-1") + body)
+        await writer.drain()
+
+    def _icon_png(self, label_text):
+        """
+        アイコンのPNGを返す(アイコンフォルダ優先、無ければアトラスから)
+        """
+        if not label_text.isdigit():
+            return None
+        label = int(label_text)
+        if label in self.icon_cache:
+            self.icon_cache.move_to_end(label)
+            return self.icon_cache[label]
+
+        png = None
+        if self.table is not None:
+            try:
+                path = os.path.join(self.ICON_DIR, self.table.get(label, 'image'))
+                with open(path, "rb") as f:
+                    png = f.read()
+            except (KeyError, OSError):
+                png = None
+        if png is None and self.atlas is not None:
+            image = self.atlas.get_pokemon(label)
+            if image is not None:
+                import cv2
+                ok, encoded = cv2.imencode(".png", cv2.cvtColor(np.ascontiguousarray(image), cv2.COLOR_RGBA2BGRA))
+                png = encoded.tobytes() if ok else None
+        if png is None:
+            return None
+
+        self.icon_cache[label] = png
+        if len(self.icon_cache) > self.icon_cache_size:
+            self.icon_cache.popitem(last=False)
+        return png
+
+    async def _websocket(self, reader, writer, headers):
+        """
+        WebSocketのハンドシェイク後、送信キューの内容を送り続ける
+        """
+        key = headers.get("sec-websocket-key", "")
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()).decode("ascii")
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+        client = OverlayClient(writer, self.client_queue)
+        client.send(json.dumps(self.snapshot(), ensure_ascii=False), self)
+        self.clients.add(client)
+        receiver = asyncio.ensure_future(self._receive(reader, client))
+        try:
+            await client.send_loop()
+        finally:
+            self.clients.discard(client)
+            receiver.cancel()
+
+    async def _receive(self, reader, client):
+        """
+        クライアントからのフレームを読む(close・pingへの応答のみ)
+        """
+        try:
+            while True:
+                opcode, payload = await read_frame(reader)
+                if opcode == 0x8:
+                    break
+                if opcode == 0x9:
+                    client.send_control(0xA, payload)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        client.close()
+
+
+"""WebSocketクライアント1つ分の送信キュー"""
+class OverlayClient:
+
+    def __init__(self, writer, max_queue):
+        self.writer = writer
+        self.messages = asyncio.Queue(maxsize=max_queue)
+        self.is_closed = False
+
+    def send(self, data, server):
+        """
+        送信キューに追加する(溢れたら捨ててsnapshotを送り直す)
+        """
+        if self.is_closed:
+            return
+        try:
+            self.messages.put_nowait(data)
+        except asyncio.QueueFull:
+            while not self.messages.empty():
+                self.messages.get_nowait()
+            self.messages.put_nowait(json.dumps(server.snapshot(), ensure_ascii=False))
+            server.resync_count += 1
+
+    def send_control(self, opcode, payload):
+        if not self.is_closed:
+            self.writer.write(encode_frame(payload, opcode))
+
+    def close(self):
+        if self.is_closed:
+            return
+        self.is_closed = True
+        # send_loopを終わらせる
+        try:
+            self.messages.put_nowait(None)
+        except asyncio.QueueFull:
+            self.messages.get_nowait()
+            self.messages.put_nowait(None)
+
+    async def send_loop(self):
+        try:
+            while True:
+                data = await self.messages.get()
+                if data is None:
+                    break
+                self.writer.write(encode_frame(data.encode("utf-8")))
+                await self.writer.drain()
+            self.writer.write(encode_frame(b"", 0x8))
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.is_closed = True
+            self.writer.close()
+
+
+def encode_frame(payload, opcode=0x1):
+    """
+    サーバーからクライアントへのフレーム(マスクなし・分割なし)
+    """
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def read_frame(reader):
+    """
+    クライアントからのフレームを1つ読む(マスクを外す)
+    上限を超える長さのフレームは読まずに ConnectionAbortedError を送出する(呼び出し側で切断)
+
+    Return:
+    - opcode (int)
+    - payload (bytes)
+    """
+    first, second = await reader.readexactly(2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+    limit = MAX_CONTROL_PAYLOAD if opcode & 0x8 else MAX_DATA_PAYLOAD
+    if length > limit:
+        raise ConnectionAbortedError(f"frame too large: opcode={opcode:#x} length={length}")
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask is not None and length:
+        key = np.resize(np.frombuffer(mask, dtype=np.uint8), length)
+        payload = (np.frombuffer(payload, dtype=np.uint8) ^ key).tobytes()
+    return opcode, payload
@@ -1,12 +1,15 @@
 import os
 
 from PyQt5.QtWidgets import (QDockWidget, QWidget, QVBoxLayout)
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 
 from pokemon import PokemonData
 
 """手持ちポケモン表示用DockWidgwt"""
 class PartyPokemonsDock(QDockWidget):
+    """ポケモンクリックシグナル (パーティ内の位置)"""
+    pokemon_clicked = pyqtSignal(int)
+
     def __init__(self, align=Qt.LeftDockWidgetArea, parent=None):
         """
         初期化関数
@@ -32,24 +35,26 @@ class PartyPokemonsDock(QDockWidget):
             }
         """)
 
+        self.current_height = None  # 現在のアイコン配置に使われた高さ
+
         """ポケモン6匹分のラベルを初期化"""
         self.pokemons = []
         for i in range(6):
             pokemon = PokemonData(parent=self, widget_height=widget.height(), main_window=parent)
             self.pokemons.append(pokemon)
+            pokemon.pokemon_icon.clicked.connect(lambda slot=i: self.pokemon_clicked.emit(slot))
             layout.addWidget(self.pokemons[i].background_icon, alignment=Qt.AlignHCenter)    
         
         self.setWidget(widget)
         
-    def set_pokemon_icon(self, images):
+    def set_party_labels(self, labels):
         """
-        切り抜かれた画像データを基にアイコンのポケモンを推測。DockWidgetにそのポケモンの画像をセットする。
+        推測済みのラベルをDockWidgetに反映する(GUIスレッドから呼ぶ)
 
-        Arges:
-        - images[] (cupy): アイコン部分の切り抜き画像
+        Args:
+        - labels[] (int): 推測されたラベル
         """
-        icon_labels = PokemonData.recognize_pokemon_icon(images)
-        for label, pokemon in zip(icon_labels, self.pokemons):
+        for label, pokemon in zip(labels, self.pokemons):
             pokemon.set_pokemon(label)
 
 
@@ -60,8 +65,21 @@ class PartyPokemonsDock(QDockWidget):
         Args:
         - height (int): サイズ変更後のwidgetの高さ
         """
+        if height == self.current_height:
+            return
+        self.current_height = height
+
         for pokemon in self.pokemons:
             pokemon.resize_bg_icon(height)
+        # ウィンドウが描画された後に6匹分まとめて重ねる
+        QTimer.singleShot(0, self.update_icon_geometry)
+
+    def update_icon_geometry(self):
+        """
+        ポケモン画像を背景画像の上に配置する
+        """
+        for pokemon in self.pokemons:
+            pokemon.resize_pokemon_icon()
 
     def get_nth_file(self, folder_path, n):
         """
@@ -0,0 +1,148 @@
+from PyQt5.QtWidgets import QWidget, QHBoxLayout
+from PyQt5.QtCore import Qt, QRect, pyqtSignal
+from PyQt5.QtGui import QPainter, QColor, QFont
+
+from pokemon import PokemonData
+
+
+"""両パーティを1枚のWidgetに描画するクラス"""
+class PartySurface(QWidget):
+    """パーティ更新シグナル(推論スレッドからGUIスレッドへ)"""
+    party_changed = pyqtSignal(str, list)
+    """ポケモンクリックシグナル (side, slot, label)"""
+    pokemon_clicked = pyqtSignal(str, int, int)
+
+    MY_PARTY = "my"
+    OPPONENT_PARTY = "opponent"
+
+    def __init__(self, parent=None):
+        """
+        背景・ポケモン画像・バッジを1回のpaintEventで描画する
+        中央にはゲーム映像Widgetを配置する
+        """
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+
+        # 各パーティのラベルとバッジ(持ち物・状態など)
+        self.labels = {self.MY_PARTY: [0] * 6, self.OPPONENT_PARTY: [0] * 6}
+        self.badges = {self.MY_PARTY: [None] * 6, self.OPPONENT_PARTY: [None] * 6}
+        self.slot_size = 0
+
+        self.layout = QHBoxLayout(self)
+        self.layout.setContentsMargins(0, 0, 0, 0)
+        self.layout.setSpacing(0)
+
+        self.party_changed.connect(self.apply_party)
+
+        # PartyPokemonsDockと同じ呼び出し方ができるようにする
+        self.sides = {
+            self.MY_PARTY: PartySurfaceSide(self, self.MY_PARTY),
+            self.OPPONENT_PARTY: PartySurfaceSide(self, self.OPPONENT_PARTY),
+        }
+
+    def side(self, side):
+        return self.sides[side]
+
+    def set_center_widget(self, widget):
+        """
+        中央に表示するWidget(ゲーム映像)
+        """
+        self.layout.addWidget(widget)
+
+    def apply_party(self, side, labels):
+        """
+        1パーティ分のラベルをまとめて反映して1回だけ再描画する
+
+        Args:
+        - side (str): "my" or "opponent"
+        - labels[] (int): 推測ラベル
+        """
+        self.labels[side] = [int(label) for label in labels][:6] + [0] * (6 - len(labels))
+        self.update(self.party_rect(side))
+
+    def set_badge(self, side, slot, text):
+        """
+        アイコン右下に表示するバッジを設定する(Noneで消去)
+        """
+        self.badges[side][slot] = text
+        self.update(self.slot_rect(side, slot))
+
+    def party_rect(self, side):
+        """
+        パーティの描画領域
+        """
+        x = 0 if side == self.MY_PARTY else self.width() - self.slot_size
+        return QRect(x, 0, self.slot_size, self.height())
+
+    def slot_rect(self, side, slot):
+        """
+        1匹分の描画領域
+        """
+        x = 0 if side == self.MY_PARTY else self.width() - self.slot_size
+        return QRect(x, slot * self.slot_size, self.slot_size, self.slot_size)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.slot_size = self.height() // 6
+        PokemonData.pixmap_cache.set_target_size(self.slot_size)
+        # 左右の列をパーティ用に空けて中央に映像を置く
+        self.layout.setContentsMargins(self.slot_size, 0, self.slot_size, 0)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(event.rect(), QColor("#070707"))
+        if self.slot_size <= 0:
+            return
+
+        background = PokemonData.background_pixmap(self.slot_size)
+        font = QFont()
+        font.setPixelSize(max(8, self.slot_size // 6))
+        painter.setFont(font)
+
+        for side in (self.MY_PARTY, self.OPPONENT_PARTY):
+            if not event.rect().intersects(self.party_rect(side)):
+                continue
+            for slot, label in enumerate(self.labels[side]):
+                rect = self.slot_rect(side, slot)
+                painter.drawPixmap(rect.topLeft(), background)
+                if label != 0:
+                    painter.drawPixmap(rect.topLeft(), PokemonData.pixmap_cache.get(label, self.slot_size))
+                badge = self.badges[side][slot]
+                if badge:
+                    painter.setPen(QColor("#ffffff"))
+                    painter.drawText(rect.adjusted(2, 2, -2, -2), Qt.AlignRight | Qt.AlignBottom, badge)
+        painter.end()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton and self.slot_size > 0:
+            for side in (self.MY_PARTY, self.OPPONENT_PARTY):
+                if self.party_rect(side).contains(event.pos()):
+                    slot = min(event.pos().y() // self.slot_size, 5)
+                    label = self.labels[side][slot]
+                    if label != 0:
+                        self.pokemon_clicked.emit(side, slot, label)
+                    return
+        super().mousePressEvent(event)
+
+
+"""PartySurfaceの片側(PartyPokemonsDockと同じインターフェース)"""
+class PartySurfaceSide:
+
+    def __init__(self, surface, side):
+        self.surface = surface
+        self.side = side
+
+    def set_party_labels(self, labels):
+        """
+        推測済みのラベルをSurfaceに反映する(どのスレッドからでも可)
+
+        Args:
+        - labels[] (int): 推測されたラベル
+        """
+        self.surface.party_changed.emit(self.side, list(labels))
+
+    def resize_party_icon(self, height):
+        """
+        Surface側のresizeEventで処理するため何もしない
+        """
+        pass
@@ -0,0 +1,195 @@
+import os
+import json
+import threading
+from collections import OrderedDict, Counter
+
+import numpy as np
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImage, QPixmap, QPainter
+
+
+"""ポケモンアイコンのデコード・縮小済み画像キャッシュ"""
+class PokemonPixmapCache:
+    ICON_DIR = "./img/Pokemon Icons/"
+    # 表示回数の保存先(次回起動時の事前読み込みに使用)
+    USAGE_PATH = "./data/cache/icon_usage.json"
+
+    def __init__(self, table, atlas=None, max_entries=96, prewarm_count=48):
+        """
+        Args:
+        - table (PokemonTable): ラベルから画像ファイル名を引くためのテーブル
+        - atlas (SpriteAtlas): スプライトアトラス(Noneなら個別のPNGから読み込む)
+        - max_entries (int): 保持するPixmapの最大数(LRUで破棄)
+        - prewarm_count (int): 事前読み込みするラベル数
+        """
+        self.table = table
+        self.atlas = atlas
+        self.max_entries = max_entries
+        self.prewarm_count = prewarm_count
+        self.target_size = None
+
+        # (label, size) -> QPixmap  GUIスレッドのみで操作
+        self.pixmaps = OrderedDict()
+        # (label, size) -> QImage  事前読み込みスレッドが作成(QImageはスレッド間で安全)
+        self.prewarmed_images = {}
+        self.lock = threading.Lock()
+
+        # ラベルごとの表示回数
+        self.usage = Counter(self.load_usage())
+
+    def get(self, label, size):
+        """
+        指定サイズに縮小済みのポケモン画像を返す
+
+        Args:
+        - label (int): ポケモン推測ラベル
+        - size (int): 表示サイズ(正方形)
+
+        Return:
+        - pixmap (QPixmap)
+        """
+        self.usage[label] += 1
+        key = (label, size)
+        pixmap = self.pixmaps.get(key)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(key)
+            return pixmap
+
+        with self.lock:
+            image = self.prewarmed_images.pop(key, None)
+        if image is None:
+            image = self.decode(label, size)
+        pixmap = QPixmap.fromImage(image)
+
+        self.pixmaps[key] = pixmap
+        if len(self.pixmaps) > self.max_entries:
+            self.pixmaps.popitem(last=False)
+        return pixmap
+
+    def set_target_size(self, size):
+        """
+        表示サイズが変わったら古いサイズの画像を破棄し、よく使うラベルを新しいサイズで読み込み直す
+
+        Args:
+        - size (int): 新しい表示サイズ
+        """
+        if size == self.target_size or size <= 0:
+            return
+        self.target_size = size
+        for key in [key for key in self.pixmaps if key[1] != size]:
+            del self.pixmaps[key]
+        with self.lock:
+            self.prewarmed_images = {key: image for key, image in self.prewarmed_images.items() if key[1] == size}
+        self.prewarm(size=size)
+
+    def prewarm(self, labels=None, size=None):
+        """
+        バックグラウンドでPNGをデコード・縮小しておく
+
+        Args:
+        - labels[] (int): 読み込むラベル(Noneなら表示回数の多い順)
+        - size (int): 表示サイズ(Noneなら現在のサイズ)
+        """
+        size = size or self.target_size
+        if not size:
+            return
+        if labels is None:
+            labels = [label for label, _ in self.usage.most_common(self.prewarm_count)]
+        threading.Thread(target=self._prewarm, args=(list(labels), size), daemon=True).start()
+
+    def _prewarm(self, labels, size):
+        for label in labels:
+            if size != self.target_size:
+                return  # 途中でサイズが変わったら中断
+            key = (label, size)
+            with self.lock:
+                if key in self.prewarmed_images:
+                    continue
+            try:
+                image = self.decode(label, size)
+            except Exception:
+                continue
+            with self.lock:
+                if size == self.target_size:
+                    self.prewarmed_images[key] = image
+
+    def decode(self, label, size):
+        """
+        アトラス(なければPNG)から読み込んで表示サイズに縮小する
+
+        Return:
+        - image (QImage)
+        """
+        pixels = self.atlas.get_pokemon(label) if self.atlas is not None else None
+        if pixels is not None:
+            pixels = np.ascontiguousarray(pixels)
+            h, w = pixels.shape[:2]
+            # scaledで新しい画像になるのでpixelsの寿命はこの関数内で良い
+            image = QImage(pixels.data, w, h, w * 4, QImage.Format_RGBA8888)
+            return image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+        image = QImage(self.ICON_DIR + self.table.get(label, 'image'))
+        return image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+    def load_usage(self):
+        try:
+            with open(self.USAGE_PATH, encoding="utf-8") as f:
+                return {int(label): count for label, count in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def save_usage(self):
+        """
+        表示回数を保存する(終了時に呼ぶ)
+        """
+        try:
+            os.makedirs(os.path.dirname(self.USAGE_PATH), exist_ok=True)
+            with open(self.USAGE_PATH, "w", encoding="utf-8") as f:
+                json.dump({str(label): count for label, count in self.usage.most_common(self.prewarm_count * 4)}, f)
+        except OSError as e:
+            print(("アイコン使用回数保存エラー: " + str(e),))
+
+
+"""SVG背景画像のサイズ別描画キャッシュ"""
+class SvgPixmapCache:
+
+    def __init__(self, max_entries=8):
+        """
+        Args:
+        - max_entries (int): 保持するサイズの最大数(LRUで破棄)
+        """
+        self.max_entries = max_entries
+        # (id(svg), width, height) -> (svg, QPixmap)  svgも保持してidの再利用を防ぐ
+        self.pixmaps = OrderedDict()
+
+    def render(self, svg, width, height):
+        """
+        SVGを指定サイズのQPixmapに描画する(同じサイズは1度だけ描画)
+
+        Args:
+        - svg (QSvgRenderer): svg画像データ
+        - width (int): 画像の幅
+        - height (int): 画像の高さ
+
+        Return:
+        - pixmap (QPixmap)
+        """
+        key = (id(svg), width, height)
+        entry = self.pixmaps.get(key)
+        if entry is not None:
+            self.pixmaps.move_to_end(key)
+            return entry[1]
+
+        pixmap = QPixmap(width, height)  # 描画先のQPixmapを作成
+        pixmap.fill(Qt.transparent)  # 背景を透明に設定
+
+        # QPainterを使ってQPixmapに描画
+        painter = QPainter(pixmap)
+        svg.render(painter)
+        painter.end()
+
+        self.pixmaps[key] = (svg, pixmap)
+        if len(self.pixmaps) > self.max_entries:
+            self.pixmaps.popitem(last=False)
+        return pixmap
@@ -1,19 +1,20 @@
-import cv2
-import numpy as np
-import cupy as cp
-import pandas as pd
-
-from PyQt5.QtWidgets import QLabel, QWidget
+from PyQt5.QtWidgets import QLabel, QWidget, QVBoxLayout
 from PyQt5.QtCore import Qt, QTimer, pyqtSignal, pyqtSlot
-from PyQt5.QtGui import QPixmap, QPainter
+from PyQt5.QtGui import QPixmap, QPainter, QCursor
 from PyQt5.QtSvg import QSvgRenderer
 
-from keras.models import load_model
-from keras.utils import img_to_array, load_img
+from icon_recognizer import IconRecognizer
+from pokemon_table import PokemonTable
+from sprite_atlas import SpriteAtlas
+from pixmap_cache import PokemonPixmapCache, SvgPixmapCache
+from startup_profiler import startup_profiler
 
 
 """ポケモン画像用クラス"""
 class Pokemon(QLabel):
+    """クリックシグナル"""
+    clicked = pyqtSignal()
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.image_name = ""
@@ -24,13 +25,60 @@ class Pokemon(QLabel):
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
             if self.image_name != "":
-                print(self.image_name + " がクリックされました！")
+                self.clicked.emit()
 
 """"""
 
 """ポケモンのデータ表示用Widgetクラス"""
 class PokemonDataDisplayWidget(QWidget):
-    pass
+    def __init__(self, parent=None):
+        """
+        クリックされたポケモンと相手パーティ6匹との対面情報をポップアップで表示する
+        """
+        super().__init__(parent, Qt.Popup)
+        self.setStyleSheet("""
+            QWidget {
+                background-color: #181818;
+            }
+            QLabel {
+                color: #e0e0e0;
+                font-size: 12px;
+                font-family: monospace;
+                padding: 6px;
+            }
+        """)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.text_label = QLabel()
+        layout.addWidget(self.text_label)
+
+    def show_matchups(self, label, rows, has_types=True, has_stats=True):
+        """
+        Args:
+        - label (int): クリックされたポケモンのラベル
+        - rows[] (dict): MatchupEngine.matchups_for の結果
+        - has_types (bool): タイプ情報があるか
+        - has_stats (bool): 種族値があるか
+        """
+        lines = [f"#{label} の対面"]
+        if not rows:
+            lines.append("相手パーティが認識されていません")
+        for row in rows:
+            line = f"vs #{row['label']:>4}"
+            if has_types:
+                line += f"  与 x{row['attack']:.2g}  被 x{row['defense']:.2g}"
+            if has_stats:
+                speed = {1.0: "速い", 0.0: "同速", -1.0: "遅い"}.get(row['speed'], "?")
+                deltas = " ".join(f"{name}{delta:+.0f}" for name, delta in zip("HABCDS", row['stat_delta']))
+                line += f"  {speed}  {deltas}"
+            lines.append(line)
+        if not (has_types or has_stats):
+            lines.append("(pokemon_data.xlsx にタイプ・種族値の列がありません)")
+
+        self.text_label.setText("\n".join(lines))
+        self.adjustSize()
+        self.move(QCursor.pos())
+        self.show()
 """"""
 
 """ポケモンのデータを管理するツール"""
@@ -54,14 +102,24 @@ class PokemonData():
             print(e.args)
 
     # ポケモンの基礎データの読み込み
+    # (xlsxはキャッシュが古いときのみ読み込む)
     try:
-        pokemon_datas = pd.read_excel("./data/pokemon_data.xlsx", sheet_name=0)
+        with startup_profiler.phase("pokemon_table"):
+            pokemon_table = PokemonTable.load()
     except Exception as e:
             e.args = ("ポケモンデータエクセル読み込みエラー: " + e.args[0],)
             print(e.args)
 
-    # ポケモンアイコン推測モデルのロード
-    pokemon_icon_model = load_model("./model/pokemon_icon_recognition_model.h5")
+    # 縮小済みポケモン画像のキャッシュ
+    # (アトラス未作成ならPNGから読み込む。作成は python sprite_atlas.py)
+    with startup_profiler.phase("sprite_cache"):
+        pixmap_cache = PokemonPixmapCache(pokemon_table, atlas=SpriteAtlas.load())
+    # サイズ別の背景画像キャッシュ(12枠で共有)
+    background_cache = SvgPixmapCache()
+
+    # ポケモンアイコン推測用の別プロセス(Noneならこのプロセス内で推測)
+    # モデルは推論するプロセス側で読み込む
+    inference_worker = None
 
     def __init__(self, parent, widget_height, main_window):
         """
@@ -89,8 +147,9 @@ class PokemonData():
         self.pokemon_icon_num = 0       # ポケモン画像用index
         self.pokemon_name = None        # ポケモンの名前
 
+        self.icon_size = int(widget_height) // 6                        # ポケモン画像の表示サイズ
         self.pokemon_icon = Pokemon(parent)                             # ポケモン画像
-        self.pokemon_icon.setScaledContents(True)                       # 画像をラベルサイズに合わせる
+        self.pokemon_icon.setAlignment(Qt.AlignCenter)                  # 縮小済み画像を中央に表示
         self.pokemon_icon.setAttribute(Qt.WA_TranslucentBackground)     # 背景を透明に
 
 
@@ -106,12 +165,13 @@ class PokemonData():
         - label (int): ポケモン推測ラベル
         """
         if label == 0:
+            self.pokemon_icon_num = 0
             self.pokemon_icon.setPixmap(QPixmap())
             return
         
         self.pokemon_icon_num = label
-        image_path = "./img/Pokemon Icons/" + PokemonData.pokemon_datas.loc[label, 'image']
-        pokemon_pixmap = QPixmap(image_path)
+        image_path = "./img/Pokemon Icons/" + PokemonData.pokemon_table.get(label, 'image')
+        pokemon_pixmap = PokemonData.pixmap_cache.get(label, self.icon_size)  # デコード・縮小済みの画像
         self.pokemon_icon.setPixmap(pokemon_pixmap)
         self.pokemon_icon.setGeometry(self.background_icon.geometry())  # 背景画像上に配置
         self.pokemon_icon.set_image_name(image_path)
@@ -135,23 +195,48 @@ class PokemonData():
         Return:
         - predicted_labels[] (int): 推測される各アイコンの内部画像番号
         """
-        predicted_labels = []
+        predicted_labels, _ = PokemonData.recognize_pokemon_icon_with_confidence(images)
+        return predicted_labels
+
+    @staticmethod
+    def recognize_pokemon_icon_with_confidence(images):
+        """
+        画像が何のポケモンアイコンかを推測し、その確率も返す
+        推論に失敗した場合は例外を送出する(空のパーティで表示・記録を上書きしないように)
+
+        Args:
+        - images[] (cupy): 画像データ配列
+
+        Return:
+        - predicted_labels[] (int): 推測される各アイコンの内部画像番号
+        - confidences[] (float): 推測されたラベルの確率
+        """
+        worker = PokemonData.inference_worker
+        # 推論プロセスが再起動の上限まで落ちた場合は、このプロセスで推論する(モデルを読み込めない場合は除く)
+        if worker is None or worker.is_exhausted():
+            return IconRecognizer.recognize(images)
+
         try:
-            for img in images:
-                # 画像前処理
-                # CupyならNumPy に変換
-                if isinstance(img, cp.ndarray):
-                    img = cp.asnumpy(img)
-                resize_img = cv2.resize(img, (85, 85), interpolation=cv2.INTER_LINEAR)
-                resize_img  = img_to_array(resize_img) / 255.0  # 正規化
-                resize_img  = np.expand_dims(resize_img , axis=0)  # バッチ次元を追加
-                # 学習モデルでアイコン推測
-                predictions = PokemonData.pokemon_icon_model.predict(resize_img, verbose=0)
-                predicted_labels.append( np.argmax(predictions, axis=1)[0] ) # 最も確率が高いラベルを取得
+            # 6匹分をまとめて1回で推論
+            return worker.recognize(images)
         except Exception as e:
-            predicted_labels = [0, 0, 0, 0, 0, 0]
+            # 推論プロセスが落ちていれば間隔を空けて再起動(モデルを読み込めない場合はしない)
+            worker.recover(e)
+            raise
 
-        return predicted_labels
+
+    @classmethod
+    def background_pixmap(cls, size):
+        """
+        指定サイズの背景画像(未選出時)を返す
+
+        Args:
+        - size (int): 画像のサイズ(正方形)
+
+        Return:
+        - pixmap (QPixmap)
+        """
+        return cls.background_cache.render(cls.__off_icon, size, size)
 
 
     """
@@ -186,14 +271,10 @@ class PokemonData():
         Return:
         - pixmap (QPixmap): SVGからPixmapに変換した画像
         """
+        pixmap = QPixmap()
         try:
-            pixmap = QPixmap(width, height)  # 描画先のQPixmapを作成
-            pixmap.fill(Qt.transparent)  # 背景を透明に設定
-
-            # QPainterを使ってQPixmapに描画
-            painter = QPainter(pixmap)
-            svg.render(painter)
-            painter.end()
+            # 同じサイズは全枠で1度だけ描画
+            pixmap = PokemonData.background_cache.render(svg, width, height)
         except Exception as e:
             e.args = ("SVG変換エラー: " + e.args[0],)
 
@@ -202,16 +283,20 @@ class PokemonData():
     def resize_bg_icon(self, widget_height):
         """
         ウィンドウサイズが変化した場合に画像の大きさを調整する
+        (ポケモン画像の位置合わせはPartyPokemonsDockがまとめて行う)
 
         Args:
         - widget_height (int): パーティ表示用DockWidgetの高さ
         """
         try:
             size = widget_height // 6       
+            if size != self.icon_size:
+                self.icon_size = size
+                PokemonData.pixmap_cache.set_target_size(size)
+                if self.pokemon_icon_num != 0:
+                    self.pokemon_icon.setPixmap(PokemonData.pixmap_cache.get(self.pokemon_icon_num, size))
             scaled_pixmap = self.svg_to_pixmap(self.current_background, size, size)
             self.background_icon.setPixmap(scaled_pixmap)
-            # ウィンドウが描画された後に重ねる処理を実行
-            QTimer.singleShot(0, self.resize_pokemon_icon)
         except Exception as e:
             e.args = ("ポケモン背景アイコンサイズ変更エラー: " + e.args[0])
 
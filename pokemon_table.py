@@ -0,0 +1,181 @@
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+
+
+"""pokemon_data.xlsx のコンパイル済みキャッシュ"""
+class PokemonTable:
+    # 元データ
+    SOURCE_PATH = "./data/pokemon_data.xlsx"
+    # キャッシュの保存先(列ごとに.npyで保存しmmapで読み込む)
+    CACHE_DIR = "./data/cache/pokemon_data"
+    # キャッシュ形式が変わったら上げる
+    FORMAT_VERSION = 2
+
+    NAME_COLUMN = "pokemon"     # ポケモン名の列
+
+    def __init__(self, columns, label_to_row, name_to_row):
+        """
+        Args:
+        - columns (dict): 列名 -> numpy配列(mmap)
+        - label_to_row (numpy): ラベル -> 行番号 (存在しないラベルは-1)
+        - name_to_row (dict): ポケモン名 -> 行番号
+        """
+        self.columns = columns
+        self.label_to_row = label_to_row
+        self.name_to_row = name_to_row
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def column(self, name):
+        """
+        列全体を返す
+        """
+        return self.columns[name]
+
+    def row_for_label(self, label):
+        """
+        ラベルの行番号を返す(存在しなければNone)
+        """
+        if 0 <= label < len(self.label_to_row):
+            row = int(self.label_to_row[label])
+            if row >= 0:
+                return row
+        return None
+
+    def row_for_name(self, name):
+        """
+        ポケモン名の行番号を返す(存在しなければNone)
+        """
+        return self.name_to_row.get(name)
+
+    def get(self, label, column):
+        """
+        ラベルに対応する行の値を返す
+
+        Args:
+        - label (int): ポケモン推測ラベル
+        - column (str): 列名
+
+        Return:
+        - value: 値(文字列列はstr、数値列はPythonの数値)
+        """
+        row = self.row_for_label(label)
+        if row is None:
+            raise KeyError(label)
+        return self.columns[column][row].item()
+
+    @classmethod
+    def load(cls, source_path=None, cache_dir=None):
+        """
+        キャッシュを読み込む。元データの内容ハッシュが変わっていればxlsxから作り直す
+
+        Args:
+        - source_path (str): xlsxのパス
+        - cache_dir (str): キャッシュの保存先
+
+        Return:
+        - PokemonTable
+        """
+        source_path = source_path or cls.SOURCE_PATH
+        cache_dir = cache_dir or cls.CACHE_DIR
+        source_hash = cls.file_hash(source_path)
+
+        meta = cls.read_meta(cache_dir)
+        if meta is None or meta.get('source_sha256') != source_hash or meta.get('version') != cls.FORMAT_VERSION:
+            try:
+                cls.build(source_path, cache_dir, source_hash)
+            except OSError:
+                # キャッシュを書き込めない場合はxlsxから直接作る
+                return cls.from_dataframe(cls.read_source(source_path))
+            meta = cls.read_meta(cache_dir)
+
+        columns = {name: np.load(os.path.join(cache_dir, f"{i}.npy"), mmap_mode='r')
+                   for i, name in enumerate(meta['columns'])}
+        label_to_row = np.load(os.path.join(cache_dir, "label_to_row.npy"), mmap_mode='r')
+        return cls(columns, label_to_row, meta['name_to_row'])
+
+    @classmethod
+    def build(cls, source_path, cache_dir, source_hash):
+        """
+        xlsxを読み込んで列ごとのnpyとインデックスを書き出す
+        一時フォルダに書いてから置き換えるので、途中で落ちても壊れたキャッシュは残らない
+        """
+        table = cls.from_dataframe(cls.read_source(source_path))
+
+        tmp_dir = cache_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for i, array in enumerate(table.columns.values()):
+            np.save(os.path.join(tmp_dir, f"{i}.npy"), array)
+        np.save(os.path.join(tmp_dir, "label_to_row.npy"), table.label_to_row)
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                'version': cls.FORMAT_VERSION,
+                'source_sha256': source_hash,
+                'columns': list(table.columns.keys()),
+                'name_to_row': table.name_to_row,
+            }, f, ensure_ascii=False)
+
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.replace(tmp_dir, cache_dir)
+
+    @staticmethod
+    def read_source(source_path):
+        """
+        xlsxの読み込み(遅いのでキャッシュが古いときのみ)
+        """
+        import pandas as pd
+        return pd.read_excel(source_path, sheet_name=0)
+
+    @classmethod
+    def from_dataframe(cls, datas):
+        """
+        DataFrameを列指向の配列とインデックスに変換する
+        """
+        columns = {}
+        for name in datas.columns:
+            series = datas[name]
+            if series.dtype.kind in "biuf" and str(name) != cls.NAME_COLUMN:
+                columns[str(name)] = series.to_numpy()
+            else:
+                # 文字列列は固定長Unicode配列に(mmap可能にするため)
+                # 名前の列は全て空欄でfloat(NaN)として読まれた場合も文字列として扱う
+                columns[str(name)] = np.array(["" if value != value or value is None else str(value) for value in series], dtype=str)
+
+        # ラベル -> 行番号 (従来の .loc[label] と同じく、RangeIndexの行番号をそのままラベルとする)
+        label_to_row = np.arange(len(datas), dtype=np.int32)
+
+        # ポケモン名 -> 行番号 (空欄は除く、同名は最初の行)
+        name_to_row = {}
+        if cls.NAME_COLUMN in columns:
+            for row, name in enumerate(columns[cls.NAME_COLUMN]):
+                if name != name or not name:   # NaN・空欄
+                    continue
+                if name not in name_to_row:
+                    name_to_row[str(name)] = row
+
+        return cls(columns, label_to_row, name_to_row)
+
+    @staticmethod
+    def read_meta(cache_dir):
+        try:
+            with open(os.path.join(cache_dir, "meta.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def file_hash(path):
+        """
+        ファイル内容のSHA-256
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
@@ -81,11 +81,16 @@ class ScenePriority:
         }
 
 """"""
+import time
+
 import cv2
-import cupy as cp
+from array_backend import to_numpy
 import numpy as np
 from dataclasses import dataclass
 
+from event_bus import event_bus, CaptureError
+from startup_profiler import startup_profiler
+
 @dataclass
 class Region:
     """比較する領域を定義するクラス"""
@@ -100,25 +105,51 @@ class SceneRecognizer:
     # 現在のシーン(初期化)
     current_scene = GameScene.OTHER_SCENE
 
+    # 音声による裏付け: シーン -> (確信度, 有効期限)
+    # 音声で検出されたシーンは一定時間しきい値を下げて、映像での判定を早める
+    audio_hints = {}
+    AUDIO_HINT_DURATION = 3.0       # 音声検出後にしきい値を下げておく秒数
+    AUDIO_THRESHOLD_RELIEF = 0.15   # 確信度1.0の時に下げるしきい値
+
     # 参照画像の読み込み (モノクロ)
-    ref_images = {
-            'other_scene': cv2.imread("img/Scene Recognition/00_Other_Scene.jpg", cv2.IMREAD_GRAYSCALE),
-            'battle_stadium_casual': cv2.imread("img/Scene Recognition/01_Battle_Stadium_Scene_Casual.jpg", cv2.IMREAD_GRAYSCALE),
-            'battle_stadium_ranked': cv2.imread("img/Scene Recognition/01_Battle_Stadium_Scene_Ranked.jpg", cv2.IMREAD_GRAYSCALE),
-            'role_single': cv2.imread("img/Scene Recognition/02_Role_Scene_Single.jpg", cv2.IMREAD_GRAYSCALE),
-            'role_double': cv2.imread("img/Scene Recognition/02_Role_Scene_Double.jpg", cv2.IMREAD_GRAYSCALE),
-            'team_select': cv2.imread("img/Scene Recognition/03_Select_Team_Scene.jpg", cv2.IMREAD_GRAYSCALE),
-            'matching_wait': cv2.imread("img/Scene Recognition/04_Matching_Wait_Scene.jpg", cv2.IMREAD_GRAYSCALE),
-            'pokemon_select': cv2.imread("img/Scene Recognition/05_Pokemon_Select_Scene.jpg", cv2.IMREAD_GRAYSCALE),
-            'opponent_select_wait': cv2.imread("img/Scene Recognition/06_Opponent_Select_Wait_Scene.jpg", cv2.IMREAD_GRAYSCALE),
-            'versus': cv2.imread("img/Scene Recognition/07_Versus_Scene.jpg", cv2.IMREAD_GRAYSCALE),
-            'result': cv2.imread("img/Scene Recognition/08_Result_Scene.jpg", cv2.IMREAD_GRAYSCALE),
-            'result_win': cv2.imread("img/Scene Recognition/08_Result_Scene_WIN.jpg", cv2.IMREAD_GRAYSCALE),
-            'result_lose': cv2.imread("img/Scene Recognition/08_Result_Scene_LOSE.jpg", cv2.IMREAD_GRAYSCALE),
-            'reward': cv2.imread("img/Scene Recognition/09_Reward_Scene.jpg", cv2.IMREAD_GRAYSCALE),
-            'ranking': cv2.imread("img/Scene Recognition/10_Ranking_Scene.jpg", cv2.IMREAD_GRAYSCALE),
-        }
+    with startup_profiler.phase("scene_templates"):
+        ref_images = {
+                'other_scene': cv2.imread("img/Scene Recognition/00_Other_Scene.jpg", cv2.IMREAD_GRAYSCALE),
+                'battle_stadium_casual': cv2.imread("img/Scene Recognition/01_Battle_Stadium_Scene_Casual.jpg", cv2.IMREAD_GRAYSCALE),
+                'battle_stadium_ranked': cv2.imread("img/Scene Recognition/01_Battle_Stadium_Scene_Ranked.jpg", cv2.IMREAD_GRAYSCALE),
+                'role_single': cv2.imread("img/Scene Recognition/02_Role_Scene_Single.jpg", cv2.IMREAD_GRAYSCALE),
+                'role_double': cv2.imread("img/Scene Recognition/02_Role_Scene_Double.jpg", cv2.IMREAD_GRAYSCALE),
+                'team_select': cv2.imread("img/Scene Recognition/03_Select_Team_Scene.jpg", cv2.IMREAD_GRAYSCALE),
+                'matching_wait': cv2.imread("img/Scene Recognition/04_Matching_Wait_Scene.jpg", cv2.IMREAD_GRAYSCALE),
+                'pokemon_select': cv2.imread("img/Scene Recognition/05_Pokemon_Select_Scene.jpg", cv2.IMREAD_GRAYSCALE),
+                'opponent_select_wait': cv2.imread("img/Scene Recognition/06_Opponent_Select_Wait_Scene.jpg", cv2.IMREAD_GRAYSCALE),
+                'versus': cv2.imread("img/Scene Recognition/07_Versus_Scene.jpg", cv2.IMREAD_GRAYSCALE),
+                'result': cv2.imread("img/Scene Recognition/08_Result_Scene.jpg", cv2.IMREAD_GRAYSCALE),
+                'result_win': cv2.imread("img/Scene Recognition/08_Result_Scene_WIN.jpg", cv2.IMREAD_GRAYSCALE),
+                'result_lose': cv2.imread("img/Scene Recognition/08_Result_Scene_LOSE.jpg", cv2.IMREAD_GRAYSCALE),
+                'reward': cv2.imread("img/Scene Recognition/09_Reward_Scene.jpg", cv2.IMREAD_GRAYSCALE),
+                'ranking': cv2.imread("img/Scene Recognition/10_Ranking_Scene.jpg", cv2.IMREAD_GRAYSCALE),
+            }
     
+    # シーン -> 参照画像
+    scene_references = {
+        GameScene.OTHER_SCENE: 'other_scene',
+        GameScene.BATTLE_STADIUM_CASUAL_MATCH: 'battle_stadium_casual',
+        GameScene.BATTLE_STADIUM_RANKED_MATCH: 'battle_stadium_ranked',
+        GameScene.ROLE_SINGLE: 'role_single',
+        GameScene.ROLE_DOUBLE: 'role_double',
+        GameScene.TEAM_SELECT: 'team_select',
+        GameScene.MATCHING_WAIT: 'matching_wait',
+        GameScene.POKEMON_SELECT: 'pokemon_select',
+        GameScene.OPPONENT_SELECT_WAIT: 'opponent_select_wait',
+        GameScene.VERSUS: 'versus',
+        # GameScene.RESULT: 'result',
+        GameScene.RESULT_WIN: 'result_win',
+        GameScene.RESULT_LOSE: 'result_lose',
+        GameScene.REWARD: 'reward',
+        GameScene.RANKING: 'ranking',
+    }
+
     # 各画像の比較領域を定義
     regions = {
         'other_scene': (223, 790, 284, 43),
@@ -137,6 +168,12 @@ class SceneRecognizer:
         'reward': (554, 870, 209, 50),
         'ranking': (710, 793, 319, 70),
     }
+
+    # キャプチャー位置の補正を反映した比較領域・参照画像 (set_geometry で更新)
+    active_regions = regions
+    active_ref_images = ref_images
+    # 通知済みのエラー(シーン名 -> メッセージ) 同じエラーは比較できるようになるまで再通知しない
+    reported_errors = {}
       
     @staticmethod
     def calculate_match_score(frame, ref_name):
@@ -151,43 +188,107 @@ class SceneRecognizer:
         np.max() (float): 複数による画像比較による一致度の最大値
         """
         if frame is None:
-            print("映像がありません")
+            SceneRecognizer.report_error(ref_name, "映像がありません")
             return 0.0
         
-        if ref_name not in SceneRecognizer.ref_images:
-            print("指定されたシーン名がありません")
+        if ref_name not in SceneRecognizer.active_ref_images:
+            SceneRecognizer.report_error(ref_name, "指定されたシーン名がありません")
             return 0.0
             
-        x, y, w, h = SceneRecognizer.regions[ref_name]
+        x, y, w, h = SceneRecognizer.active_regions[ref_name]
         
-        # フレームをグレースケールに変換して比較領域を抽出
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-        roi = gray_frame[y:y+h, x:x+w]
+        # 比較領域を抽出してからグレースケールに変換(フレーム全体は変換しない)
+        roi = frame[y:y+h, x:x+w]
 
         if roi is None:
-            print("切り取り領域が0です")
+            SceneRecognizer.report_error(ref_name, "切り取り領域が0です")
             return 0.0
         
         if roi.shape[0] == 0 or roi.shape[1] == 0:
-            print("切り取り領域が0です")
+            SceneRecognizer.report_error(ref_name, "切り取り領域が0です")
             return 0.0
+
+        roi = cv2.cvtColor(roi, cv2.COLOR_RGB2GRAY)
             
-        ref_roi = SceneRecognizer.ref_images[ref_name]
+        ref_roi = SceneRecognizer.active_ref_images[ref_name]
 
         if ref_roi is None:
-            print("切り取り領域がありません")
+            SceneRecognizer.report_error(ref_name, "切り取り領域がありません")
             return 0.0
         
         # サイズ調整が必要な場合
         if roi.shape != ref_roi.shape:
             # ref_roi = cv2.resize(ref_roi, (roi.shape[1], roi.shape[0]))
-            print("比較領域のサイズが一致していません")
+            SceneRecognizer.report_error(ref_name, "比較領域のサイズが一致していません")
             return 0.0
         
         # ヒストグラム比較やテンプレートマッチングで比較
         result = cv2.matchTemplate(roi, ref_roi, cv2.TM_CCOEFF_NORMED)
+        SceneRecognizer.reported_errors.pop(ref_name, None)  # 比較できたら次のエラーは再び通知する
         return np.max(result)
     
+    @staticmethod
+    def report_error(ref_name, message):
+        """
+        比較できなかったことを通知する
+        認識のたびに同じエラーでイベントバスを埋めないように、シーンごとに内容が変わった時だけ発行する
+        """
+        if SceneRecognizer.reported_errors.get(ref_name) == message:
+            return
+        SceneRecognizer.reported_errors[ref_name] = message
+        event_bus.publish(CaptureError("scene_recognizer", f"{message} ({ref_name})"))
+
+    @staticmethod
+    def set_geometry(geometry):
+        """
+        キャプチャー位置の補正を比較領域に反映し、参照画像を同じ大きさに縮小・拡大しておく
+        (認識時は補正済みの小さな領域を切り出すだけ)
+
+        Args:
+            geometry: CaptureGeometry (Noneなら補正なし)
+        """
+        if geometry is None:
+            SceneRecognizer.active_regions = SceneRecognizer.regions
+            SceneRecognizer.active_ref_images = SceneRecognizer.ref_images
+            return
+
+        regions, ref_images = {}, {}
+        for name, (x, y, w, h) in SceneRecognizer.regions.items():
+            regions[name] = mapped = geometry.map_rect(x, y, w, h)
+            ref = SceneRecognizer.ref_images.get(name)
+            if ref is not None and (mapped[2], mapped[3]) != (w, h):
+                ref = cv2.resize(ref, (mapped[2], mapped[3]), interpolation=cv2.INTER_AREA)
+            ref_images[name] = ref
+        SceneRecognizer.active_regions = regions
+        SceneRecognizer.active_ref_images = ref_images
+
+    @staticmethod
+    def add_audio_hint(scene: GameScene, confidence: float, duration: float = None):
+        """
+        音声でシーン遷移が検出されたことを通知する(音声スレッドから呼ばれる)
+
+        Args:
+            scene: 音声から推測されたシーン
+            confidence: 音声の一致度(0.0-1.0)
+            duration: しきい値を下げておく秒数
+        """
+        duration = SceneRecognizer.AUDIO_HINT_DURATION if duration is None else duration
+        SceneRecognizer.audio_hints[scene] = (float(confidence), time.monotonic() + duration)
+
+    @staticmethod
+    def scene_threshold(scene: GameScene, threshold: float, now: float) -> float:
+        """
+        音声の裏付けがあるシーンはしきい値を下げる
+        """
+        hint = SceneRecognizer.audio_hints.get(scene)
+        if hint is None:
+            return threshold
+        confidence, expires_at = hint
+        if now > expires_at:
+            SceneRecognizer.audio_hints.pop(scene, None)
+            return threshold
+        return threshold - SceneRecognizer.AUDIO_THRESHOLD_RELIEF * min(1.0, max(0.0, confidence))
+
     @staticmethod
     def get_current_scene(scores: Dict[GameScene, float], threshold: float = 0.8) -> Tuple[GameScene, float]:
         """
@@ -195,15 +296,16 @@ class SceneRecognizer:
         
         Args:
             scores: 各シーンの一致度を格納した辞書
-            threshold: シーン判定のしきい値
+            threshold: シーン判定のしきい値(音声の裏付けがあるシーンは下げる)
             
         Returns:
             選択されたシーンとそのスコアのタプル
         """
         # しきい値を超えたシーンをフィルタリング
+        now = time.monotonic()
         valid_scenes = {
             scene: score for scene, score in scores.items() 
-            if score > threshold
+            if score > SceneRecognizer.scene_threshold(scene, threshold, now)
         }
         
         if not valid_scenes:
@@ -218,38 +320,30 @@ class SceneRecognizer:
         return selected_scene
     
     @staticmethod
-    def current_scene_recognition(frame):
+    def current_scene_recognition(frame, scenes=None):
         """
         現在のシーンを認識
 
         Args:
         - frame (cupy): キャプチャーした画面
+        - scenes (iterable): 一致度を計算するシーン(Noneなら全て) SceneSchedulerが候補を絞る
+
+        Return:
+        - scene (GameScene): 認識したシーン(SceneRecognizer.current_scene)
         """
         if frame is None:
-            return
+            return SceneRecognizer.current_scene
             
         # 前処理でフレームをNumPy配列に変換
-        if isinstance(frame, cp.ndarray):
-            frame = cp.asnumpy(frame)
+        frame = to_numpy(frame)
             
         # 各シーンとの一致度を計算
+        references = SceneRecognizer.scene_references
         scores = {
-            GameScene.OTHER_SCENE: SceneRecognizer.calculate_match_score(frame, 'other_scene'),
-            GameScene.BATTLE_STADIUM_CASUAL_MATCH: SceneRecognizer.calculate_match_score(frame, 'battle_stadium_casual'),
-            GameScene.BATTLE_STADIUM_RANKED_MATCH: SceneRecognizer.calculate_match_score(frame, 'battle_stadium_ranked'),
-            GameScene.ROLE_SINGLE: SceneRecognizer.calculate_match_score(frame, 'role_single'),
-            GameScene.ROLE_DOUBLE: SceneRecognizer.calculate_match_score(frame, 'role_double'),
-            GameScene.TEAM_SELECT: SceneRecognizer.calculate_match_score(frame, 'team_select'),
-            GameScene.MATCHING_WAIT: SceneRecognizer.calculate_match_score(frame, 'matching_wait'),
-            GameScene.POKEMON_SELECT: SceneRecognizer.calculate_match_score(frame, 'pokemon_select'),
-            GameScene.OPPONENT_SELECT_WAIT: SceneRecognizer.calculate_match_score(frame, 'opponent_select_wait'),
-            GameScene.VERSUS: SceneRecognizer.calculate_match_score(frame, 'versus'),
-            # GameScene.RESULT: SceneRecognizer.calculate_match_score(frame, 'result'),
-            GameScene.RESULT_WIN: SceneRecognizer.calculate_match_score(frame, 'result_win'),
-            GameScene.RESULT_LOSE: SceneRecognizer.calculate_match_score(frame, 'result_lose'),
-            GameScene.REWARD: SceneRecognizer.calculate_match_score(frame, 'reward'),
-            GameScene.RANKING: SceneRecognizer.calculate_match_score(frame, 'ranking'),
+            scene: SceneRecognizer.calculate_match_score(frame, references[scene])
+            for scene in (references if scenes is None else scenes) if scene in references
         }
         
         # 優先度を考慮してシーンを選択
-        SceneRecognizer.current_scene, _ = SceneRecognizer.get_current_scene(scores)
\ No newline at end of file
+        SceneRecognizer.current_scene, _ = SceneRecognizer.get_current_scene(scores)
+        return SceneRecognizer.current_scene
\ No newline at end of file
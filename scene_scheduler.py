@@ -0,0 +1,198 @@
+import time
+
+from scene_recognizer import SceneRecognizer, GameScene
+
+
+"""シーン認識の実行間隔と判定するシーンを決めるクラス"""
+class SceneScheduler:
+    # シーンごとの (間隔の倍率, 判定するシーン)
+    # 判定するのは「今のシーンのまま か」と「次に来うるシーン」だけ
+    # 候補に無いシーンへ遷移した場合(今のシーンが見つからない場合)は同じフレームで全シーンを判定する
+    STADIUM = (GameScene.BATTLE_STADIUM_CASUAL_MATCH, GameScene.BATTLE_STADIUM_RANKED_MATCH)
+    ROLES = (GameScene.ROLE_SINGLE, GameScene.ROLE_DOUBLE)
+    SCENE_PLANS = {
+        GameScene.OTHER_SCENE:          (2.0, (GameScene.OTHER_SCENE,) + STADIUM),
+        GameScene.BATTLE_STADIUM_CASUAL_MATCH: (1.5, STADIUM + ROLES + (GameScene.OTHER_SCENE,)),
+        GameScene.BATTLE_STADIUM_RANKED_MATCH: (1.5, STADIUM + ROLES + (GameScene.OTHER_SCENE,)),
+        GameScene.ROLE_SINGLE:          (1.0, ROLES + STADIUM + (GameScene.TEAM_SELECT,)),
+        GameScene.ROLE_DOUBLE:          (1.0, ROLES + STADIUM + (GameScene.TEAM_SELECT,)),
+        GameScene.TEAM_SELECT:          (0.5, (GameScene.TEAM_SELECT, GameScene.MATCHING_WAIT) + ROLES + STADIUM),
+        GameScene.MATCHING_WAIT:        (1.0, (GameScene.MATCHING_WAIT, GameScene.POKEMON_SELECT, GameScene.TEAM_SELECT) + STADIUM),
+        GameScene.POKEMON_SELECT:       (0.5, (GameScene.POKEMON_SELECT, GameScene.OPPONENT_SELECT_WAIT, GameScene.VERSUS) + STADIUM),
+        GameScene.OPPONENT_SELECT_WAIT: (0.5, (GameScene.OPPONENT_SELECT_WAIT, GameScene.VERSUS, GameScene.POKEMON_SELECT)),
+        GameScene.VERSUS:               (1.0, (GameScene.VERSUS, GameScene.RESULT_WIN, GameScene.RESULT_LOSE)),
+        # 対戦中(VERSUS以降、参照画像に一致しない間) は勝敗画面と切断で戻る画面だけを確認する
+        GameScene.BATTLE:               (1.0, (GameScene.RESULT_WIN, GameScene.RESULT_LOSE) + STADIUM),
+        GameScene.RESULT_WIN:           (1.0, (GameScene.RESULT_WIN, GameScene.RESULT_LOSE, GameScene.REWARD, GameScene.RANKING) + STADIUM),
+        GameScene.RESULT_LOSE:          (1.0, (GameScene.RESULT_LOSE, GameScene.RESULT_WIN, GameScene.REWARD, GameScene.RANKING) + STADIUM),
+        GameScene.REWARD:               (2.0, (GameScene.REWARD, GameScene.RANKING) + STADIUM),
+        GameScene.RANKING:              (2.0, (GameScene.RANKING, GameScene.REWARD) + STADIUM),
+    }
+
+    # 入ってからしばらくは次の遷移が近いため間隔を詰めるシーン -> 秒数
+    BOOST_SCENES = {
+        GameScene.VERSUS: 8.0,              # 対戦開始
+        GameScene.OPPONENT_SELECT_WAIT: 5.0,
+        GameScene.RESULT_WIN: 5.0,
+        GameScene.RESULT_LOSE: 5.0,
+    }
+    BOOST_FACTOR = 0.5
+
+    def __init__(self, base_interval=0.1, cpu_budget=0.15, full_scan_interval=2.0):
+        """
+        シーンごとに認識の間隔と判定する参照画像を変え、CPU時間の予算(トークンバケット)の範囲で実行する
+        予算の補充・間隔の判定には呼び出し側の時刻を使う(GUIはmedia_clock、ヘッドレスはフレーム時刻)
+
+        Args:
+        - base_interval (float): 基準の認識間隔(秒) シーンごとの倍率をかける
+        - cpu_budget (float): 1秒あたりに認識へ使ってよい時間(秒) Noneなら制限しない
+        - full_scan_interval (float): 候補に関わらず全シーンを判定する間隔(秒)
+        """
+        self.base_interval = base_interval
+        self.cpu_budget = cpu_budget
+        self.full_scan_interval = full_scan_interval
+
+        self.current_scene = GameScene.OTHER_SCENE
+        self.last_scene = None          # 直前に一致したOTHER_SCENE以外のシーン(暗転・読み込み中もその次のシーンを判定する)
+        self.in_match = False           # VERSUSから勝敗画面まで
+        self.boost_until = None
+        self.next_time = None
+        self.last_full_scan = None
+
+        # CPU時間の予算(最大1秒分)
+        self.budget = cpu_budget
+        self.last_update = None
+
+        # 計測値
+        self.run_count = 0
+        self.full_scan_count = 0
+        self.skipped_count = 0          # 予算不足で見送った回数
+        self.total_duration = 0.0
+        self.mean_duration = None       # 1回の処理時間(指数移動平均)
+        self.started_at = None
+
+    def plan_scene(self):
+        """
+        判定の方針を決めるシーン(対戦中で参照画像に一致しない間は BATTLE)
+        """
+        if self.in_match and self.current_scene == GameScene.OTHER_SCENE:
+            return GameScene.BATTLE
+        return self.current_scene
+
+    def plan(self):
+        """
+        現在のシーンでの (間隔の倍率, 判定するシーン)
+        参照画像に一致しない間(暗転・読み込み画面)は、直前のシーンの間隔と候補で遷移先を探し続ける
+        """
+        factor, candidates = self.SCENE_PLANS.get(self.plan_scene(), (1.0, None))
+        if self.plan_scene() == GameScene.OTHER_SCENE and self.last_scene is not None:
+            last_factor, last_candidates = self.SCENE_PLANS.get(self.last_scene, (factor, ()))
+            factor = min(factor, last_factor)
+            candidates = candidates + tuple(scene for scene in last_candidates if scene not in candidates)
+        return factor, candidates
+
+    def interval(self, now):
+        """
+        現在のシーンでの認識間隔(秒)
+        """
+        factor, _ = self.plan()
+        if self.boost_until is not None and now < self.boost_until:
+            factor = min(factor, self.BOOST_FACTOR)
+        elif self._has_audio_hint():
+            factor = min(factor, self.BOOST_FACTOR)    # 音声で遷移を検出した直後
+        return self.base_interval * factor
+
+    @staticmethod
+    def _has_audio_hint():
+        now = time.monotonic()  # 音声の裏付けの期限はtime.monotonic
+        return any(expires_at > now for _, expires_at in list(SceneRecognizer.audio_hints.values()))
+
+    def _refill(self, now):
+        if self.cpu_budget is None:
+            return
+        if self.last_update is not None:
+            self.budget = min(self.cpu_budget, self.budget + (now - self.last_update) * self.cpu_budget)
+        self.last_update = now
+
+    def is_due(self, now):
+        """
+        認識を実行する時刻か(予算を使い切っている場合は回復するまで見送る)
+        """
+        if self.next_time is not None and now < self.next_time:
+            return False
+        self._refill(now)
+        if self.cpu_budget is not None and self.budget <= 0:
+            self.skipped_count += 1
+            # 予算が0に戻る時刻まで待つ
+            self.next_time = now + -self.budget / self.cpu_budget
+            return False
+        return True
+
+    def recognize(self, frame, now):
+        """
+        現在のシーンに応じた参照画像だけで認識する(SceneRecognizer.current_scene を更新する)
+
+        Args:
+        - frame (cupy or numpy): キャプチャーした画面
+        - now (float): 現在時刻
+
+        Return:
+        - scene (GameScene): 認識したシーン
+        """
+        start = time.perf_counter()
+        if self.started_at is None:
+            self.started_at = now
+
+        is_full_scan = self.last_full_scan is None or now - self.last_full_scan >= self.full_scan_interval
+        if is_full_scan:
+            scene = self._full_scan(frame, now)
+        else:
+            _, candidates = self.plan()
+            scene = SceneRecognizer.current_scene_recognition(frame, candidates)
+            # 今のシーンが見つからず候補のシーンにも一致しない: 候補外への遷移かもしれない
+            if scene == GameScene.OTHER_SCENE and self.current_scene != GameScene.OTHER_SCENE:
+                scene = self._full_scan(frame, now)
+
+        self._update_scene(scene, now)
+
+        duration = time.perf_counter() - start
+        if self.cpu_budget is not None:
+            self.budget -= duration
+        self.run_count += 1
+        self.total_duration += duration
+        self.mean_duration = duration if self.mean_duration is None else self.mean_duration + 0.1 * (duration - self.mean_duration)
+        self.next_time = now + self.interval(now)
+        return scene
+
+    def _full_scan(self, frame, now):
+        self.last_full_scan = now
+        self.full_scan_count += 1
+        return SceneRecognizer.current_scene_recognition(frame)
+
+    def _update_scene(self, scene, now):
+        if scene == self.current_scene:
+            return
+        if scene == GameScene.VERSUS:
+            self.in_match = True
+        elif scene != GameScene.OTHER_SCENE:
+            self.in_match = False
+        boost = self.BOOST_SCENES.get(scene)
+        self.boost_until = now + boost if boost is not None else None
+        if self.current_scene != GameScene.OTHER_SCENE:
+            self.last_scene = self.current_scene
+        self.current_scene = scene
+
+    def stats(self, now=None):
+        """
+        Return:
+        - stats (dict): 実行回数・全シーン判定の回数・見送った回数・平均処理時間(ms)・CPU使用率
+        """
+        now = time.monotonic() if now is None else now
+        elapsed = now - self.started_at if self.started_at is not None else 0.0
+        return {
+            'runs': self.run_count,
+            'full_scans': self.full_scan_count,
+            'skipped': self.skipped_count,
+            'mean_ms': round((self.mean_duration or 0.0) * 1000, 3),
+            'cpu_ratio': round(self.total_duration / elapsed, 4) if elapsed > 0 else None,
+        }
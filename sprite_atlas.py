@@ -0,0 +1,205 @@
+"""
+ポケモン・もちものアイコンのスプライトアトラス
+
+全アイコンを1枚のRGBA画像(.npy)に詰め、キー -> 矩形 の索引と共に保存する
+読み込みはmmapなので、アイコン1枚の取得はファイルI/Oなしの配列スライスになる
+
+作成:
+    python sprite_atlas.py
+"""
+import os
+import json
+import shutil
+import hashlib
+import argparse
+
+import numpy as np
+
+
+"""スプライトアトラス"""
+class SpriteAtlas:
+    ATLAS_DIR = "./data/cache/sprite_atlas"
+    # (キーの接頭辞, フォルダ)
+    SOURCES = [
+        ("pokemon", "./img/Pokemon Icons"),
+        ("item", "./img/Item Icons"),
+    ]
+    FORMAT_VERSION = 1
+    ATLAS_WIDTH = 4096
+
+    def __init__(self, pixels, rects, label_rects):
+        """
+        Args:
+        - pixels (numpy): (H, W, 4) のRGBAアトラス画像(mmap)
+        - rects (dict): キー("pokemon/xxx.png" など) -> (x, y, w, h)
+        - label_rects (numpy): (ラベル数, 4) ポケモン推測ラベル -> (x, y, w, h)  存在しなければ幅0
+        """
+        self.pixels = pixels
+        self.rects = rects
+        self.label_rects = label_rects
+
+    def get(self, key):
+        """
+        キーのアイコン画像(RGBA)を返す
+
+        Args:
+        - key (str): "pokemon/<ファイル名>" or "item/<ファイル名>"
+
+        Return:
+        - image (numpy): アトラスのスライス(コピーしない)
+        """
+        x, y, w, h = self.rects[key]
+        return self.pixels[y:y + h, x:x + w]
+
+    def get_pokemon(self, label):
+        """
+        ポケモン推測ラベルのアイコン画像(RGBA)を返す(存在しなければNone)
+        """
+        if not 0 <= label < len(self.label_rects):
+            return None
+        x, y, w, h = (int(v) for v in self.label_rects[label])
+        if w == 0:
+            return None
+        return self.pixels[y:y + h, x:x + w]
+
+    @classmethod
+    def load(cls, atlas_dir=None):
+        """
+        作成済みのアトラスを読み込む
+        アイコンフォルダの内容が変わっている・未作成の場合はNone(呼び出し側はPNG読み込みに戻す)
+        """
+        atlas_dir = atlas_dir or cls.ATLAS_DIR
+        try:
+            with open(os.path.join(atlas_dir, "index.json"), encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if index.get('version') != cls.FORMAT_VERSION or index.get('source_hash') != cls.source_hash():
+            return None
+
+        pixels = np.load(os.path.join(atlas_dir, "atlas.npy"), mmap_mode='r')
+        label_rects = np.load(os.path.join(atlas_dir, "label_rects.npy"), mmap_mode='r')
+        rects = {key: tuple(rect) for key, rect in index['rects'].items()}
+        return cls(pixels, rects, label_rects)
+
+    @classmethod
+    def source_files(cls):
+        """
+        [(キー, パス), ...] をキー順で返す
+        """
+        files = []
+        for prefix, folder in cls.SOURCES:
+            for name in sorted(os.listdir(folder)):
+                if name.lower().endswith(".png"):
+                    files.append((f"{prefix}/{name}", os.path.join(folder, name)))
+        return files
+
+    @classmethod
+    def source_hash(cls):
+        """
+        アイコンフォルダの内容(ファイル名・サイズ・更新時刻)のハッシュ
+        """
+        digest = hashlib.sha256()
+        for key, path in cls.source_files():
+            stat = os.stat(path)
+            digest.update(f"{key}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        return digest.hexdigest()
+
+    @classmethod
+    def build(cls, atlas_dir=None, max_sizes=None):
+        """
+        アイコンを読み込んで棚詰め(高さ順に行へ並べる)でアトラスを作る
+
+        Args:
+        - atlas_dir (str): 保存先
+        - max_sizes (dict): 接頭辞 -> アイコンの最大辺(px)  大きいアイコンはこのサイズに縮小
+
+        Return:
+        - SpriteAtlas
+        """
+        import cv2
+        from pokemon_table import PokemonTable
+
+        atlas_dir = atlas_dir or cls.ATLAS_DIR
+        max_sizes = max_sizes or {}
+        source_hash = cls.source_hash()
+
+        # 読み込み・RGBA化・縮小
+        icons = []
+        for key, path in cls.source_files():
+            icon = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+            if icon is None:
+                continue
+            if icon.ndim == 2:
+                icon = cv2.cvtColor(icon, cv2.COLOR_GRAY2BGRA)
+            elif icon.shape[2] == 3:
+                icon = cv2.cvtColor(icon, cv2.COLOR_BGR2BGRA)
+            icon = cv2.cvtColor(icon, cv2.COLOR_BGRA2RGBA)
+            max_size = max_sizes.get(key.split("/", 1)[0])
+            if max_size and max(icon.shape[:2]) > max_size:
+                scale = max_size / max(icon.shape[:2])
+                icon = cv2.resize(icon, (max(1, round(icon.shape[1] * scale)), max(1, round(icon.shape[0] * scale))),
+                                  interpolation=cv2.INTER_AREA)
+            icons.append((key, icon))
+
+        # 棚詰め
+        rects = {}
+        x = y = shelf_height = 0
+        for key, icon in sorted(icons, key=lambda item: -item[1].shape[0]):
+            h, w = icon.shape[:2]
+            if x + w > cls.ATLAS_WIDTH:
+                x, y, shelf_height = 0, y + shelf_height, 0
+            rects[key] = (x, y, w, h)
+            x += w
+            shelf_height = max(shelf_height, h)
+        atlas_height = y + shelf_height
+
+        tmp_dir = atlas_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        # 作成中もメモリに載せきらないようにmmapへ直接書き込む
+        pixels = np.lib.format.open_memmap(os.path.join(tmp_dir, "atlas.npy"), mode="w+",
+                                           dtype=np.uint8, shape=(atlas_height, cls.ATLAS_WIDTH, 4))
+        for key, icon in icons:
+            x, y, w, h = rects[key]
+            pixels[y:y + h, x:x + w] = icon
+        pixels.flush()
+        del pixels
+
+        # ポケモン推測ラベル -> 矩形
+        table = PokemonTable.load()
+        images = table.column('image')
+        label_rects = np.zeros((len(table.label_to_row), 4), dtype=np.int32)
+        for label, row in enumerate(table.label_to_row):
+            rect = rects.get(f"pokemon/{images[row]}") if row >= 0 else None
+            if rect is not None:
+                label_rects[label] = rect
+        np.save(os.path.join(tmp_dir, "label_rects.npy"), label_rects)
+
+        with open(os.path.join(tmp_dir, "index.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                'version': cls.FORMAT_VERSION,
+                'source_hash': source_hash,
+                'width': cls.ATLAS_WIDTH,
+                'height': atlas_height,
+                'rects': rects,
+            }, f, ensure_ascii=False)
+
+        shutil.rmtree(atlas_dir, ignore_errors=True)
+        os.replace(tmp_dir, atlas_dir)
+        return cls.load(atlas_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="スプライトアトラスの作成")
+    parser.add_argument("--pokemon-size", type=int, default=128, help="ポケモンアイコンの最大辺(0で縮小しない)")
+    parser.add_argument("--item-size", type=int, default=80, help="もちものアイコンの最大辺(0で縮小しない)")
+    args = parser.parse_args()
+
+    atlas = SpriteAtlas.build(max_sizes={'pokemon': args.pokemon_size, 'item': args.item_size})
+    print(f"{len(atlas.rects)} icons -> {SpriteAtlas.ATLAS_DIR} ({atlas.pixels.shape[1]}x{atlas.pixels.shape[0]})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+"""起動時間の計測クラス"""
+class StartupProfiler:
+    REPORT_PATH = "./data/cache/startup_timeline.json"
+    # 最初のフレームの時点で読み込まれているかを記録する重いモジュール
+    HEAVY_MODULES = ("cupy", "keras", "tensorflow", "pandas", "OpenGL", "pygrabber")
+
+    def __init__(self):
+        """
+        起動から最初のフレーム表示までの各段階(インポート・参照画像・データ・モデル・デバイス一覧)の時間を記録する
+        時刻はこのモジュールを読み込んだ時点(app.pyの最初)からの秒数
+        段階は入れ子になってもよい(imports の中で templates を読み込むなど)
+        """
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+        self.phases = []            # (名前, 開始, 終了)
+        self.marks = {}             # 名前 -> 時刻
+        self.report_path = None     # 最初のフレームで書き出す先(Noneなら書き出さない)
+        self.on_first_frame = None  # 最初のフレームで呼ぶ関数
+
+    def elapsed(self):
+        return time.perf_counter() - self.origin
+
+    @contextmanager
+    def phase(self, name):
+        """
+        with startup_profiler.phase("templates"): の形で段階の時間を記録する
+        """
+        start = self.elapsed()
+        try:
+            yield
+        finally:
+            self.add_phase(name, start, self.elapsed())
+
+    def add_phase(self, name, start, end):
+        """
+        計測済みの段階を記録する(別プロセス・別スレッドで計測した時間など)
+        """
+        with self.lock:
+            self.phases.append((name, start, end))
+            is_late = 'first_frame' in self.marks
+        # 最初のフレームより後に終わった段階(モデル読み込みなど)は書き出し直す
+        if is_late and self.report_path:
+            self.dump(self.report_path)
+
+    def mark(self, name):
+        """
+        一度だけの時点を記録する(2回目以降は無視)
+
+        Return:
+        - is_first (bool): 今回記録したか
+        """
+        with self.lock:
+            if name in self.marks:
+                return False
+            self.marks[name] = self.elapsed()
+        return True
+
+    def first_frame(self):
+        """
+        最初のフレームを表示(処理)した時に呼ぶ 2回目以降は何もしない
+        """
+        if not self.mark('first_frame'):
+            return
+        from event_bus import event_bus, TimingSample
+        event_bus.publish(TimingSample("startup_first_frame", self.marks['first_frame'] * 1000))
+        if self.report_path:
+            self.dump(self.report_path)
+        if self.on_first_frame is not None:
+            self.on_first_frame()
+
+    def report(self):
+        """
+        Return:
+        - report (dict): {'first_frame_ms', 'marks': {名前: ms}, 'phases': [{name, start_ms, duration_ms}],
+                          'heavy_modules': 読み込み済みの重いモジュール}
+        """
+        with self.lock:
+            phases = sorted(self.phases, key=lambda phase: phase[1])
+            marks = dict(self.marks)
+        first_frame = marks.get('first_frame')
+        return {
+            'first_frame_ms': None if first_frame is None else round(first_frame * 1000, 1),
+            'marks': {name: round(at * 1000, 1) for name, at in marks.items()},
+            'phases': [{'name': name, 'start_ms': round(start * 1000, 1), 'duration_ms': round((end - start) * 1000, 1)}
+                       for name, start, end in phases],
+            'heavy_modules': [name for name in self.HEAVY_MODULES if name in sys.modules],
+        }
+
+    def summary(self):
+        """
+        表示用の文字列
+        """
+        report = self.report()
+        lines = [f"{phase['start_ms']:8.1f} ms  {phase['name']:<20} {phase['duration_ms']:8.1f} ms" for phase in report['phases']]
+        lines += [f"{at:8.1f} ms  {name}" for name, at in report['marks'].items()]
+        return "\n".join(lines)
+
+    def dump(self, path=None):
+        """
+        計測結果をJSONで書き出す
+        """
+        path = path or self.REPORT_PATH
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+
+startup_profiler = StartupProfiler()